@@ -0,0 +1,234 @@
+"""Materialized project budget and progress analytics.
+
+``project_stats`` holds one row per (category, status, deadline) bucket
+with the number of projects in it and their budget and progress sums. It
+is kept exact from the session: every flush that inserts, updates or
+deletes projects subtracts the old rows' contributions and adds the new
+ones (``projects = projects + :n`` upserts) in the same transaction, so no
+request ever aggregates the project table itself.
+
+Only open projects (progress below 100%) keep their ``end_date`` as the
+bucket deadline, as only they can be overdue; finished projects and those
+without an end date share the ``NO_DEADLINE`` bucket. That keeps the table
+small while "overdue as of today" remains a sum over buckets.
+
+Core writes bypass the session (``flask import``): their bulk change event
+rebuilds the table with one ``GROUP BY`` in the job queue, as does
+``flask analytics-rebuild``. :meth:`ProjectAnalytics.summary` is cached per
+worker until the next project change or the next day.
+"""
+import threading
+from datetime import date
+
+from sqlalchemy import (Column, Date, Float, Integer, MetaData, String, Table, and_, case, delete, event, func,
+                        insert, literal, select)
+
+from events import ChangeEvent
+
+metadata = MetaData()
+
+project_stats = Table(
+    'project_stats', metadata,
+    Column('category', String(100), primary_key=True),
+    Column('status', String(50), primary_key=True),
+    Column('deadline', Date, primary_key=True),
+    Column('projects', Integer, nullable=False),
+    Column('budgeted', Integer, nullable=False),  # projects with a budget
+    Column('budget', Float, nullable=False),
+    Column('progress', Float, nullable=False),
+    Column('weighted_progress', Float, nullable=False),  # sum of budget * progress
+    Column('open', Integer, nullable=False),
+)
+
+# Bucket deadline of finished projects and of projects without an end date
+NO_DEADLINE = date(9999, 12, 31)
+SUMS = ('projects', 'budgeted', 'budget', 'progress', 'weighted_progress', 'open')
+
+
+def contribution(category, status, end_date, budget, progress):
+    """Returns the bucket key of one project and what it adds to each of ``SUMS``."""
+    progress = progress or 0
+    is_open = progress < 100
+    key = (category or '', status or '', end_date if is_open and end_date is not None else NO_DEADLINE)
+    has_budget = budget is not None
+    return key, (1, int(has_budget), budget or 0.0, progress, (budget or 0.0) * progress, int(is_open))
+
+
+def _metrics(sums, overdue, overdue_budget):
+    projects, budgeted, budget, progress, weighted, open_ = sums
+    return {
+        'projects': projects,
+        'budget': round(budget, 2),
+        'average_budget': round(budget / budgeted, 2) if budgeted else None,
+        'average_progress': round(progress / projects, 1) if projects else None,
+        # Progress of the whole portfolio: big projects count for more than small ones
+        'weighted_progress': round(weighted / budget, 1) if budget else None,
+        'open': open_,
+        'overdue': overdue,
+        'overdue_budget': round(overdue_budget, 2),
+    }
+
+
+class _Totals:
+    __slots__ = ('sums', 'overdue', 'overdue_budget')
+
+    def __init__(self):
+        self.sums = [0] * len(SUMS)
+        self.overdue = 0
+        self.overdue_budget = 0.0
+
+    def add(self, row, today):
+        for i, name in enumerate(SUMS):
+            self.sums[i] += row._mapping[name]
+        if row.deadline < today:
+            self.overdue += row.projects
+            self.overdue_budget += row.budget
+
+    def metrics(self):
+        return _metrics(self.sums, self.overdue, self.overdue_budget)
+
+
+class ProjectAnalytics:
+    """Maintains ``project_stats`` for a project model and summarizes it (Flask extension)."""
+
+    def __init__(self, app=None, db=None, change_bus=None, model=None):
+        self.app = None
+        self.db = None
+        self.model = None
+        self.change_bus = None
+        # Called instead of rebuilding in the writer's thread after a bulk write
+        self.defer_rebuild = None
+        self._cached = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db, change_bus, model)
+
+    def init_app(self, app, db, change_bus, model):
+        self.app = app
+        self.db = db
+        self.model = model
+        self.change_bus = change_bus
+        event.listen(db.session, 'before_flush', self._before_flush)
+        event.listen(db.session, 'after_flush', self._after_flush)
+        change_bus.subscribe(self._on_change, models=(model.__tablename__, project_stats.name))
+        app.extensions['project_analytics'] = self
+
+    # --- Incremental maintenance ---
+    def _columns(self):
+        model = self.model
+        return (model.id, model.category, model.status, model.end_date, model.budget, model.progress_percentage)
+
+    def _rows(self, session, ids):
+        if not ids:
+            return []
+        return session.execute(select(*self._columns()).where(self.model.id.in_(ids))).all()
+
+    def _touched(self, objects, session=None):
+        return [obj.id for obj in objects if isinstance(obj, self.model) and obj.id is not None
+                and (session is None or session.is_modified(obj, include_collections=False))]
+
+    def _before_flush(self, session, flush_context, instances):
+        updated = self._touched(session.dirty, session)
+        deleted = self._touched(session.deleted)
+        inserted = [obj for obj in session.new if isinstance(obj, self.model)]
+        if not (updated or deleted or inserted):
+            return
+        # The rows as the database has them, before this flush overwrites them
+        with session.no_autoflush:
+            old_rows = self._rows(session, updated + deleted)
+        session.info['project_stats'] = (old_rows, updated, inserted)
+
+    def _after_flush(self, session, flush_context):
+        pending = session.info.pop('project_stats', None)
+        if pending is None:
+            return
+        old_rows, updated, inserted = pending
+        new_rows = self._rows(session, updated + [obj.id for obj in inserted])
+        deltas = {}
+        for rows, sign in ((old_rows, -1), (new_rows, 1)):
+            for row in rows:
+                key, values = contribution(*row[1:])
+                total = deltas.setdefault(key, [0] * len(SUMS))
+                for i, value in enumerate(values):
+                    total[i] += sign * value
+        self.apply(session.connection(), deltas)
+
+    def apply(self, conn, deltas):
+        """Adds ``{(category, status, deadline): [sums...]}`` to the bucket rows."""
+        params = [dict(zip(('category', 'status', 'deadline'), key), **dict(zip(SUMS, values)))
+                  for key, values in deltas.items() if any(values)]
+        if not params:
+            return
+        if conn.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        statement = upsert(project_stats)
+        conn.execute(statement.on_conflict_do_update(
+            index_elements=['category', 'status', 'deadline'],
+            set_={name: project_stats.c[name] + statement.excluded[name] for name in SUMS}), params)
+        conn.execute(delete(project_stats).where(project_stats.c.projects <= 0))
+
+    # --- Full rebuild ---
+    def rebuild(self):
+        """Recomputes every bucket from the project table in one transaction."""
+        model = self.model
+        progress = func.coalesce(model.progress_percentage, 0)
+        is_open = progress < 100
+        deadline = case((and_(is_open, model.end_date.isnot(None)), model.end_date),
+                        else_=literal(NO_DEADLINE, Date))
+        category, status = func.coalesce(model.category, ''), func.coalesce(model.status, '')
+        query = (select(category, status, deadline, func.count(), func.count(model.budget),
+                        func.coalesce(func.sum(model.budget), 0.0), func.coalesce(func.sum(progress), 0),
+                        func.coalesce(func.sum(model.budget * progress), 0.0),
+                        func.sum(case((is_open, 1), else_=0)))
+                 .group_by(category, status, deadline))
+        with self.db.engine.begin() as conn:
+            conn.execute(delete(project_stats))
+            conn.execute(insert(project_stats).from_select(['category', 'status', 'deadline', *SUMS], query))
+        self._cached = None
+        # Other workers drop their cached summaries; cached responses expire
+        self.change_bus.publish([ChangeEvent(project_stats.name, None, 'bulk')])
+
+    def _on_change(self, change):
+        self._cached = None
+        if change.model != self.model.__tablename__ or change.op != 'bulk' or not self.change_bus.is_local(change):
+            return
+        # Core bulk writes skip the session hooks: recompute once, by the worker that wrote
+        if self.defer_rebuild is not None:
+            self.defer_rebuild()
+        else:
+            with self.app.app_context():
+                self.rebuild()
+
+    # --- Reading ---
+    def summary(self):
+        """Totals, per-category and per-status breakdowns as a JSON-ready dict."""
+        today = date.today()
+        cached = self._cached
+        if cached is not None and cached[0] == today:
+            return cached[1]
+        with self._lock:
+            cached = self._cached
+            if cached is not None and cached[0] == today:
+                return cached[1]
+            with self.db.engine.connect() as conn:
+                rows = conn.execute(select(project_stats)).all()
+            totals, by_category, by_status = _Totals(), {}, {}
+            for row in rows:
+                totals.add(row, today)
+                by_category.setdefault(row.category, _Totals()).add(row, today)
+                by_status.setdefault(row.status, _Totals()).add(row, today)
+            summary = {
+                'as_of': today.isoformat(),
+                'totals': totals.metrics(),
+                'by_category': self._breakdown('category', by_category),
+                'by_status': self._breakdown('status', by_status),
+            }
+            self._cached = (today, summary)
+            return summary
+
+    @staticmethod
+    def _breakdown(name, groups):
+        items = [{name: key or None, **group.metrics()} for key, group in groups.items()]
+        return sorted(items, key=lambda item: (-item['budget'], -item['projects']))
@@ -0,0 +1,232 @@
+"""ASGI entry point: the public read paths on asyncio, everything else on Flask.
+
+    uvicorn app_asgi:app --host 0.0.0.0 --port $PORT --workers 2
+
+(or ``SERVER_MODE=asgi ./start.sh``). Requests are matched against the Flask
+URL map. The announcement pages, the JSON APIs and search are served by the
+coroutines below on async SQLAlchemy connections, so a slow client or a
+slow query holds no thread and one process keeps thousands of API clients
+connected. Every other endpoint -- Flask-Admin, login, registration, static
+files -- and any page requested with a session or remember-me cookie runs
+on the WSGI app in a thread pool, exactly as under gunicorn.
+
+The coroutines reuse the WSGI views' argument parsing, serializers,
+response cache and replica routing, so both servers answer identically.
+"""
+import os
+
+from a2wsgi import WSGIMiddleware
+from flask import abort, jsonify, render_template
+from sqlalchemy import select
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.http import parse_cookie
+from werkzeug.routing import RequestRedirect
+from werkzeug.test import EnvironBuilder
+
+from app import (create_app, change_bus, replica_router, response_cache, search_index, Announcement,
+                 PUBLIC_APIS, SEARCH_API_SCOPES, announcements_api_page, link_next_page, public_api_detail_scopes,
+                 public_api_list_scopes, public_api_page, search_api_args, search_api_response)
+from async_db import AsyncDatabase
+from pagination import PaginationError, cursor_from_probe, parse_fields
+from serializers import serializer_for
+
+# With the admin views: requests are routed by the complete URL map
+flask_app = create_app()
+async_db = AsyncDatabase(flask_app, replica_router)
+
+# endpoint -> (coroutine view, renders a page with personal navigation)
+async_views = {}
+
+def async_view(endpoint, page=False):
+    """Serves the Flask ``endpoint`` with the decorated coroutine on the ASGI server."""
+    def decorator(view):
+        async_views[endpoint] = (view, page)
+        return view
+    return decorator
+
+
+# --- Announcement pages (anonymous visitors) ---
+@async_view('announcements_list', page=True)
+@response_cache.cached_async(scopes=('announcement',))
+async def announcements_list():
+    async with async_db.connect('announcement') as conn:
+        result = await conn.execute(select(Announcement.__table__).order_by(Announcement.date_published.desc()))
+        announcements = result.all()
+    return render_template('announcements.html',
+                            title='الإعلانات',
+                            announcements=announcements)
+
+@async_view('announcement_detail', page=True)
+@response_cache.cached_async(scopes=('announcement:*', 'announcement:{announcement_id}'))
+async def announcement_detail(announcement_id):
+    async with async_db.connect('announcement') as conn:
+        result = await conn.execute(select(Announcement.__table__).where(Announcement.id == announcement_id))
+        announcement = result.first()
+    if announcement is None:
+        abort(404)
+    return render_template('announcement_detail.html',
+                            title=announcement.title,
+                            announcement=announcement)
+
+
+# --- JSON APIs ---
+async def keyset_page_response(page, endpoint, **url_args):
+    """Reads one keyset page and links the next one through response headers.
+
+    Pages are bounded (see ``pagination.MAX_PAGE_SIZE``), so the rows are
+    read in full and the connection is back in the pool before a slow
+    client has received the first byte.
+    """
+    async with async_db.connect(page.model.__tablename__) as conn:
+        cursor = cursor_from_probe((await conn.execute(page.cursor_select())).all())
+        result = await conn.execute(page.select(stream=False))
+        rows = result.all()
+    serialize = serializer_for(page.model).for_keys(result.keys())
+    body = '[' + ','.join(flask_app.json.dumps(serialize(row)) for row in rows) + ']'
+    response = flask_app.response_class(body, mimetype='application/json')
+    return link_next_page(response, cursor, page.limit, endpoint, **url_args)
+
+@async_view('get_announcements_api')
+@response_cache.cached_async(scopes=('announcement',))
+async def get_announcements_api():
+    try:
+        page = announcements_api_page()
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return await keyset_page_response(page, 'get_announcements_api')
+
+@async_view('public_api_list')
+@response_cache.cached_async(scopes=public_api_list_scopes)
+async def public_api_list(resource):
+    try:
+        page = public_api_page(resource)
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    return await keyset_page_response(page, 'public_api_list', resource=resource)
+
+@async_view('public_api_detail')
+@response_cache.cached_async(scopes=public_api_detail_scopes)
+async def public_api_detail(resource, item_id):
+    model = PUBLIC_APIS[resource]['model']
+    async with async_db.connect(model.__tablename__) as conn:
+        result = await conn.execute(select(*parse_fields(None, model)).where(model.id == item_id))
+        item = result.first()
+    if item is None:
+        abort(404)
+    return jsonify(serializer_for(model).for_keys(result.keys())(item))
+
+@async_view('search_api')
+@response_cache.cached_async(scopes=SEARCH_API_SCOPES)
+async def search_api():
+    try:
+        query, types, page, limit = search_api_args()
+    except PaginationError as e:
+        return jsonify({'error': str(e)}), 400
+    # Routed on the content tables, whose writes the search documents follow
+    connect = lambda: async_db.connect('search_document', *search_index.sources)
+    total, hits = await search_index.search_async(query, connect, types=types, page=page, limit=limit)
+    return search_api_response(query, page, limit, total, hits)
+
+
+# --- ASGI application ---
+class AsyncReadApp:
+    """Dispatches requests to the coroutine views or to the wrapped WSGI app."""
+
+    def __init__(self, flask_app, views, wsgi_threads=8):
+        self.flask_app = flask_app
+        self.views = views
+        self.wsgi = WSGIMiddleware(flask_app, workers=wsgi_threads)
+        self.session_cookies = (flask_app.config['SESSION_COOKIE_NAME'],
+                                flask_app.config.get('REMEMBER_COOKIE_NAME', 'remember_token'))
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] == 'http' and scope['method'] in ('GET', 'HEAD'):
+            matched = self.match(scope)
+            if matched is not None:
+                return await self.serve(scope, send, *matched)
+        await self.wsgi(scope, receive, send)
+
+    def match(self, scope):
+        """Returns ``(view, arguments)`` when an async view serves this request."""
+        adapter = self.flask_app.url_map.bind('')
+        try:
+            endpoint, values = adapter.match(scope['path'], method=scope['method'])
+        except (NotFound, MethodNotAllowed, RequestRedirect):
+            return None
+        entry = self.views.get(endpoint)
+        if entry is None:
+            return None
+        view, page = entry
+        # Logged-in users and pending flash messages need the full Flask stack
+        if page and self.has_session(scope):
+            return None
+        return view, values
+
+    def has_session(self, scope):
+        for name, value in scope['headers']:
+            if name == b'cookie':
+                cookies = parse_cookie(value.decode('latin-1'))
+                if any(cookie in cookies for cookie in self.session_cookies):
+                    return True
+        return False
+
+    def environ(self, scope):
+        headers = [(name.decode('latin-1'), value.decode('latin-1')) for name, value in scope['headers']]
+        host = next((value for name, value in headers if name.lower() == 'host'), None)
+        if host is None:
+            host = '%s:%d' % tuple(scope['server'])
+        client = scope.get('client') or ('', 0)
+        return EnvironBuilder(
+            path=scope['path'],
+            base_url=f"{scope.get('scheme', 'http')}://{host}{scope.get('root_path', '')}",
+            query_string=scope.get('query_string', b'').decode('latin-1'),
+            method=scope['method'],
+            headers=headers,
+            environ_base={'REMOTE_ADDR': client[0], 'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}"},
+        ).get_environ()
+
+    async def serve(self, scope, send, view, values):
+        flask_app = self.flask_app
+        # Leaving the context runs the teardown_request hooks; before_request ones (request
+        # metrics) are run here, and one returning a response replaces the view, as in Flask
+        with flask_app.request_context(self.environ(scope)):
+            try:
+                response = flask_app.preprocess_request()
+                if response is None:
+                    response = await view(**values)
+                response = flask_app.make_response(response)
+            except Exception as e:
+                response = flask_app.make_response(self.handle_error(e))
+            response = flask_app.process_response(response)
+        body = b'' if scope['method'] == 'HEAD' else response.get_data()
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in response.headers.items()],
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    def handle_error(self, e):
+        """Turns an exception into Flask's error response (404 pages, logged 500s)."""
+        try:
+            return self.flask_app.handle_user_exception(e)
+        except Exception as unhandled:
+            return self.flask_app.handle_exception(unhandled)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Under WSGI a before_request hook starts the listener; the async views bypass it
+                change_bus.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await async_db.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = AsyncReadApp(flask_app, async_views, wsgi_threads=int(os.environ.get('ASGI_WSGI_THREADS', 8)))
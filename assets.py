@@ -0,0 +1,187 @@
+"""Static asset pipeline: fingerprinted copies, precompressed variants, immutable caching.
+
+``flask assets-build`` (run by start.sh before the workers start) copies
+every file under ``static/`` to ``static/build/`` with a content hash in its
+name (``css/style.css`` -> ``build/css/style.48f33c650c.css``), writes
+gzip and, when the ``brotli`` package is installed, brotli variants of the
+text files next to it, and records the mapping in
+``static/build/manifest.json``.
+
+At runtime ``url_for('static', filename='css/style.css')`` is rewritten to
+the fingerprinted name. Those files are served with a one-year
+``immutable`` Cache-Control and, when the client accepts it, straight from
+the ``.br``/``.gz`` file, so a worker never reads or compresses an asset
+per page view; the body goes out through the server's ``wsgi.file_wrapper``
+(``sendfile`` under gunicorn) or, with ``STATIC_X_SENDFILE``, through the
+front proxy. Without a build (development) URLs get ``?v=<content hash>``
+instead and the hashed URL is cached just the same.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import tempfile
+import threading
+
+from flask import request, send_from_directory
+
+ONE_YEAR = 365 * 24 * 3600
+BUILD_DIR = 'build'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.xml', '.html', '.map', '.ico')
+# Smallest saving worth a separate file and a Content-Encoding
+MIN_SAVING = 256
+
+
+def _digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()[:10]
+
+
+def _write_atomic(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def immutable(response):
+    """Marks ``response`` as cacheable for a year without revalidation."""
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = ONE_YEAR
+    response.cache_control.immutable = True
+    return response
+
+
+def build(static_folder):
+    """Writes the fingerprinted and precompressed files; returns the manifest."""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+    out = os.path.join(static_folder, BUILD_DIR)
+    manifest, written = {}, {MANIFEST}
+    for dirpath, dirnames, filenames in os.walk(static_folder):
+        if os.path.abspath(dirpath) == os.path.abspath(static_folder):
+            dirnames[:] = [d for d in dirnames if d != BUILD_DIR]
+        for name in sorted(filenames):
+            source = os.path.join(dirpath, name)
+            logical = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            stem, ext = os.path.splitext(logical)
+            hashed = f'{stem}.{_digest(source)}{ext}'
+            target = os.path.join(out, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            written.add(hashed)
+            manifest[logical] = f'{BUILD_DIR}/{hashed}'
+            if os.path.exists(target):
+                # Same name, same content: keep it and the variants written with it
+                written.update(hashed + suffix for suffix in ('.gz', '.br') if os.path.exists(target + suffix))
+                continue
+            with open(source, 'rb') as f:
+                data = f.read()
+            if ext.lower() in COMPRESSIBLE:
+                variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+                if brotli is not None:
+                    variants.append(('.br', brotli.compress(data, quality=11)))
+                for suffix, compressed in variants:
+                    if len(data) - len(compressed) >= MIN_SAVING:
+                        _write_atomic(target + suffix, compressed)
+                        written.add(hashed + suffix)
+            shutil.copyfile(source, target + '.tmp')
+            os.replace(target + '.tmp', target)
+
+    # Drop the output of earlier builds
+    for dirpath, _, filenames in os.walk(out):
+        for name in filenames:
+            rel = os.path.relpath(os.path.join(dirpath, name), out).replace(os.sep, '/')
+            if rel not in written:
+                os.remove(os.path.join(dirpath, name))
+    _write_atomic(os.path.join(out, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode('utf-8'))
+    return manifest
+
+
+class StaticAssets:
+    """Flask extension rewriting static URLs and serving the built files."""
+
+    def __init__(self, app=None):
+        self.folder = None
+        self.manifest = {}
+        self.built = frozenset()
+        self.variants = frozenset()
+        self._versions = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.folder = app.static_folder
+        if app.config.setdefault('STATIC_X_SENDFILE', os.environ.get('STATIC_X_SENDFILE', '')):
+            # The front proxy (nginx X-Accel/Apache mod_xsendfile) sends the file
+            app.config['USE_X_SENDFILE'] = True
+        self.load_manifest()
+        app.url_defaults(self._rewrite_url)
+        app.view_functions['static'] = self.send_static
+        app.extensions['static_assets'] = self
+
+    def load_manifest(self):
+        path = os.path.join(self.folder, BUILD_DIR, MANIFEST)
+        try:
+            with open(path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+        self.built = frozenset(self.manifest.values())
+        # Which precompressed variants exist, so serving never has to stat for them
+        self.variants = frozenset(name + suffix for name in self.built for suffix in ('.br', '.gz')
+                                  if os.path.exists(os.path.join(self.folder, name + suffix)))
+
+    def version(self, filename):
+        """Returns a short hash of the file's content, recomputed when its mtime changes."""
+        path = os.path.join(self.folder, filename)
+        mtime = os.stat(path).st_mtime_ns
+        cached = self._versions.get(filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        digest = _digest(path)
+        with self._lock:
+            self._versions[filename] = (mtime, digest)
+        return digest
+
+    # --- URLs ---
+    def _rewrite_url(self, endpoint, values):
+        if endpoint != 'static' or 'filename' not in values:
+            return
+        filename = values['filename']
+        if filename in self.manifest:
+            values['filename'] = self.manifest[filename]
+        elif filename not in self.built and 'v' not in values:
+            try:
+                values['v'] = self.version(filename)
+            except OSError:
+                pass
+
+    # --- Serving ---
+    def send_static(self, filename):
+        if filename in self.built:
+            return self._send_built(filename)
+        response = send_from_directory(self.folder, filename)
+        # An outdated ?v= still gets the file, just not the long lifetime
+        if request.args.get('v') and response.status_code == 200 and request.args['v'] == self.version(filename):
+            immutable(response)
+        return response
+
+    def _send_built(self, filename):
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        encodings = request.accept_encodings
+        for suffix, coding in (('.br', 'br'), ('.gz', 'gzip')):
+            if encodings[coding] and filename + suffix in self.variants:
+                response = send_from_directory(self.folder, filename + suffix, mimetype=mimetype)
+                response.headers['Content-Encoding'] = coding
+                break
+        else:
+            response = send_from_directory(self.folder, filename, mimetype=mimetype)
+        response.vary.add('Accept-Encoding')
+        return immutable(response)
@@ -0,0 +1,71 @@
+"""Async SQLAlchemy engines for the ASGI read path (see app_asgi.py).
+
+The primary and every replica in ``DATABASE_REPLICA_URLS`` get an async
+twin -- asyncpg for PostgreSQL, aiosqlite for SQLite/dev -- sized from the
+same DB_* variables as the sync pool. :meth:`AsyncDatabase.connect` routes
+through the :class:`~replicas.ReplicaRouter`, so read-your-writes pinning
+and replica health apply to both servers alike. ``ASYNC_DATABASE_URL``
+overrides the URL derived for the primary.
+"""
+import os
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from db_pool import apply_pgbouncer_timeout, async_engine_options_from_env
+
+ASYNC_DRIVERS = {
+    'postgres': 'postgresql+asyncpg',
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+
+def async_url(url):
+    """Returns ``url`` with its driver swapped for the async one."""
+    url = make_url(url)
+    backend = url.drivername.split('+', 1)[0]
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'No async driver configured for {url.drivername}')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class AsyncDatabase:
+    """Flask extension holding the async engines of the primary and the replicas."""
+
+    def __init__(self, app=None, replica_router=None):
+        self.engine = None
+        self.router = None
+        self._replicas = {}
+        if app is not None:
+            self.init_app(app, replica_router)
+
+    def init_app(self, app, replica_router):
+        env = os.environ
+        url = app.config.setdefault('ASYNC_DATABASE_URL', env.get('ASYNC_DATABASE_URL'))
+        self.engine = self._create(url or async_url(app.config['SQLALCHEMY_DATABASE_URI']), env)
+        self.router = replica_router
+        for replica in replica_router.replicas:
+            engine = self._create(async_url(replica.engine.url), env)
+            replica_router.watch(replica, engine)
+            self._replicas[replica.name] = engine
+        app.extensions['async_db'] = self
+
+    @staticmethod
+    def _create(url, env):
+        url = make_url(url)
+        engine = create_async_engine(url, **async_engine_options_from_env(env, url.drivername))
+        apply_pgbouncer_timeout(engine.sync_engine, env)
+        return engine
+
+    def engine_for(self, tables):
+        replica = self.router.pick(tables) if self.router is not None else None
+        return self.engine if replica is None else self._replicas[replica.name]
+
+    def connect(self, *tables):
+        """Opens an async connection for reading ``tables``: a replica when allowed, else the primary."""
+        return self.engine_for(tables).connect()
+
+    async def dispose(self):
+        for engine in (self.engine, *self._replicas.values()):
+            await engine.dispose()
@@ -0,0 +1,200 @@
+"""Many concurrent keep-alive API clients: gunicorn (start.sh) against app_asgi.
+
+Run from the repository root:
+
+    python benchmarks/bench_asgi.py [--clients 1000] [--duration 20] [--think 0.5]
+
+Starts the WSGI server exactly as start.sh does (``gunicorn app:app
+--workers 4 --threads 2``) and then the ASGI server as a single uvicorn
+process, and drives each with ``--clients`` keep-alive connections. Every
+client requests a random public API URL, reads the whole response and waits
+``--think`` seconds before the next request, like a polling app. Reported
+per server: clients that got connected, completed requests per second,
+failed requests and latency percentiles.
+
+``DATABASE_URL`` selects the database (run ``flask db upgrade`` first for
+PostgreSQL); without it a seeded SQLite file is used. The response cache is
+shrunk to one entry so requests reach the database; pass ``--cache`` to
+measure with it. The load generator shares the machine with the servers,
+so compare the two rows rather than reading them as absolute capacity.
+"""
+import argparse
+import asyncio
+import os
+import random
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from urllib.parse import quote
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed_sqlite(path, rows):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{path}', CHANGE_BUS_TRANSPORT='none')
+    script = f'''
+from datetime import date, datetime, timedelta
+from app import app, db, Announcement, Project
+with app.app_context():
+    db.create_all()
+    db.session.execute(db.insert(Announcement), [
+        {{'title': f'إعلان رقم {{i}}', 'content': 'نص الإعلان ' * 40, 'author': 'البلدية',
+          'date_published': datetime(2024, 1, 1) + timedelta(hours=i), 'announcement_type': 'عام'}}
+        for i in range({rows})])
+    db.session.execute(db.insert(Project), [
+        {{'title': f'مشروع رقم {{i}}', 'description': 'وصف المشروع', 'status': 'جاري', 'category': 'طرق',
+          'budget': 1000.0 * i, 'progress_percentage': i % 100, 'start_date': date(2024, 1, 1) + timedelta(days=i)}}
+        for i in range({rows})])
+    db.session.commit()
+'''
+    subprocess.run([sys.executable, '-c', script], cwd=ROOT, env=env, check=True)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def random_path(rows):
+    n = random.randint(1, 50)
+    return random.choice((
+        f'/api/announcements?limit={n}',
+        f'/api/projects?sort=-budget&limit={n}',
+        f'/api/projects/{random.randint(1, rows)}',
+        f'/api/search?q={quote("مشروع")}&limit={min(n, 20)}',
+    ))
+
+
+async def read_response(reader):
+    head = await reader.readuntil(b'\r\n\r\n')
+    status = int(head.split(b' ', 2)[1])
+    headers = {}
+    for line in head.split(b'\r\n')[1:]:
+        if b':' in line:
+            name, value = line.split(b':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if headers.get(b'transfer-encoding') == b'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    else:
+        await reader.readexactly(int(headers.get(b'content-length', 0)))
+    return status, headers.get(b'connection') != b'close'
+
+
+async def client(port, deadline, think, rows, stats):
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), 10)
+    except (OSError, asyncio.TimeoutError):
+        stats['connect_errors'] += 1
+        return
+    stats['connected'] += 1
+    try:
+        while time.monotonic() < deadline:
+            request = f'GET {random_path(rows)} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode('ascii')
+            started = time.monotonic()
+            writer.write(request)
+            status, keep_alive = await asyncio.wait_for(read_response(reader), 30)
+            if status in (200, 304):
+                stats['latencies'].append(time.monotonic() - started)
+            else:
+                stats['errors'] += 1
+            if not keep_alive:
+                break
+            await asyncio.sleep(random.uniform(0, 2 * think))
+    except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError):
+        stats['errors'] += 1
+    finally:
+        writer.close()
+
+
+async def drive(port, clients, duration, think, rows):
+    stats = {'connected': 0, 'connect_errors': 0, 'errors': 0, 'latencies': []}
+    started = time.monotonic()
+    deadline = started + duration
+    tasks = []
+    for i in range(clients):
+        tasks.append(asyncio.create_task(client(port, deadline, think, rows, stats)))
+        if i % 100 == 99:
+            await asyncio.sleep(0.05)  # ramp up instead of one SYN flood
+    await asyncio.gather(*tasks)
+    stats['elapsed'] = time.monotonic() - started
+    return stats
+
+
+def wait_ready(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def run_server(name, command, port, env, args):
+    proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        time.sleep(2)  # let every worker finish importing
+        stats = asyncio.run(drive(port, args.clients, args.duration, args.think, args.rows))
+    finally:
+        proc.terminate()
+        proc.wait()
+    latencies = sorted(stats['latencies'])
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+    print(f"{name:<28}{stats['connected']:>10}{len(latencies) / stats['elapsed']:>10.0f}"
+          f"{stats['errors'] + stats['connect_errors']:>8}{pct(0.5):>9.1f}{pct(0.95):>9.1f}{pct(0.99):>9.1f}"
+          f"{(statistics.mean(latencies) * 1000 if latencies else 0):>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--think', type=float, default=0.5, help='mean pause between requests per client')
+    parser.add_argument('--rows', type=int, default=2000, help='rows seeded per table (SQLite only)')
+    parser.add_argument('--asgi-workers', type=int, default=1)
+    parser.add_argument('--cache', action='store_true', help='keep the response cache at its normal size')
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, args.clients * 3 + 256)), hard))
+
+    env = dict(os.environ, CHANGE_BUS_TRANSPORT=os.environ.get('CHANGE_BUS_TRANSPORT', 'socket'),
+               RESPONSE_CACHE_BACKEND='memory', PASSWORD_HASH_WORKERS='0')
+    if not args.cache:
+        env['RESPONSE_CACHE_MAX_ENTRIES'] = '1'
+    if not env.get('DATABASE_URL'):
+        path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+        seed_sqlite(path, args.rows)
+        env['DATABASE_URL'] = f'sqlite:///{path}'
+
+    print(f'{args.clients} keep-alive clients, {args.duration:.0f}s, ~{args.think}s think time')
+    print(f"{'server':<28}{'clients':>10}{'req/s':>10}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'mean ms':>9}")
+    port = free_port()
+    run_server('gunicorn 4w x 2t (start.sh)',
+               ['gunicorn', '-b', f'127.0.0.1:{port}', 'app:app', '--timeout', '120', '--workers', '4',
+                '--threads', '2'],
+               port, env, args)
+    port = free_port()
+    run_server(f'uvicorn app_asgi x {args.asgi_workers}',
+               ['uvicorn', 'app_asgi:app', '--host', '127.0.0.1', '--port', str(port),
+                '--workers', str(args.asgi_workers), '--log-level', 'warning', '--no-access-log'],
+               port, env, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,462 @@
+"""Throughput and latency of the main pages, plus micro-benchmarks, saved as JSON.
+
+Run from the repository root:
+
+    python benchmarks/bench_suite.py [--http] [--workers 2,4] [--threads 1,2] [--compare OLD.json]
+
+Seeds a database with realistic volumes (``--announcements``,
+``--projects``, ``--decisions``; an admin and a citizen account) and then:
+
+* ``wsgi``  -- drives the app in-process through the Flask test client,
+  ``--requests`` times per scenario, one at a time: the cost of a request
+  without any server in the way.
+* ``http``  -- with ``--http``, starts gunicorn as start.sh does for every
+  ``--workers`` x ``--threads`` combination and drives it for
+  ``--duration`` seconds from ``--concurrency`` keep-alive clients, so the
+  settings in start.sh can be chosen by measurement.
+* ``micro`` -- ``to_dict`` over announcement rows, ``load_user`` with the
+  principal cache warm and cold, and password hashing and checking.
+
+Scenarios: home, announcements list and detail, the announcements and
+projects JSON APIs, login (a full password check) and the admin list
+views; each reports requests/s and p50/p95/p99 latency.
+
+Results go to ``benchmarks/results/<UTC time>.json`` (``--output``) with
+the commit, Python and database they were measured with. ``--compare``
+prints the change against an earlier result file. ``DATABASE_URL`` selects
+the database (run ``flask db upgrade`` first for PostgreSQL, the tables are
+seeded when empty); without it a fresh SQLite file is used. The response
+cache runs at its normal size; ``--no-cache`` shrinks it to one entry so
+every request reaches the database.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+ADMIN = ('bench-admin@example.com', 'bench-admin-password')
+CITIZEN = ('bench-citizen@example.com', 'bench-citizen-password')
+# A login that re-renders the form (200) failed
+EXPECTED_STATUS = {'login': (302,)}
+OK_STATUS = (200, 304)
+CSRF_INPUT = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--announcements', type=int, default=5000)
+    parser.add_argument('--projects', type=int, default=2000)
+    parser.add_argument('--decisions', type=int, default=5000)
+    parser.add_argument('--requests', type=int, default=200, help='requests per scenario through the test client')
+    parser.add_argument('--http', action='store_true', help='also load-test gunicorn over HTTP')
+    parser.add_argument('--workers', default='4', help='comma separated gunicorn --workers values')
+    parser.add_argument('--threads', default='2', help='comma separated gunicorn --threads values')
+    parser.add_argument('--concurrency', type=int, default=16, help='HTTP clients')
+    parser.add_argument('--duration', type=float, default=15, help='seconds per HTTP run')
+    parser.add_argument('--no-cache', action='store_true', help='shrink the response cache to one entry')
+    parser.add_argument('--output', help='result file (default: benchmarks/results/<UTC time>.json)')
+    parser.add_argument('--compare', help='earlier result file to compare with')
+    return parser.parse_args()
+
+
+def configure_environment(args):
+    """Settings shared by the in-process app and the gunicorn runs; must precede ``import app``."""
+    scratch = tempfile.mkdtemp(prefix='municipality-bench-')
+    env = os.environ
+    if not env.get('DATABASE_URL'):
+        env['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch, 'bench.db')}"
+    env.setdefault('CHANGE_BUS_TRANSPORT', 'none')
+    env.setdefault('RESPONSE_CACHE_BACKEND', 'memory')
+    env.setdefault('JOB_QUEUE', 'inline')
+    env['TEMPLATE_BYTECODE_DIR'] = os.path.join(scratch, 'jinja')
+    env['METRICS_DIR'] = os.path.join(scratch, 'metrics')
+    env['RATE_LIMIT_DIR'] = os.path.join(scratch, 'ratelimit')
+    # The login scenario signs in hundreds of times from one address
+    env['LOGIN_IP_BURST'] = env['LOGIN_ACCOUNT_BURST'] = '1000000000'
+    env['LOGIN_IP_PER_MINUTE'] = env['LOGIN_ACCOUNT_PER_MINUTE'] = '1000000000'
+    if args.no_cache:
+        env['RESPONSE_CACHE_MAX_ENTRIES'] = '1'
+    sys.path.insert(0, ROOT)
+
+
+# --- Data ---
+def seed(args):
+    from analytics import metadata as analytics_metadata
+    from app import app, db, project_analytics, Announcement, Decision, Project, User
+    from jobs import metadata as jobs_metadata
+
+    with app.app_context():
+        db.create_all()
+        analytics_metadata.create_all(db.engine)
+        jobs_metadata.create_all(db.engine)
+        if db.session.scalar(db.select(db.func.count()).select_from(Announcement)):
+            return
+        rng = random.Random(42)
+        start = datetime(2023, 1, 1)
+        types = ('عام', 'مناقصة', 'توظيف', 'تنبيه')
+        db.session.execute(db.insert(Announcement), [
+            {'title': f'إعلان رقم {i} حول {rng.choice(types)}', 'content': 'نص الإعلان وتفاصيله. ' * rng.randint(20, 120),
+             'author': 'البلدية', 'announcement_type': rng.choice(types),
+             'date_published': start + timedelta(hours=i * 3),
+             'deadline': start + timedelta(days=30, hours=i * 3) if i % 3 == 0 else None}
+            for i in range(args.announcements)])
+        categories = ('طرق', 'مياه', 'إنارة', 'حدائق', 'مباني')
+        statuses = ('مخطط', 'جاري', 'متوقف', 'مكتمل')
+        db.session.execute(db.insert(Project), [
+            {'title': f'مشروع {rng.choice(categories)} رقم {i}', 'description': 'وصف المشروع ومراحله. ' * 10,
+             'status': rng.choice(statuses), 'category': rng.choice(categories),
+             'budget': round(rng.uniform(1e4, 5e6), 2), 'contractor': f'مقاولات {i % 40}',
+             'start_date': date(2022, 1, 1) + timedelta(days=rng.randint(0, 900)),
+             'end_date': date(2023, 1, 1) + timedelta(days=rng.randint(0, 1200)),
+             'progress_percentage': rng.randint(0, 100)}
+            for i in range(args.projects)])
+        db.session.execute(db.insert(Decision), [
+            {'title': f'قرار بلدي رقم {i}', 'type': rng.choice(('تنظيمي', 'مالي', 'إداري')),
+             'date': date(2020, 1, 1) + timedelta(days=i % 1800)}
+            for i in range(args.decisions)])
+        for (email, password), is_admin in ((ADMIN, True), (CITIZEN, False)):
+            user = User(username=email.split('@')[0][:20], email=email, is_admin=is_admin)
+            user.set_password(password)
+            db.session.add(user)
+        db.session.commit()
+        project_analytics.rebuild()
+
+
+# --- Statistics ---
+def summarize(latencies, errors, elapsed):
+    ordered = sorted(latencies)
+
+    def percentile(p):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2) if ordered else None
+
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'rps': round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2) if ordered else None,
+    }
+
+
+def print_table(title, results):
+    print(f'\n{title}')
+    print(f"{'scenario':<24}{'req/s':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, r in results.items():
+        print(f"{name:<24}{r['rps']:>10.1f}{r['errors']:>8}{r['p50_ms'] or 0:>10.2f}{r['p95_ms'] or 0:>10.2f}"
+              f"{r['p99_ms'] or 0:>10.2f}")
+
+
+# --- In-process (WSGI test client) ---
+def wsgi_scenarios(args):
+    """name -> (client kind, method, path factory, form factory)."""
+    login_form = lambda: {'email': CITIZEN[0], 'password': CITIZEN[1]}
+    return {
+        'home': ('anonymous', 'GET', lambda: '/', None),
+        'announcements_list': ('anonymous', 'GET', lambda: '/announcements', None),
+        'announcement_detail': ('anonymous', 'GET',
+                                lambda: f'/announcement/{random.randint(1, args.announcements)}', None),
+        'api_announcements': ('anonymous', 'GET', lambda: f'/api/announcements?limit={random.randint(10, 50)}', None),
+        'api_projects': ('anonymous', 'GET', lambda: '/api/projects?sort=-budget&limit=50', None),
+        'api_project_detail': ('anonymous', 'GET', lambda: f'/api/projects/{random.randint(1, args.projects)}', None),
+        'login': ('fresh', 'POST', lambda: '/login', login_form),
+        'admin_announcements': ('admin', 'GET', lambda: '/admin/announcement/', None),
+        'admin_projects': ('admin', 'GET', lambda: '/admin/project/', None),
+    }
+
+
+def run_wsgi(args):
+    from app import app
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    results = {}
+    # No app context around the loop: each request must get its own ``g``
+    admin = app.test_client()
+    admin.post('/login', data={'email': ADMIN[0], 'password': ADMIN[1]})
+    clients = {'anonymous': app.test_client(), 'admin': admin}
+    for name, (kind, method, path, form) in wsgi_scenarios(args).items():
+        latencies, errors = [], 0
+        for i in range(args.requests + 5):
+            client = clients.get(kind) or app.test_client()
+            started = time.perf_counter()
+            response = client.open(path(), method=method, data=form() if form else None)
+            response.get_data()
+            elapsed = time.perf_counter() - started
+            response.close()
+            if i < 5:
+                continue  # warm-up: template compilation, first queries, cache fill
+            if response.status_code in EXPECTED_STATUS.get(name, OK_STATUS):
+                latencies.append(elapsed)
+            else:
+                errors += 1
+        results[name] = summarize(latencies, errors, sum(latencies))
+    return results
+
+
+# --- Over HTTP (gunicorn) ---
+class HttpClient:
+    """One keep-alive connection with a cookie jar."""
+
+    def __init__(self, port):
+        self.port = port
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, method, path, form=None):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        headers = {'Host': 'localhost'}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        try:
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            self.connection = None
+            raise
+        for header in response.headers.get_all('Set-Cookie') or ():
+            name, _, value = header.split(';', 1)[0].partition('=')
+            self.cookies[name.strip()] = value
+        if response.getheader('Connection', '').lower() == 'close':
+            self.connection.close()
+            self.connection = None
+        return response.status, data
+
+    def login(self, email, password):
+        self.cookies.clear()
+        status, page = self.request('GET', '/login')
+        token = CSRF_INPUT.search(page.decode('utf-8'))
+        form = {'email': email, 'password': password, 'csrf_token': token.group(1) if token else ''}
+        return self.request('POST', '/login', form)
+
+
+def http_scenarios(args):
+    """name -> callable(client, admin client) returning the final HTTP status."""
+    def get(path):
+        return lambda client, admin: client.request('GET', path() if callable(path) else path)[0]
+
+    return {
+        'home': get('/'),
+        'announcements_list': get('/announcements'),
+        'announcement_detail': get(lambda: f'/announcement/{random.randint(1, args.announcements)}'),
+        'api_announcements': get(lambda: f'/api/announcements?limit={random.randint(10, 50)}'),
+        'api_projects': get('/api/projects?sort=-budget&limit=50'),
+        'api_project_detail': get(lambda: f'/api/projects/{random.randint(1, args.projects)}'),
+        'login': lambda client, admin: HttpClient(client.port).login(*CITIZEN)[0],
+        'admin_announcements': lambda client, admin: admin.request('GET', '/admin/announcement/')[0],
+        'admin_projects': lambda client, admin: admin.request('GET', '/admin/project/')[0],
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def run_http(args, workers, threads):
+    port = free_port()
+    env = dict(os.environ, CHANGE_BUS_TRANSPORT=os.environ.get('BENCH_CHANGE_BUS_TRANSPORT', 'socket'))
+    command = ['gunicorn', '-b', f'127.0.0.1:{port}', 'app:create_app()', '--preload', '--timeout', '120',
+               '--workers', str(workers), '--threads', str(threads)]
+    proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    scenarios = http_scenarios(args)
+    samples = {name: [] for name in scenarios}
+    errors = {name: 0 for name in scenarios}
+    lock = threading.Lock()
+    try:
+        wait_ready(port)
+        time.sleep(2)  # let every worker finish importing
+        deadline = time.monotonic() + args.duration
+
+        def client_loop(n):
+            rng = random.Random(n)
+            client, admin = HttpClient(port), HttpClient(port)
+            admin.login(*ADMIN)
+            names = list(scenarios)
+            while time.monotonic() < deadline:
+                name = rng.choice(names)
+                started = time.perf_counter()
+                try:
+                    status = scenarios[name](client, admin)
+                except (OSError, http.client.HTTPException):
+                    status = 0
+                elapsed = time.perf_counter() - started
+                with lock:
+                    if status in EXPECTED_STATUS.get(name, OK_STATUS):
+                        samples[name].append(elapsed)
+                    else:
+                        errors[name] += 1
+
+        started = time.monotonic()
+        clients = [threading.Thread(target=client_loop, args=(n,)) for n in range(args.concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.monotonic() - started
+    finally:
+        proc.terminate()
+        proc.wait()
+    results = {name: summarize(samples[name], errors[name], elapsed) for name in scenarios}
+    results['total'] = summarize([s for values in samples.values() for s in values], sum(errors.values()), elapsed)
+    return results
+
+
+# --- Micro-benchmarks ---
+def per_call(fn, calls):
+    fn()
+    started = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - started) / calls
+
+
+def run_micro(args):
+    from app import app, db, load_user, password_hasher, principal_cache, Announcement, User
+
+    results = {}
+    with app.app_context():
+        announcements = db.session.scalars(db.select(Announcement).limit(2000)).all()
+        seconds = per_call(lambda: [a.to_dict() for a in announcements], 20)
+        results['to_dict'] = {'rows_per_second': round(len(announcements) / seconds),
+                              'us_per_row': round(seconds / len(announcements) * 1e6, 3)}
+
+        user = db.session.scalar(db.select(User).filter_by(email=CITIZEN[0]))
+        session_id = user.get_id()
+        db.session.expunge_all()
+        with app.test_request_context():
+            warm = per_call(lambda: load_user(session_id), 20000)
+
+            def cold():
+                principal_cache.clear()
+                load_user(session_id)
+                db.session.remove()
+            results['load_user'] = {'cached_us': round(warm * 1e6, 3), 'uncached_us': round(per_call(cold, 500) * 1e6, 3)}
+
+        stored = user.password_hash
+        results['password_hash'] = {
+            'method': password_hasher.method,
+            'workers': password_hasher.workers,
+            'hash_ms': round(per_call(lambda: password_hasher.hash(CITIZEN[1]), 10) * 1000, 2),
+            'check_ms': round(per_call(lambda: password_hasher.check(stored, CITIZEN[1]), 10) * 1000, 2),
+        }
+    return results
+
+
+def print_micro(results):
+    print('\nmicro')
+    print(f"to_dict          {results['to_dict']['rows_per_second']:>12,} rows/s")
+    print(f"load_user        {results['load_user']['cached_us']:>12.1f} us cached, "
+          f"{results['load_user']['uncached_us']:.1f} us from the database")
+    print(f"password hash    {results['password_hash']['hash_ms']:>12.1f} ms, "
+          f"check {results['password_hash']['check_ms']:.1f} ms ({results['password_hash']['method']})")
+
+
+# --- Results ---
+def metadata(args):
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    url = os.environ['DATABASE_URL']
+    return {
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'database': url.split(':', 1)[0],
+        'args': vars(args),
+    }
+
+
+def flatten(results, prefix=''):
+    """``{'wsgi.home.rps': ...}`` for every number in a result document."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f'{prefix}{key}'] = value
+    return flat
+
+
+def compare(old_path, new):
+    with open(old_path) as f:
+        old = json.load(f)
+    print(f"\nchange against {old_path} ({old['meta'].get('commit')}, {old['meta'].get('time')})")
+    before = flatten({k: v for k, v in old.items() if k != 'meta'})
+    after = flatten({k: v for k, v in new.items() if k != 'meta'})
+    for key in sorted(before.keys() & after.keys()):
+        if not key.endswith(('rps', 'p50_ms', 'p95_ms', 'p99_ms', 'rows_per_second', '_us', '_ms')):
+            continue
+        if before[key]:
+            change = (after[key] - before[key]) / before[key] * 100
+            print(f'{key:<48}{before[key]:>12.2f}{after[key]:>12.2f}{change:>+9.1f}%')
+
+
+def main():
+    args = parse_args()
+    configure_environment(args)
+    print(f"Seeding {os.environ['DATABASE_URL']} ...")
+    seed(args)
+
+    results = {'meta': metadata(args)}
+    results['wsgi'] = run_wsgi(args)
+    print_table(f'wsgi test client, {args.requests} requests per scenario', results['wsgi'])
+    if args.http:
+        results['http'] = {}
+        for workers in map(int, args.workers.split(',')):
+            for threads in map(int, args.threads.split(',')):
+                key = f'{workers}w{threads}t'
+                results['http'][key] = run_http(args, workers, threads)
+                print_table(f'gunicorn --workers {workers} --threads {threads}, {args.concurrency} clients, '
+                            f'{args.duration:.0f}s', results['http'][key])
+    results['micro'] = run_micro(args)
+    print_micro(results['micro'])
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ') + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f'\nSaved {output}')
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == '__main__':
+    main()
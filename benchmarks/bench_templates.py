@@ -0,0 +1,92 @@
+"""Render time and bytes of the announcements listing.
+
+Run from the repository root:
+
+    python benchmarks/bench_templates.py [announcements] [renders]
+
+Seeds an in-memory SQLite database and renders ``announcements.html`` the
+way the view does, with and without the fragment cache, then a cold start
+(fresh Jinja environment) with and without the bytecode cache. The bytes
+line compares the page as served now with the same page carrying the CSS
+inline, as base.html used to: the stylesheet is now a separate response
+that browsers keep for a year.
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('CHANGE_BUS_TRANSPORT', 'none')
+os.environ.setdefault('TEMPLATE_BYTECODE_DIR', tempfile.mkdtemp())
+
+from flask import render_template  # noqa: E402
+from jinja2 import FileSystemBytecodeCache  # noqa: E402
+
+from app import app, db, Announcement  # noqa: E402
+from fragments import FragmentCacheExtension  # noqa: E402
+
+
+def seed(rows):
+    start = datetime(2024, 1, 1)
+    db.session.execute(db.insert(Announcement), [
+        {'title': f'إعلان رقم {i}', 'content': 'نص الإعلان ' * 40, 'date_published': start + timedelta(hours=i),
+         'author': 'البلدية', 'announcement_type': 'عام', 'deadline': start + timedelta(days=30, hours=i)}
+        for i in range(rows)
+    ])
+    db.session.commit()
+
+
+def render_listing():
+    announcements = Announcement.query.order_by(Announcement.date_published.desc()).all()
+    return render_template('announcements.html', title='الإعلانات', announcements=announcements)
+
+
+def timed(label, renders, fn):
+    fn()  # warm up: compile templates, fill the fragment cache
+    started = time.perf_counter()
+    for _ in range(renders):
+        fn()
+    elapsed = (time.perf_counter() - started) / renders
+    print(f'{label:<36} {elapsed * 1000:>8.2f} ms/render')
+
+
+def cold_start(bytecode_cache):
+    """Compiles every template of the listing in a fresh environment, as a new worker does."""
+    env = app.create_jinja_environment()
+    env.add_extension(FragmentCacheExtension)
+    env.bytecode_cache = bytecode_cache
+    started = time.perf_counter()
+    for name in ('base.html', 'announcements.html'):
+        env.get_template(name)
+    return time.perf_counter() - started
+
+
+def main(rows=60, renders=200):
+    jinja_env = app.jinja_env
+    with app.app_context():
+        db.create_all()
+        seed(rows)
+        with app.test_request_context('/announcements'):
+            fragment_cache = jinja_env.fragment_cache
+            jinja_env.fragment_cache = None
+            timed('listing, no fragment cache', renders, render_listing)
+            jinja_env.fragment_cache = fragment_cache
+            timed('listing, fragment cache', renders, render_listing)
+
+            html = render_listing().encode('utf-8')
+            with open(os.path.join(app.static_folder, 'css', 'style.css'), 'rb') as f:
+                css = f.read()
+            print(f"{'bytes per view, CSS inline (before)':<36} {len(html) + len(css) + 16:>8,}")
+            print(f"{'bytes per view, CSS cached (after)':<36} {len(html):>8,}")
+
+    bytecode = FileSystemBytecodeCache(app.config['TEMPLATE_BYTECODE_DIR'])
+    cold_start(bytecode)  # populate the on-disk cache
+    print(f"{'cold start, compile templates':<36} {cold_start(None) * 1000:>8.2f} ms")
+    print(f"{'cold start, bytecode cache':<36} {cold_start(bytecode) * 1000:>8.2f} ms")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,321 @@
+"""Bulk import and export of model tables as CSV or JSON Lines.
+
+``flask import projects decisions.csv`` reads the file one row at a time,
+converts and checks every value against the model's column definitions
+(type, length, required) and writes the valid rows in batches of
+``BATCH_SIZE``: through ``COPY ... FROM STDIN`` on PostgreSQL, as one
+``executemany`` INSERT elsewhere. Rows that fail validation are reported
+with their line number and skipped. A batch the database refuses (a unique
+or foreign key violation) is retried row by row, each in its own
+savepoint, so only the offending rows are reported and the rest still go
+in. Memory use is bounded by one batch, whatever the size of the file.
+
+``flask export projects`` streams the table in primary key order, through
+``COPY ... TO STDOUT`` for CSV on PostgreSQL and a server-side cursor
+otherwise.
+"""
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import NamedTuple
+
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, Numeric, String, insert, select, text
+from sqlalchemy.exc import DBAPIError
+
+BATCH_SIZE = 2000
+# Written for NULL in the CSV fed to COPY; an empty field stays an empty string
+COPY_NULL = '\\N'
+_TRUE = {'1', 'true', 't', 'yes', 'y', 'نعم'}
+_FALSE = {'0', 'false', 'f', 'no', 'n', 'لا'}
+
+
+class BulkError(ValueError):
+    """Raised for a file that cannot be imported at all (unknown columns, unknown format)."""
+
+
+class RowError(NamedTuple):
+    line: int
+    message: str
+
+
+class ImportResult(NamedTuple):
+    inserted: int
+    errors: list
+
+
+# --- Validation ---
+def _convert(column, value):
+    """Returns ``value`` converted for ``column``; raises ``ValueError`` with the reason."""
+    column_type = column.type
+    if isinstance(column_type, Boolean):
+        if isinstance(value, bool):
+            return value
+        folded = str(value).strip().lower()
+        if folded in _TRUE:
+            return True
+        if folded in _FALSE:
+            return False
+        raise ValueError('not a boolean')
+    if isinstance(column_type, Integer):
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError('not an integer')
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError('not an integer')
+    if isinstance(column_type, Float):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise ValueError('not a number')
+    if isinstance(column_type, Numeric):
+        try:
+            return Decimal(str(value))
+        except InvalidOperation:
+            raise ValueError('not a number')
+    if isinstance(column_type, DateTime):
+        if isinstance(value, datetime):
+            return value
+        try:
+            return datetime.fromisoformat(str(value).strip())
+        except ValueError:
+            raise ValueError('not an ISO date and time (YYYY-MM-DD HH:MM:SS)')
+    if isinstance(column_type, Date):
+        if isinstance(value, date):
+            return value
+        try:
+            return date.fromisoformat(str(value).strip())
+        except ValueError:
+            raise ValueError('not an ISO date (YYYY-MM-DD)')
+    value = str(value)
+    if isinstance(column_type, String) and column_type.length and len(value) > column_type.length:
+        raise ValueError(f'longer than {column_type.length} characters')
+    return value
+
+
+def _required(column):
+    return (not column.nullable and column.default is None and column.server_default is None
+            and not (column.primary_key and column.autoincrement in (True, 'auto')))
+
+
+def _default(column):
+    """The model-side default of ``column`` for an empty field, or ``None``."""
+    default = column.default
+    if default is None:
+        return None
+    if default.is_callable:
+        return default.arg(None)
+    return default.arg if default.is_scalar else None
+
+
+class RowValidator:
+    """Converts the fields of one file's rows to a model's column values."""
+
+    def __init__(self, table, fields):
+        unknown = [name for name in fields if name not in table.c]
+        if unknown:
+            raise BulkError(f"unknown column(s) for {table.name}: {', '.join(unknown)}")
+        missing = [c.name for c in table.c if _required(c) and c.name not in fields]
+        if missing:
+            raise BulkError(f"required column(s) missing from the file: {', '.join(missing)}")
+        self.fields = tuple(fields)
+        self.columns = tuple(table.c[name] for name in fields)
+        # COPY never applies model defaults: columns the file leaves out are filled here, for both paths
+        self.defaults = tuple(c for c in table.c if c.name not in fields and c.default is not None
+                              and (c.default.is_callable or c.default.is_scalar))
+        self.names = self.fields + tuple(c.name for c in self.defaults)
+
+    def __call__(self, record):
+        """Returns the converted row as a tuple in ``names`` order; raises ``ValueError``."""
+        values, problems = [], []
+        for column in self.columns:
+            value = record.get(column.name)
+            if value is None or value == '':
+                value = _default(column)
+                if value is None and not column.nullable and not column.primary_key:
+                    problems.append(f'{column.name}: required')
+                values.append(value)
+                continue
+            try:
+                values.append(_convert(column, value))
+            except ValueError as e:
+                problems.append(f'{column.name}: {e} ({value!r})')
+        if problems:
+            raise ValueError('; '.join(problems))
+        values.extend(_default(column) for column in self.defaults)
+        return tuple(values)
+
+
+# --- Reading ---
+def read_records(stream, fmt):
+    """Yields ``(line, fields, record)`` for each data row of a CSV or JSON Lines text stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            if None in record:
+                yield reader.line_num, reader.fieldnames, {None: 'too many fields'}
+            else:
+                yield reader.line_num, reader.fieldnames, record
+    elif fmt == 'jsonl':
+        for line, text_line in enumerate(stream, 1):
+            if not text_line.strip():
+                continue
+            try:
+                record = json.loads(text_line)
+            except ValueError:
+                yield line, None, {None: 'not valid JSON'}
+                continue
+            if not isinstance(record, dict):
+                yield line, None, {None: 'not a JSON object'}
+                continue
+            yield line, list(record), record
+    else:
+        raise BulkError(f'unknown format {fmt!r} (csv or jsonl)')
+
+
+def format_of(filename, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+# --- Writing ---
+def _copy_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([COPY_NULL if value is None else value for value in row])
+    buffer.seek(0)
+    return buffer
+
+
+def _write_batch(conn, table, names, batch, use_copy):
+    """Writes ``[(line, row), ...]``; returns the rows the database refused as ``RowError``s."""
+    savepoint = conn.begin_nested()
+    try:
+        if use_copy:
+            cursor = conn.connection.dbapi_connection.cursor()
+            cursor.copy_expert(
+                f"COPY {table.name} ({', '.join(names)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+                _copy_csv(row for _, row in batch))
+        else:
+            conn.execute(insert(table), [dict(zip(names, row)) for _, row in batch])
+        savepoint.commit()
+        return []
+    except (DBAPIError, conn.dialect.dbapi.Error):  # COPY goes through the raw cursor
+        savepoint.rollback()
+    errors = []
+    for line, row in batch:
+        savepoint = conn.begin_nested()
+        try:
+            conn.execute(insert(table), [dict(zip(names, row))])
+            savepoint.commit()
+        except DBAPIError as e:
+            savepoint.rollback()
+            errors.append(RowError(line, str(e.orig).strip().splitlines()[0]))
+    return errors
+
+
+def import_rows(engine, table, records, dry_run=False, batch_size=BATCH_SIZE, on_error=None, ignore_fields=()):
+    """Validates and inserts ``records`` (from :func:`read_records`) in one transaction.
+
+    ``on_error(RowError)`` is called for every rejected row as it is found.
+    Fields named in ``ignore_fields`` are dropped from every record, so the
+    columns get their defaults instead.
+    """
+    errors = []
+
+    def reject(line, message):
+        error = RowError(line, message)
+        errors.append(error)
+        if on_error is not None:
+            on_error(error)
+
+    use_copy = engine.dialect.name == 'postgresql'
+    # One validator per distinct set of fields: JSON Lines rows may each name different ones
+    validators, validator, inserted, batch = {}, None, 0, []
+    with engine.begin() as conn:
+        for line, fields, record in records:
+            if None in record:
+                reject(line, record[None])
+                continue
+            if ignore_fields:
+                fields = [name for name in fields if name not in ignore_fields]
+            key = tuple(fields)
+            if validator is None or key != validator.fields:
+                try:
+                    row_validator = validators.get(key) or validators.setdefault(key, RowValidator(table, fields))
+                except BulkError as e:
+                    if not validators:
+                        raise  # the header, or the first record: nothing in the file will fit
+                    reject(line, str(e))
+                    continue
+                if batch:
+                    inserted += _flush(conn, table, validator.names, batch, use_copy, dry_run, reject)
+                    batch = []
+                validator = row_validator
+            try:
+                batch.append((line, validator(record)))
+            except ValueError as e:
+                reject(line, str(e))
+                continue
+            if len(batch) >= batch_size:
+                inserted += _flush(conn, table, validator.names, batch, use_copy, dry_run, reject)
+                batch = []
+        if batch:
+            inserted += _flush(conn, table, validator.names, batch, use_copy, dry_run, reject)
+        if use_copy and not dry_run and any('id' in names for names in validators):
+            # Explicit ids do not advance the serial sequence
+            conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table.name}', 'id'), "
+                              f"GREATEST((SELECT max(id) FROM {table.name}), 1))"))
+    return ImportResult(inserted, errors)
+
+
+def _flush(conn, table, names, batch, use_copy, dry_run, reject):
+    if dry_run:
+        return len(batch)
+    refused = _write_batch(conn, table, names, batch, use_copy)
+    for error in refused:
+        reject(*error)
+    return len(batch) - len(refused)
+
+
+# --- Export ---
+def _json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def export_rows(engine, table, out, fmt):
+    """Writes every row of ``table`` to the text stream ``out``; returns the row count."""
+    names = [c.name for c in table.c]
+    with engine.connect() as conn:
+        if fmt == 'csv' and engine.dialect.name == 'postgresql':
+            cursor = conn.connection.dbapi_connection.cursor()
+            cursor.copy_expert(f"COPY (SELECT {', '.join(names)} FROM {table.name} ORDER BY id) "
+                               f"TO STDOUT WITH (FORMAT csv, HEADER)", out)
+            return cursor.rowcount
+        if fmt not in ('csv', 'jsonl'):
+            raise BulkError(f'unknown format {fmt!r} (csv or jsonl)')
+        result = conn.execution_options(stream_results=True, yield_per=BATCH_SIZE).execute(
+            select(table).order_by(table.c.id))
+        count = 0
+        if fmt == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(names)
+            for row in result:
+                # str() of dates and datetimes is the ISO form the importer reads back
+                writer.writerow(['' if value is None else value for value in row])
+                count += 1
+        else:
+            for row in result:
+                out.write(json.dumps({name: _json_value(value) for name, value in zip(names, row)},
+                                     ensure_ascii=False))
+                out.write('\n')
+                count += 1
+        return count
@@ -0,0 +1,222 @@
+"""SQLAlchemy engine/pool settings from the environment, plus pool metrics.
+
+Environment variables (all optional):
+
+* ``DB_POOL_SIZE`` / ``DB_MAX_OVERFLOW`` -- persistent and burst connections
+  per worker process (defaults 5 / 5).
+* ``DB_POOL_TIMEOUT`` -- seconds a request waits for a free connection (10).
+* ``DB_POOL_RECYCLE`` -- seconds before a connection is replaced (1800).
+* ``DB_POOL_PRE_PING`` -- test connections on checkout so a Postgres restart
+  costs one reconnect instead of failed requests (on).
+* ``DB_STATEMENT_TIMEOUT_MS`` -- server-side statement timeout (off).
+* ``DB_APPLICATION_NAME`` -- shown in ``pg_stat_activity`` (municipality-web).
+* ``DB_POOL_MODE`` -- ``queue`` (default) or ``null`` to open a connection per
+  checkout, for use behind an external pooler.
+* ``DB_PGBOUNCER`` -- transaction-pooling compatibility: no startup
+  parameters and no session state; the statement timeout is applied with
+  ``SET LOCAL`` at the start of every transaction instead.
+
+Sizing rule of thumb: ``workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW)`` plus
+one LISTEN connection per worker must stay below ``max_connections``. The
+ASGI server (app_asgi.py) opens a second, async pool of the same size per
+worker process.
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.pool import NullPool, QueuePool
+
+logger = logging.getLogger(__name__)
+
+TRUE_VALUES = ('1', 'true', 'yes', 'on')
+# Checkouts slower than this are logged; they mean the pool is undersized
+SLOW_CHECKOUT_SECONDS = 0.5
+
+
+def _flag(env, name, default):
+    return str(env.get(name, default)).strip().lower() in TRUE_VALUES
+
+
+class PoolMetrics:
+    """Per-process counters for connection checkouts and time spent waiting."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.pool = None
+        # Called with each checkout's wait, to charge it to the current request
+        self.on_wait = None
+
+    def record_wait(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+        if self.on_wait is not None:
+            self.on_wait(seconds)
+        if seconds >= SLOW_CHECKOUT_SECONDS:
+            logger.warning('Waited %.3fs for a database connection; consider raising DB_POOL_SIZE', seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self):
+        """Returns the counters plus the pool's current occupancy."""
+        with self._lock:
+            data = {
+                'checkouts': self.checkouts,
+                'connects': self.connects,
+                'invalidations': self.invalidations,
+                'timeouts': self.timeouts,
+                'wait_seconds_total': round(self.wait_total, 6),
+                'wait_seconds_max': round(self.wait_max, 6),
+                'wait_seconds_avg': round(self.wait_total / self.checkouts, 6) if self.checkouts else 0.0,
+            }
+        pool = self.pool
+        if isinstance(pool, QueuePool):
+            data.update(pool_size=pool.size(), checked_out=pool.checkedout(),
+                        checked_in=pool.checkedin(), overflow=pool.overflow())
+        return data
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedQueuePool(QueuePool):
+    """A QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            pool_metrics.record_timeout()
+            raise
+        pool_metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+
+class TimedNullPool(NullPool):
+    def _do_get(self):
+        started = time.perf_counter()
+        connection = super()._do_get()
+        pool_metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+
+def engine_options_from_env(env, database_url):
+    """Builds ``SQLALCHEMY_ENGINE_OPTIONS`` for ``database_url`` from ``env``."""
+    if not (database_url or '').startswith('postgres'):
+        # SQLite (dev/benchmarks) keeps Flask-SQLAlchemy's own pool choice
+        return {}
+
+    pgbouncer = _flag(env, 'DB_PGBOUNCER', False)
+    options = {'pool_pre_ping': _flag(env, 'DB_POOL_PRE_PING', True)}
+    if env.get('DB_POOL_MODE', 'queue') == 'null':
+        options['poolclass'] = TimedNullPool
+    else:
+        options.update(
+            poolclass=TimedQueuePool,
+            pool_size=int(env.get('DB_POOL_SIZE', 5)),
+            max_overflow=int(env.get('DB_MAX_OVERFLOW', 5)),
+            pool_timeout=float(env.get('DB_POOL_TIMEOUT', 10)),
+            pool_recycle=int(env.get('DB_POOL_RECYCLE', 1800)),
+        )
+
+    connect_args = {}
+    timeout_ms = env.get('DB_STATEMENT_TIMEOUT_MS')
+    if not pgbouncer:
+        # PgBouncer rejects unknown startup parameters in transaction mode
+        connect_args['application_name'] = env.get('DB_APPLICATION_NAME', 'municipality-web')
+        if timeout_ms:
+            connect_args['options'] = f'-c statement_timeout={int(timeout_ms)}'
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def async_engine_options_from_env(env, database_url):
+    """:func:`engine_options_from_env` for an asyncpg engine (``create_async_engine``)."""
+    if not str(database_url or '').startswith('postgres'):
+        return {}
+
+    pgbouncer = _flag(env, 'DB_PGBOUNCER', False)
+    options = {'pool_pre_ping': _flag(env, 'DB_POOL_PRE_PING', True)}
+    if env.get('DB_POOL_MODE', 'queue') == 'null':
+        options['poolclass'] = NullPool
+    else:
+        options.update(
+            pool_size=int(env.get('DB_POOL_SIZE', 5)),
+            max_overflow=int(env.get('DB_MAX_OVERFLOW', 5)),
+            pool_timeout=float(env.get('DB_POOL_TIMEOUT', 10)),
+            pool_recycle=int(env.get('DB_POOL_RECYCLE', 1800)),
+        )
+
+    timeout_ms = env.get('DB_STATEMENT_TIMEOUT_MS')
+    if pgbouncer:
+        # asyncpg prepares every statement; in transaction mode the next
+        # transaction may land on another server connection, so no statement
+        # cache and unique names for the unnamed prepares
+        options['connect_args'] = {
+            'statement_cache_size': 0,
+            'prepared_statement_cache_size': 0,
+            'prepared_statement_name_func': lambda: f'__asyncpg_{uuid.uuid4()}__',
+        }
+    else:
+        server_settings = {'application_name': env.get('DB_APPLICATION_NAME', 'municipality-web') + '-async'}
+        if timeout_ms:
+            server_settings['statement_timeout'] = str(int(timeout_ms))
+        options['connect_args'] = {'server_settings': server_settings}
+    return options
+
+
+def instrument_engine(engine, env):
+    """Attaches pool metrics and the PgBouncer per-transaction timeout to ``engine``."""
+    pool_metrics.pool = engine.pool
+
+    @event.listens_for(engine, 'connect')
+    def count_connect(dbapi_connection, connection_record):
+        pool_metrics.connects += 1
+
+    @event.listens_for(engine, 'invalidate')
+    def count_invalidate(dbapi_connection, connection_record, exception):
+        pool_metrics.invalidations += 1
+
+    apply_pgbouncer_timeout(engine, env)
+
+
+def dispose_after_fork(*engines):
+    """Gives forked children (``gunicorn --preload`` workers) connection pools of their own.
+
+    The inherited connections still belong to the parent, so the child only
+    forgets them (``close=False``) and opens its own on first use.
+    """
+    def reset():
+        for engine in engines:
+            old_pool = engine.pool
+            engine.dispose(close=False)
+            if pool_metrics.pool is old_pool:
+                pool_metrics.pool = engine.pool
+
+    os.register_at_fork(after_in_child=reset)
+
+
+def apply_pgbouncer_timeout(engine, env):
+    """In PgBouncer mode, sets the statement timeout at the start of every transaction."""
+    timeout_ms = env.get('DB_STATEMENT_TIMEOUT_MS')
+    if _flag(env, 'DB_PGBOUNCER', False) and timeout_ms:
+        statement = f'SET LOCAL statement_timeout = {int(timeout_ms)}'
+
+        @event.listens_for(engine, 'begin')
+        def set_local_timeout(conn):
+            conn.exec_driver_sql(statement)
@@ -0,0 +1,340 @@
+"""Document storage for the PDFs linked from deliberations, decisions and announcements.
+
+Files are stored once by the SHA-256 of their content and served at
+``/documents/<sha256>.<ext>``, so the same minutes uploaded twice take the
+space of one and a URL never changes meaning.
+
+``DOCUMENT_STORAGE`` picks the backend:
+
+``local`` (default)
+    ``DOCUMENT_STORE_DIR`` on the server's disk. Downloads go through
+    ``send_file``: ``Range``/``If-Range`` requests get ``206`` partial
+    content so interrupted downloads resume, the hash is the ETag, and the
+    body is handed to ``wsgi.file_wrapper`` (``sendfile`` under gunicorn)
+    or, with ``STATIC_X_SENDFILE``, to the front proxy.
+
+``s3``
+    ``DOCUMENT_S3_BUCKET`` (optionally under ``DOCUMENT_S3_PREFIX``) on
+    any S3-compatible service; ``DOCUMENT_S3_ENDPOINT_URL`` points it at
+    MinIO or another local stand-in. Needs the ``boto3`` package. Downloads
+    are redirected to a short-lived presigned URL, and the object store
+    answers the range and conditional requests itself.
+
+Large files are uploaded in chunks (see :class:`ChunkedUploads`): the
+admin forms send them with ``static/js/admin-upload.js`` in pieces that can
+be retried, and a plain form upload still works without JavaScript.
+"""
+import fcntl
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from urllib.parse import quote
+
+from flask import abort, redirect, send_file
+
+from assets import ONE_YEAR, immutable
+
+DEFAULT_EXTENSIONS = 'pdf,doc,docx,xls,xlsx,ppt,pptx,odt,ods,txt,zip'
+COPY_BUFFER = 1024 * 1024
+URL_PREFIX = '/documents'
+
+
+class DocumentError(ValueError):
+    """Raised for uploads that are too large, of a type not accepted, or out of order."""
+
+
+def _hash_file(fileobj):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(COPY_BUFFER), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+# --- Storage backends ---
+class LocalStorage:
+    """Keeps documents in a directory, two hash characters per subdirectory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def put_file(self, key, path, content_type):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f'{target}.{uuid.uuid4().hex}.tmp'
+        shutil.copyfile(path, tmp)
+        os.replace(tmp, target)
+
+    def get_bytes(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_bytes(self, key, data):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(target), prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, target)
+
+    def send(self, key, meta):
+        response = send_file(self._path(key), mimetype=meta['content_type'], download_name=meta['filename'],
+                             conditional=True, etag=key)
+        # Werkzeug only advertises ranges on a range response; download managers look for it up front
+        response.headers['Accept-Ranges'] = 'bytes'
+        return immutable(response)
+
+
+class S3Storage:
+    """Keeps documents in an S3 bucket and redirects downloads to presigned URLs."""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None, url_ttl=3600):
+        try:
+            import boto3
+        except ImportError:
+            raise RuntimeError('DOCUMENT_STORAGE=s3 requires the boto3 package')
+        self.bucket = bucket
+        self.prefix = prefix
+        self.url_ttl = url_ttl
+        self.client = boto3.client('s3', endpoint_url=endpoint_url or None, region_name=region or None)
+
+    def _key(self, key):
+        return f'{self.prefix}{key[:2]}/{key}'
+
+    def exists(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+    def put_file(self, key, path, content_type):
+        # boto3 switches to a multipart upload for large files
+        self.client.upload_file(path, self.bucket, self._key(key), ExtraArgs={
+            'ContentType': content_type, 'CacheControl': f'public, max-age={ONE_YEAR}, immutable'})
+
+    def get_bytes(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body'].read()
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def put_bytes(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self._key(key), Body=data)
+
+    def send(self, key, meta):
+        url = self.client.generate_presigned_url('get_object', ExpiresIn=self.url_ttl, Params={
+            'Bucket': self.bucket, 'Key': self._key(key),
+            'ResponseContentType': meta['content_type'],
+            'ResponseContentDisposition': _content_disposition(meta['filename']),
+        })
+        response = redirect(url, code=302)
+        # Presigned URLs expire, so the redirect may only be reused briefly
+        response.cache_control.private = True
+        response.cache_control.max_age = max(0, self.url_ttl // 2)
+        return response
+
+
+def _content_disposition(filename):
+    return f"inline; filename*=UTF-8''{quote(filename)}"
+
+
+# --- Chunked uploads ---
+class ChunkedUploads:
+    """Upload sessions on local disk that receive a file in sequential chunks.
+
+    A session is a file under ``directory`` named by a random id, so any
+    worker can take the next chunk. Each chunk says where it starts; a chunk
+    that does not start at the current size is refused with that size, so
+    the client knows where to resume.
+    """
+
+    def __init__(self, directory, max_bytes, max_age=24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+
+    def _path(self, upload_id):
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id or ''):
+            raise DocumentError('unknown upload')
+        return os.path.join(self.directory, upload_id)
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.expire()
+        upload_id = uuid.uuid4().hex
+        open(self._path(upload_id), 'xb').close()
+        return upload_id
+
+    def size(self, upload_id):
+        try:
+            return os.path.getsize(self._path(upload_id))
+        except FileNotFoundError:
+            raise DocumentError('unknown upload')
+
+    def append(self, upload_id, offset, stream, length):
+        """Writes ``length`` bytes of ``stream`` at ``offset``; returns the new size."""
+        try:
+            f = open(self._path(upload_id), 'r+b')
+        except FileNotFoundError:
+            raise DocumentError('unknown upload')
+        with f:
+            # Two retries of the same chunk must not both pass the offset check and both write
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+            size = os.fstat(f.fileno()).st_size
+            if offset != size:
+                raise DocumentError(f'expected offset {size}')
+            if size + length > self.max_bytes:
+                raise DocumentError('document is too large')
+            f.seek(size)
+            remaining = length
+            while remaining > 0:
+                chunk = stream.read(min(COPY_BUFFER, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+            f.flush()
+            if remaining:
+                # The client went away mid-chunk: drop the partial write so the chunk can be resent
+                f.truncate(size)
+                raise DocumentError('incomplete chunk')
+        return size + length
+
+    def path(self, upload_id):
+        self.size(upload_id)
+        return self._path(upload_id)
+
+    def discard(self, upload_id):
+        try:
+            os.remove(self._path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    def expire(self):
+        """Removes sessions nobody has written to for ``max_age`` seconds."""
+        cutoff = time.time() - self.max_age
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+# --- Extension ---
+class DocumentStore:
+    """Content-addressed document storage with resumable downloads (Flask extension)."""
+
+    def __init__(self, app=None):
+        self.storage = None
+        self.uploads = None
+        self.extensions = ()
+        self.max_bytes = 200 * 1024 * 1024
+        self._meta = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        env = os.environ
+        config = app.config
+        directory = config.setdefault('DOCUMENT_STORE_DIR', env.get(
+            'DOCUMENT_STORE_DIR', os.path.join(app.root_path, 'data', 'documents')))
+        backend = config.setdefault('DOCUMENT_STORAGE', env.get('DOCUMENT_STORAGE', 'local'))
+        if backend == 's3':
+            self.storage = S3Storage(
+                config.setdefault('DOCUMENT_S3_BUCKET', env.get('DOCUMENT_S3_BUCKET')),
+                prefix=config.setdefault('DOCUMENT_S3_PREFIX', env.get('DOCUMENT_S3_PREFIX', '')),
+                endpoint_url=config.setdefault('DOCUMENT_S3_ENDPOINT_URL', env.get('DOCUMENT_S3_ENDPOINT_URL')),
+                region=config.setdefault('DOCUMENT_S3_REGION', env.get('DOCUMENT_S3_REGION')),
+                url_ttl=int(config.setdefault('DOCUMENT_S3_URL_TTL', env.get('DOCUMENT_S3_URL_TTL', 3600))))
+        elif backend == 'local':
+            self.storage = LocalStorage(directory)
+        else:
+            raise RuntimeError(f'unknown DOCUMENT_STORAGE {backend!r}')
+        self.extensions = tuple(ext.strip().lower() for ext in str(config.setdefault(
+            'DOCUMENT_EXTENSIONS', env.get('DOCUMENT_EXTENSIONS', DEFAULT_EXTENSIONS))).split(',') if ext.strip())
+        self.max_bytes = int(config.setdefault('DOCUMENT_MAX_BYTES', env.get('DOCUMENT_MAX_BYTES', 200 * 1024 * 1024)))
+        # Upload sessions always stay on local disk, shared by the workers of this host
+        self.uploads = ChunkedUploads(os.path.join(directory, 'uploads'), self.max_bytes)
+
+        app.add_url_rule(f'{URL_PREFIX}/<digest>.<ext>', 'document_download', self.send_document)
+        app.extensions['document_store'] = self
+
+    def extension(self, filename):
+        """Returns the accepted extension of ``filename``; raises :class:`DocumentError` otherwise."""
+        ext = os.path.splitext(filename or '')[1].lstrip('.').lower()
+        if ext not in self.extensions:
+            raise DocumentError('file type not accepted')
+        return ext
+
+    def store_path(self, path, filename):
+        """Stores the file at ``path`` under its content hash and returns its URL."""
+        ext = self.extension(filename)
+        if os.path.getsize(path) > self.max_bytes:
+            raise DocumentError('document is too large')
+        with open(path, 'rb') as f:
+            digest = _hash_file(f)
+        content_type = mimetypes.guess_type(f'x.{ext}')[0] or 'application/octet-stream'
+        if not self.storage.exists(digest):
+            self.storage.put_file(digest, path, content_type)
+        # The sidecar names the first upload; later duplicates share its file and name
+        if self.meta(digest) is None:
+            meta = {'filename': os.path.basename(filename), 'content_type': content_type, 'ext': ext,
+                    'size': os.path.getsize(path)}
+            self.storage.put_bytes(f'{digest}.json', json.dumps(meta, ensure_ascii=False).encode('utf-8'))
+            self._meta[digest] = meta
+        return f'{URL_PREFIX}/{digest}.{self.meta(digest)["ext"]}'
+
+    def store(self, file_storage):
+        """Stores an uploaded ``FileStorage`` and returns its URL."""
+        self.extension(file_storage.filename)
+        fd, tmp = tempfile.mkstemp(prefix='document-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(file_storage.stream, f, COPY_BUFFER)
+            return self.store_path(tmp, file_storage.filename)
+        finally:
+            os.remove(tmp)
+
+    def finish_upload(self, upload_id, filename):
+        """Stores a completed chunked upload and returns its URL."""
+        try:
+            return self.store_path(self.uploads.path(upload_id), filename)
+        finally:
+            self.uploads.discard(upload_id)
+
+    def meta(self, digest):
+        meta = self._meta.get(digest)
+        if meta is None:
+            data = self.storage.get_bytes(f'{digest}.json')
+            if data is None:
+                return None
+            meta = self._meta[digest] = json.loads(data)
+        return meta
+
+    def send_document(self, digest, ext):
+        meta = self.meta(digest) if re.fullmatch(r'[0-9a-f]{64}', digest) else None
+        if meta is None or meta['ext'] != ext:
+            abort(404)
+        return self.storage.send(digest, meta)
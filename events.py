@@ -0,0 +1,309 @@
+"""Change-event bus: tells every gunicorn worker which rows were written.
+
+Writes are picked up from SQLAlchemy session events (so Flask-Admin saves,
+registrations and CLI imports are all covered), turned into typed
+:class:`ChangeEvent` objects once the transaction commits, delivered to the
+local subscribers and fanned out to the other workers through a transport:
+
+* ``postgres`` -- ``pg_notify`` on a channel, with one LISTEN connection per
+  worker.
+* ``socket``   -- datagrams between per-worker Unix sockets in a shared
+  directory; the fallback for SQLite/dev.
+* ``none``     -- local delivery only.
+
+``CHANGE_BUS_TRANSPORT=auto`` (the default) picks ``postgres`` when the
+database is PostgreSQL and ``socket`` otherwise. Listener threads start on
+the first request, never at import time, so CLI commands and a preloading
+master stay thread-free.
+"""
+import json
+import logging
+import os
+import select
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from typing import NamedTuple, Optional
+
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+# Above this many rows in one commit a table is reported as a single bulk event
+BULK_THRESHOLD = 100
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+
+class ChangeEvent(NamedTuple):
+    """One committed write: table name, primary key (None for bulk) and operation."""
+    model: str
+    pk: Optional[int]
+    op: str  # 'insert', 'update', 'delete' or 'bulk'
+    origin: str = ''
+
+    def to_json(self):
+        return [self.model, self.pk, self.op, self.origin]
+
+    @classmethod
+    def from_json(cls, value):
+        return cls(*value)
+
+
+def coalesce(events, threshold=BULK_THRESHOLD):
+    """Drops duplicates and collapses large per-table batches into bulk events."""
+    unique = list(dict.fromkeys(events))
+    per_model = {}
+    for e in unique:
+        per_model[e.model] = per_model.get(e.model, 0) + 1
+    result, bulked = [], set()
+    for e in unique:
+        if per_model[e.model] > threshold:
+            if e.model not in bulked:
+                bulked.add(e.model)
+                result.append(ChangeEvent(e.model, None, 'bulk', e.origin))
+        else:
+            result.append(e)
+    return result
+
+
+# --- Transports ---
+class NullTransport:
+    def send(self, events):
+        pass
+
+    def start(self, deliver):
+        pass
+
+    def after_fork(self):
+        pass
+
+
+class PostgresNotifyTransport:
+    """Fans events out with NOTIFY and receives them on a dedicated LISTEN connection."""
+
+    def __init__(self, url, channel='municipality_changes'):
+        # A private NullPool engine keeps the long-lived LISTEN connection and
+        # the NOTIFY round-trips out of the request pool.
+        self.engine = create_engine(url, poolclass=NullPool)
+        self.channel = channel
+
+    def send(self, events):
+        payloads, batch, size = [], [], 2
+        for e in events:
+            item = json.dumps(e.to_json())
+            if batch and size + len(item) + 1 > NOTIFY_PAYLOAD_LIMIT:
+                payloads.append('[' + ','.join(batch) + ']')
+                batch, size = [], 2
+            batch.append(item)
+            size += len(item) + 1
+        if batch:
+            payloads.append('[' + ','.join(batch) + ']')
+        with self.engine.begin() as conn:
+            for payload in payloads:
+                conn.execute(text('SELECT pg_notify(:channel, :payload)'),
+                             {'channel': self.channel, 'payload': payload})
+
+    def start(self, deliver):
+        threading.Thread(target=self._listen, args=(deliver,), name='change-bus-listen', daemon=True).start()
+
+    def after_fork(self):
+        self.engine.dispose(close=False)
+
+    def _listen(self, deliver):
+        backoff = 1
+        while True:
+            raw = None
+            try:
+                raw = self.engine.raw_connection()
+                dbapi_conn = raw.driver_connection
+                dbapi_conn.autocommit = True
+                with dbapi_conn.cursor() as cur:
+                    cur.execute(f'LISTEN {self.channel}')
+                backoff = 1
+                while True:
+                    if select.select([dbapi_conn], [], [], 30) == ([], [], []):
+                        continue
+                    dbapi_conn.poll()
+                    while dbapi_conn.notifies:
+                        notify = dbapi_conn.notifies.pop(0)
+                        # Only a lost connection should end the LISTEN
+                        try:
+                            deliver([ChangeEvent.from_json(v) for v in json.loads(notify.payload)])
+                        except Exception:
+                            logger.exception('Dropping change bus notification %r', notify.payload)
+            except Exception:
+                logger.exception('Change bus LISTEN connection lost; reconnecting in %ss', backoff)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+
+class LocalSocketTransport:
+    """Datagram fan-out between the workers of one host via Unix sockets."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.path = self._new_path()
+        self.sock = None
+
+    def _new_path(self):
+        return os.path.join(self.directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.sock')
+
+    def send(self, events):
+        payload = json.dumps([e.to_json() for e in events]).encode('utf-8')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as out:
+            for name in os.listdir(self.directory):
+                peer = os.path.join(self.directory, name)
+                if not name.endswith('.sock') or peer == self.path:
+                    continue
+                try:
+                    out.sendto(payload, peer)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # The worker that owned this socket has exited
+                    try:
+                        os.remove(peer)
+                    except FileNotFoundError:
+                        pass
+                except OSError:
+                    logger.warning('Could not deliver change events to %s', peer)
+
+    def start(self, deliver):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        threading.Thread(target=self._listen, args=(deliver,), name='change-bus-listen', daemon=True).start()
+
+    def after_fork(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        self.path = self._new_path()
+
+    def _listen(self, deliver):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+                deliver([ChangeEvent.from_json(v) for v in json.loads(data)])
+            except Exception:
+                logger.exception('Dropping malformed change bus datagram')
+
+
+# --- Bus ---
+class ChangeBus:
+    """Flask extension collecting committed writes and dispatching them to subscribers."""
+
+    def __init__(self, app=None, db=None):
+        self.origin = self._new_origin()
+        self.transport = NullTransport()
+        self._subscribers = []
+        self._started = False
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        mode = app.config.setdefault('CHANGE_BUS_TRANSPORT', os.environ.get('CHANGE_BUS_TRANSPORT', 'auto'))
+        # LISTEN needs a session-level connection, so behind PgBouncer in
+        # transaction mode point CHANGE_BUS_DATABASE_URL at Postgres directly
+        url = (app.config.get('CHANGE_BUS_DATABASE_URL') or os.environ.get('CHANGE_BUS_DATABASE_URL')
+               or app.config.get('SQLALCHEMY_DATABASE_URI') or '')
+        if mode == 'auto':
+            mode = 'postgres' if url.startswith('postgres') else 'socket'
+        if mode == 'postgres':
+            self.transport = PostgresNotifyTransport(url)
+        elif mode == 'socket':
+            directory = app.config.setdefault('CHANGE_BUS_SOCKET_DIR', os.environ.get(
+                'CHANGE_BUS_SOCKET_DIR', os.path.join(tempfile.gettempdir(), 'municipality-change-bus')))
+            self.transport = LocalSocketTransport(directory)
+        elif mode != 'none':
+            raise RuntimeError(f'Unknown CHANGE_BUS_TRANSPORT: {mode}')
+
+        event.listen(db.session, 'after_flush', self._collect)
+        event.listen(db.session, 'after_commit', self._after_commit)
+        event.listen(db.session, 'after_soft_rollback', self._after_rollback)
+        app.before_request(self.start)
+        os.register_at_fork(after_in_child=self._after_fork)
+        app.extensions['change_bus'] = self
+
+    @staticmethod
+    def _new_origin():
+        return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+    def _after_fork(self):
+        # A worker forked from a preloaded master is a peer of its own: new
+        # origin (is_local), new socket, and a listener of its own on first request
+        self.origin = self._new_origin()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self.transport.after_fork()
+
+    def start(self):
+        """Starts the transport listener once per process."""
+        if self._started:
+            return
+        with self._start_lock:
+            if not self._started:
+                self.transport.start(self._deliver_remote)
+                self._started = True
+
+    def subscribe(self, handler, models=None):
+        """Registers ``handler(event)`` for all tables or only those in ``models``."""
+        self._subscribers.append((handler, frozenset(models) if models else None))
+        return handler
+
+    def is_local(self, change):
+        return change.origin == self.origin
+
+    def publish(self, events):
+        """Delivers events to this worker's subscribers and then to the other workers."""
+        events = coalesce([e._replace(origin=self.origin) for e in events])
+        if not events:
+            return
+        self._dispatch(events)
+        try:
+            self.transport.send(events)
+        except Exception:
+            logger.exception('Failed to fan out %d change events', len(events))
+
+    # --- Session hooks ---
+    def _collect(self, session, flush_context):
+        pending = session.info.setdefault('change_events', [])
+        for op, objects in (('insert', session.new), ('update', session.dirty), ('delete', session.deleted)):
+            for obj in objects:
+                if op == 'update' and not session.is_modified(obj, include_collections=False):
+                    continue
+                state = inspect(obj)
+                key = state.mapper.primary_key_from_instance(obj)
+                pending.append(ChangeEvent(state.mapper.local_table.name,
+                                           key[0] if len(key) == 1 else tuple(key), op))
+
+    def _after_commit(self, session):
+        events = session.info.pop('change_events', None)
+        if events:
+            self.publish(events)
+
+    def _after_rollback(self, session, previous_transaction):
+        if previous_transaction.parent is None:
+            session.info.pop('change_events', None)
+
+    # --- Delivery ---
+    def _deliver_remote(self, events):
+        self._dispatch([e for e in events if e.origin != self.origin])
+
+    def _dispatch(self, events):
+        for handler, models in self._subscribers:
+            for change in events:
+                if models is not None and change.model not in models:
+                    continue
+                try:
+                    handler(change)
+                except Exception:
+                    logger.exception('Change bus subscriber %r failed for %r', handler, change)
@@ -0,0 +1,97 @@
+"""Template bytecode caching and ``{% cache %}`` fragment caching for Jinja.
+
+Compiled templates are kept in ``TEMPLATE_BYTECODE_DIR`` (checksummed
+against the template source by Jinja), so a restarted or newly forked
+worker loads bytecode instead of parsing and compiling every template
+again.
+
+A fragment is rendered once per key and then reused::
+
+    {% cache 'announcement-card', announcement.id, announcement.updated_at %}
+        ...
+    {% endcache %}
+
+Keys are the listed values plus the deploy fingerprint, so nothing is ever
+deleted: when a key part changes (a row's ``updated_at``, the logged-in
+state, the year) the old fragment stops being addressed and ages out of the
+per-process LRU. For content without such a column,
+``fragment_version(*scopes)`` returns the response-cache version tokens of
+``scopes``, i.e. a "last modified" for the rows they name.
+"""
+import json
+import os
+import tempfile
+from datetime import datetime, timezone
+
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+
+from response_cache import LRUStore, deploy_fingerprint
+
+
+class FragmentCacheExtension(Extension):
+    """Adds ``{% cache key, ... %}...{% endcache %}`` to the environment."""
+
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=None)
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            key.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render', [nodes.List(key)]), [], [], body).set_lineno(lineno)
+
+    def _render(self, key, caller):
+        cache = self.environment.fragment_cache
+        if cache is None:
+            return caller()
+        return cache.get_or_render(key, caller)
+
+
+class FragmentCache:
+    """Flask extension: bytecode cache plus the per-process fragment store."""
+
+    def __init__(self, app=None):
+        self.store = None
+        self.namespace = ''
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        env = os.environ
+        self.store = LRUStore(int(app.config.setdefault(
+            'FRAGMENT_CACHE_MAX_ENTRIES', env.get('FRAGMENT_CACHE_MAX_ENTRIES', 2048))))
+        self.namespace = deploy_fingerprint(app)
+        directory = app.config.setdefault('TEMPLATE_BYTECODE_DIR', env.get(
+            'TEMPLATE_BYTECODE_DIR', os.path.join(tempfile.gettempdir(), 'municipality-jinja-bytecode')))
+        os.makedirs(directory, exist_ok=True)
+
+        jinja_env = app.jinja_env
+        jinja_env.bytecode_cache = FileSystemBytecodeCache(directory)
+        jinja_env.add_extension(FragmentCacheExtension)
+        jinja_env.fragment_cache = self
+        jinja_env.globals['current_year'] = current_year
+        response_cache = app.extensions.get('response_cache')
+        if response_cache is not None:
+            jinja_env.globals['fragment_version'] = lambda *scopes: '.'.join(response_cache.versions(scopes))
+        app.extensions['fragment_cache'] = self
+
+    def get_or_render(self, key, render):
+        key = json.dumps([self.namespace, *key], default=str, ensure_ascii=False)
+        fragment = self.store.get(key)
+        if fragment is None:
+            fragment = render()
+            self.store.set(key, fragment)
+        return fragment
+
+    def clear(self):
+        self.store.clear()
+
+
+def current_year():
+    return datetime.now(timezone.utc).year
@@ -0,0 +1,369 @@
+"""Responsive image derivatives, stored content-addressed and made on first request.
+
+Uploaded images (and images already under ``static/``) are stored once
+under ``IMAGE_STORE_DIR`` by the SHA-1 of their bytes::
+
+    originals/ab/ab12....jpg        the uploaded file, served at /images/ab12....jpg
+    originals/ab/ab12....json       its size and whether it has transparency
+    derived/ab/ab12.../640.webp     one width in one format, served at /images/ab12.../640.webp
+
+A derivative is rendered by Pillow in a small process pool the first time it
+is requested and is a plain immutable file after that, for every worker.
+Concurrent requests for the same file share one job; when the pool is full
+or a job takes longer than ``IMAGE_TIMEOUT`` the request is redirected to the
+original, so a page never waits on an image. An upload queues its
+derivatives right away.
+
+Templates call ``image_variants(url)`` (see ``templates/_images.html``) and
+the JSON APIs carry a ``*_srcset`` next to each image URL. URLs that are
+neither in the store nor in ``static/`` (remote images) are left as they are.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from io import BytesIO
+from typing import NamedTuple
+
+from flask import abort, has_request_context, redirect, request, send_file
+from werkzeug.security import safe_join
+
+from assets import immutable
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WIDTHS = '320,640,1024'
+# Offered through <source> when Pillow can write them, best first
+DEFAULT_FORMATS = 'avif,webp'
+MIMETYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg', 'png': 'image/png'}
+# Pillow format -> extension of the stored original
+ORIGINAL_TYPES = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+QUALITY = {'avif': 55, 'webp': 75, 'jpeg': 80}
+URL_PREFIX = '/images'
+_STORE_URL = re.compile(r'^/images/([0-9a-f]{40})\.(?:jpg|png|webp|gif)$')
+
+
+class ImageError(ValueError):
+    """Raised for uploads that are not a supported image or are too large."""
+
+
+class ImageBusy(RuntimeError):
+    """Raised when the derivative queue is full."""
+
+
+class ImageInfo(NamedTuple):
+    digest: str
+    ext: str
+    width: int
+    height: int
+    alpha: bool
+
+    @property
+    def fallback(self):
+        """Format for browsers without AVIF/WebP: PNG keeps transparency, JPEG otherwise."""
+        return 'png' if self.alpha else 'jpeg'
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _render(source, target, width, fmt):
+    """Writes ``source`` scaled to ``width`` pixels as ``fmt`` (runs in the pool)."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.width > width:
+            image.thumbnail((width, image.height), Image.LANCZOS)
+        if fmt == 'jpeg':
+            image = image.convert('RGB')
+        elif image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            image = image.convert('RGBA')
+        out = BytesIO()
+        options = {'optimize': True} if fmt == 'png' else {'quality': QUALITY[fmt]}
+        if fmt == 'jpeg':
+            options['progressive'] = True
+        image.save(out, format=fmt.upper(), **options)
+    _write_atomic(target, out.getvalue())
+
+
+class ImageStore:
+    """Content-addressed image store with lazily rendered derivatives (Flask extension)."""
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.widths = ()
+        self.formats = ()
+        self.workers = 1
+        self.max_pending = 16
+        self.timeout = 5.0
+        self.max_bytes = 10 * 1024 * 1024
+        self.max_pixels = 40_000_000
+        self._info = {}
+        self._static = {}
+        self._pending = {}
+        self._executor = None
+        self._executor_pid = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        env = os.environ
+        config = app.config
+        self.directory = config.setdefault('IMAGE_STORE_DIR', env.get(
+            'IMAGE_STORE_DIR', os.path.join(app.root_path, 'data', 'images')))
+        self.widths = tuple(sorted(int(w) for w in str(config.setdefault(
+            'IMAGE_WIDTHS', env.get('IMAGE_WIDTHS', DEFAULT_WIDTHS))).split(',') if w.strip()))
+        requested = str(config.setdefault('IMAGE_FORMATS', env.get('IMAGE_FORMATS', DEFAULT_FORMATS)))
+        self.formats = tuple(fmt for fmt in (f.strip() for f in requested.split(',')) if _can_write(fmt))
+        # 0 workers renders inline (CLI commands, tests)
+        self.workers = int(config.setdefault('IMAGE_WORKERS', env.get('IMAGE_WORKERS', 1)))
+        self.max_pending = int(config.setdefault('IMAGE_MAX_PENDING', env.get('IMAGE_MAX_PENDING', 16)))
+        self.timeout = float(config.setdefault('IMAGE_TIMEOUT', env.get('IMAGE_TIMEOUT', 5)))
+        self.max_bytes = int(config.setdefault('IMAGE_MAX_BYTES', env.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024)))
+        self.max_pixels = int(config.setdefault('IMAGE_MAX_PIXELS', env.get('IMAGE_MAX_PIXELS', 40_000_000)))
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._static_folder = app.static_folder
+        self._static_prefix = app.static_url_path + '/'
+
+        app.add_url_rule(f'{URL_PREFIX}/<digest>.<any(jpg, png, webp, gif):ext>',
+                         'image_original', self.send_original)
+        app.add_url_rule(f'{URL_PREFIX}/<digest>/<int:width>.<any(avif, webp, jpeg, png):fmt>',
+                         'image_derivative', self.send_derivative)
+        app.jinja_env.globals['image_variants'] = self.variants
+        app.extensions['image_store'] = self
+
+    # --- Storage ---
+    def _original_path(self, digest, ext):
+        return os.path.join(self.directory, 'originals', digest[:2], f'{digest}.{ext}')
+
+    def _derived_path(self, digest, width, fmt):
+        return os.path.join(self.directory, 'derived', digest[:2], digest, f'{width}.{fmt}')
+
+    def ingest(self, data, warm=True):
+        """Stores the image bytes ``data`` and returns its URL; queues its derivatives."""
+        if len(data) > self.max_bytes:
+            raise ImageError('image is too large')
+        info = self._probe(data)
+        path = self._original_path(info.digest, info.ext)
+        meta = os.path.splitext(path)[0] + '.json'
+        # The sidecar is written last: an image is in the store once it exists
+        if not os.path.exists(meta):
+            _write_atomic(path, data)
+            _write_atomic(meta, json.dumps(info._asdict()).encode('utf-8'))
+        self._info[info.digest] = info
+        if warm:
+            self.warm(info)
+        return f'{URL_PREFIX}/{info.digest}.{info.ext}'
+
+    def _probe(self, data):
+        try:
+            from PIL import Image
+        except ImportError:
+            raise RuntimeError('the Pillow package is required for image uploads')
+        try:
+            with Image.open(BytesIO(data)) as image:
+                ext = ORIGINAL_TYPES.get(image.format)
+                width, height = image.size
+                # EXIF orientations 5-8 are rotated by 90 degrees
+                if image.getexif().get(0x0112) in (5, 6, 7, 8):
+                    width, height = height, width
+                alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+        except (OSError, SyntaxError, Image.DecompressionBombError):
+            raise ImageError('not a readable image')
+        if ext is None:
+            raise ImageError('unsupported image format')
+        if width * height > self.max_pixels:
+            raise ImageError('image has too many pixels')
+        return ImageInfo(hashlib.sha1(data).hexdigest(), ext, width, height, alpha)
+
+    def info(self, digest):
+        """Returns the stored image's :class:`ImageInfo`, or ``None``."""
+        info = self._info.get(digest)
+        if info is None:
+            try:
+                with open(os.path.join(self.directory, 'originals', digest[:2], f'{digest}.json')) as f:
+                    info = self._info[digest] = ImageInfo(**json.load(f))
+            except (OSError, ValueError, TypeError):
+                return None
+        return info
+
+    def resolve(self, url):
+        """Returns the :class:`ImageInfo` behind a store or static URL, or ``None``."""
+        if not url:
+            return None
+        match = _STORE_URL.match(url)
+        if match:
+            return self.info(match.group(1))
+        if url.startswith(self._static_prefix):
+            return self._resolve_static(url[len(self._static_prefix):].split('?', 1)[0])
+        return None
+
+    def _resolve_static(self, filename):
+        # Copied into the store on first use; re-read when the file changes
+        path = safe_join(self._static_folder, filename)
+        try:
+            mtime = os.stat(path).st_mtime_ns if path else None
+        except OSError:
+            mtime = None
+        if mtime is None:
+            return None
+        cached = self._static.get(filename)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        try:
+            with open(path, 'rb') as f:
+                digest = _STORE_URL.match(self.ingest(f.read(), warm=False)).group(1)
+            info = self.info(digest)
+        except (ImageError, RuntimeError):
+            info = None
+        self._static[filename] = (mtime, info)
+        return info
+
+    # --- URLs ---
+    def widths_for(self, info):
+        """The configured widths up to the image's own; never upscaled."""
+        return sorted({min(width, info.width) for width in self.widths})
+
+    def srcset(self, url, fmt='webp'):
+        """``srcset`` value for ``url`` in ``fmt`` (default WebP), or ``None`` when not in the store."""
+        info = self.resolve(url)
+        if info is None:
+            return None
+        return self._srcset(info, fmt if fmt in self.formats else info.fallback)
+
+    def variants(self, url):
+        """What a ``<picture>`` needs for ``url``: ``src``, ``srcset``, ``sources``, ``width`` and ``height``."""
+        info = self.resolve(url)
+        if info is None:
+            return None
+        fallback = info.fallback
+        return {
+            'src': f'{_root()}{URL_PREFIX}/{info.digest}/{self.widths_for(info)[-1]}.{fallback}',
+            'srcset': self._srcset(info, fallback),
+            'sources': [{'type': MIMETYPES[fmt], 'srcset': self._srcset(info, fmt)} for fmt in self.formats],
+            'width': info.width,
+            'height': info.height,
+        }
+
+    def _srcset(self, info, fmt):
+        root = _root()
+        return ', '.join(f'{root}{URL_PREFIX}/{info.digest}/{w}.{fmt} {w}w' for w in self.widths_for(info))
+
+    # --- Rendering ---
+    def _pool(self):
+        # Created lazily and per process: a pool inherited across fork is unusable
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def render(self, info, width, fmt):
+        """Returns a future for the derivative's path, sharing one job per file."""
+        target = self._derived_path(info.digest, width, fmt)
+        source = self._original_path(info.digest, info.ext)
+        if self.workers <= 0:
+            future = Future()
+            _render(source, target, width, fmt)
+            future.set_result(target)
+            return future
+        pool = self._pool()
+        with self._lock:
+            future = self._pending.get(target)
+            if future is not None:
+                return future
+            if not self._slots.acquire(blocking=False):
+                raise ImageBusy('image queue is full')
+            future = self._pending[target] = pool.submit(_render, source, target, width, fmt)
+        future.add_done_callback(lambda _: self._finished(target))
+        return future
+
+    def _finished(self, target):
+        with self._lock:
+            self._pending.pop(target, None)
+        self._slots.release()
+
+    def warm(self, info):
+        """Queues every missing derivative of ``info`` without waiting for them."""
+        for fmt in (*self.formats, info.fallback):
+            for width in self.widths_for(info):
+                if os.path.exists(self._derived_path(info.digest, width, fmt)):
+                    continue
+                try:
+                    self.render(info, width, fmt)
+                except ImageBusy:
+                    return  # left for the first request
+                except Exception:
+                    logger.exception('rendering %s at %dpx as %s failed', info.digest, width, fmt)
+                    return
+
+    def render_all(self, info):
+        """Renders every missing derivative of ``info`` and waits for them (background jobs)."""
+        for fmt in (*self.formats, info.fallback):
+            for width in self.widths_for(info):
+                if not os.path.exists(self._derived_path(info.digest, width, fmt)):
+                    self.render(info, width, fmt).result()
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    # --- Serving ---
+    def send_original(self, digest, ext):
+        info = self.info(digest)
+        if info is None or info.ext != ext:
+            abort(404)
+        return immutable(send_file(self._original_path(digest, ext)))
+
+    def send_derivative(self, digest, width, fmt):
+        info = self.info(digest)
+        if info is None or width not in self.widths_for(info) or fmt not in (*self.formats, info.fallback):
+            abort(404)
+        path = self._derived_path(digest, width, fmt)
+        if not os.path.exists(path):
+            try:
+                self.render(info, width, fmt).result(timeout=self.timeout)
+            except (ImageBusy, FutureTimeout):
+                return self._send_original_instead(info)
+            except Exception:
+                logger.exception('rendering %s at %dpx as %s failed', digest, width, fmt)
+                return self._send_original_instead(info)
+        return immutable(send_file(path, mimetype=MIMETYPES[fmt]))
+
+    @staticmethod
+    def _send_original_instead(info):
+        # Not cacheable: the next request gets the finished derivative
+        response = redirect(f'{_root()}{URL_PREFIX}/{info.digest}.{info.ext}', code=307)
+        response.cache_control.no_store = True
+        return response
+
+
+def _root():
+    return request.script_root if has_request_context() else ''
+
+
+def _can_write(fmt):
+    """True when the installed Pillow can encode ``fmt``."""
+    if fmt not in MIMETYPES:
+        return False
+    try:
+        from PIL import features
+    except ImportError:
+        return False
+    return fmt in ('jpeg', 'png') or bool(features.check(fmt))
@@ -0,0 +1,297 @@
+"""Background jobs, so slow work never runs on a request thread.
+
+A job is a row of the ``job`` table naming a registered task and its JSON
+arguments. ``flask worker`` (started by start.sh) claims the next due job
+in ``priority`` order -- lower runs first -- with ``SELECT ... FOR UPDATE
+SKIP LOCKED`` on PostgreSQL, so any number of worker threads and processes
+share the table without taking the same job twice. SQLite ignores the lock
+clause but has a single writer, so the claiming ``UPDATE`` is atomic there
+as well; that is the local stand-in.
+
+A failing job is retried ``max_attempts`` times with exponential backoff
+and then kept as ``failed`` with its last error. A job whose worker died is
+released again after ``JOB_LEASE`` seconds. Finished jobs are deleted after
+``JOB_KEEP_DONE`` seconds. :meth:`JobQueue.stats` reports queue depth per
+status and task, and the age of the oldest due job.
+
+Tasks registered with :meth:`JobQueue.schedule` are enqueued periodically
+by every running ``flask worker``; :meth:`JobQueue.enqueue_once` keeps a
+task that is already waiting from being queued again.
+
+``JOB_QUEUE=inline`` runs every job immediately in the caller instead
+(development without a worker, one-off scripts); jobs enqueued with a
+``delay`` are dropped there.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import (Column, DateTime, Index, Integer, MetaData, String, Table, Text, delete, func, insert,
+                        select, text, update)
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+jobs = Table(
+    'job', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('task', String(100), nullable=False),
+    Column('payload', Text, nullable=False),
+    Column('priority', Integer, nullable=False, default=100),
+    Column('status', String(10), nullable=False, default='queued'),
+    Column('attempts', Integer, nullable=False, default=0),
+    Column('max_attempts', Integer, nullable=False, default=5),
+    Column('run_at', DateTime, nullable=False),
+    Column('locked_by', String(100), nullable=True),
+    Column('locked_at', DateTime, nullable=True),
+    Column('last_error', Text, nullable=True),
+    Column('created_at', DateTime, nullable=False),
+    Column('finished_at', DateTime, nullable=True),
+    # Only due jobs are ever scanned: the claim query walks this index from the front
+    Index('ix_job_queued', 'priority', 'run_at', 'id',
+          postgresql_where=text("status = 'queued'"), sqlite_where=text("status = 'queued'")),
+    Index('ix_job_status_locked_at', 'status', 'locked_at'),
+)
+
+# Retry backoff: RETRY_DELAY * 2 ** (attempts - 1), capped
+RETRY_DELAY = 10
+MAX_RETRY_DELAY = 3600
+# Seconds between lease/cleanup sweeps of a worker process
+MAINTENANCE_INTERVAL = 60
+
+
+def claim_statement(worker_id, now):
+    """The ``UPDATE ... RETURNING`` marking the next job due at ``now`` as running for ``worker_id``."""
+    next_job = (select(jobs.c.id)
+                .where(jobs.c.status == 'queued', jobs.c.run_at <= now)
+                .order_by(jobs.c.priority, jobs.c.run_at, jobs.c.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery())
+    return (update(jobs)
+            .where(jobs.c.id == next_job, jobs.c.status == 'queued')
+            .values(status='running', locked_by=worker_id, locked_at=now, attempts=jobs.c.attempts + 1)
+            .returning(jobs.c.id, jobs.c.task, jobs.c.payload, jobs.c.attempts, jobs.c.max_attempts))
+
+
+class Job:
+    """A claimed job as handed to its task."""
+
+    __slots__ = ('id', 'task', 'payload', 'attempts', 'max_attempts')
+
+    def __init__(self, id, task, payload, attempts, max_attempts):
+        self.id = id
+        self.task = task
+        self.payload = json.loads(payload)
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.task} attempt {self.attempts}/{self.max_attempts}>'
+
+
+class JobQueue:
+    """Task registry, enqueueing and the worker loop (Flask extension)."""
+
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self.tasks = {}
+        self.mode = 'database'
+        self.max_attempts = 5
+        self.poll_interval = 1.0
+        self.lease = 600
+        self.keep_done = 7 * 24 * 3600
+        # task name -> seconds between runs, enqueued by `flask worker`
+        self.schedules = {}
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        env = os.environ
+        self.app = app
+        self.db = db
+        self.mode = app.config.setdefault('JOB_QUEUE', env.get('JOB_QUEUE', 'database'))
+        if self.mode not in ('database', 'inline'):
+            raise RuntimeError(f'Unknown JOB_QUEUE: {self.mode}')
+        self.max_attempts = int(app.config.setdefault('JOB_MAX_ATTEMPTS', env.get('JOB_MAX_ATTEMPTS', 5)))
+        self.poll_interval = float(app.config.setdefault('JOB_POLL_INTERVAL', env.get('JOB_POLL_INTERVAL', 1)))
+        self.lease = int(app.config.setdefault('JOB_LEASE', env.get('JOB_LEASE', 600)))
+        self.keep_done = int(app.config.setdefault('JOB_KEEP_DONE', env.get('JOB_KEEP_DONE', 7 * 24 * 3600)))
+        app.extensions['job_queue'] = self
+
+    def task(self, name, priority=100, max_attempts=None):
+        """Registers the decorated function as task ``name``; its keyword arguments are the payload."""
+        def decorator(fn):
+            self.tasks[name] = (fn, priority, max_attempts)
+            return fn
+        return decorator
+
+    def schedule(self, name, every):
+        """Runs task ``name`` (without arguments) every ``every`` seconds while a worker is running."""
+        self.schedules[name] = every
+
+    # --- Producing ---
+    def enqueue(self, name, priority=None, delay=0, max_attempts=None, **payload):
+        """Queues task ``name`` with ``payload`` and returns the job id (``None`` when run inline).
+
+        The job is committed on its own connection, independently of the
+        caller's session, so it may be enqueued from commit hooks.
+        """
+        fn, default_priority, default_attempts = self.tasks[name]
+        if self.mode == 'inline':
+            if delay:
+                # Nothing would run it later, and running it now could re-enqueue it forever
+                logger.warning('Dropped job %s %r delayed by %ds: JOB_QUEUE=inline has no worker to run it',
+                               name, payload, delay)
+                return None
+            self._run_inline(name, fn, payload)
+            return None
+        now = datetime.utcnow()
+        with self.db.engine.begin() as conn:
+            return conn.execute(insert(jobs).values(
+                task=name, payload=json.dumps(payload), status='queued', attempts=0,
+                priority=default_priority if priority is None else priority,
+                max_attempts=max_attempts or default_attempts or self.max_attempts,
+                run_at=now + timedelta(seconds=delay), created_at=now,
+            )).inserted_primary_key[0]
+
+    def enqueue_once(self, name, **payload):
+        """Like :meth:`enqueue`, unless the same task with the same payload is already waiting."""
+        if self.mode != 'inline':
+            with self.db.engine.connect() as conn:
+                waiting = conn.execute(select(jobs.c.id).where(
+                    jobs.c.status == 'queued', jobs.c.task == name, jobs.c.payload == json.dumps(payload)).limit(1))
+                if waiting.first() is not None:
+                    return None
+        return self.enqueue(name, **payload)
+
+    def _run_inline(self, name, fn, payload):
+        try:
+            fn(**payload)
+        except Exception:
+            logger.exception('Inline job %s failed', name)
+
+    # --- Consuming ---
+    def claim(self, worker_id):
+        """Takes the next due job for ``worker_id``, or returns ``None``."""
+        with self.db.engine.begin() as conn:
+            row = conn.execute(claim_statement(worker_id, datetime.utcnow())).first()
+        return Job(*row) if row is not None else None
+
+    def run(self, job):
+        """Runs a claimed job and records the outcome."""
+        entry = self.tasks.get(job.task)
+        try:
+            if entry is None:
+                raise LookupError(f'no task named {job.task!r}')
+            entry[0](**job.payload)
+        except Exception as e:
+            logger.exception('%r failed', job)
+            self._failed(job, e)
+        else:
+            self._finish(job.id, status='done', finished_at=datetime.utcnow(), last_error=None)
+
+    def _failed(self, job, error):
+        error = f'{type(error).__name__}: {error}'[:2000]
+        if job.attempts >= job.max_attempts:
+            self._finish(job.id, status='failed', finished_at=datetime.utcnow(), last_error=error)
+        else:
+            delay = min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (job.attempts - 1))
+            self._finish(job.id, status='queued', run_at=datetime.utcnow() + timedelta(seconds=delay),
+                         last_error=error)
+
+    def _finish(self, job_id, **values):
+        with self.db.engine.begin() as conn:
+            conn.execute(update(jobs).where(jobs.c.id == job_id).values(locked_by=None, locked_at=None, **values))
+
+    def maintain(self):
+        """Requeues jobs running for longer than ``lease`` (their worker died) and deletes old finished jobs."""
+        now = datetime.utcnow()
+        with self.db.engine.begin() as conn:
+            released = conn.execute(
+                update(jobs)
+                .where(jobs.c.status == 'running', jobs.c.locked_at < now - timedelta(seconds=self.lease))
+                .values(status='queued', locked_by=None, locked_at=None, run_at=now,
+                        last_error='worker lease expired')
+            ).rowcount
+            conn.execute(delete(jobs).where(jobs.c.status == 'done',
+                                            jobs.c.finished_at < now - timedelta(seconds=self.keep_done)))
+        if released:
+            logger.warning('Requeued %d jobs whose worker lease expired', released)
+
+    def work(self, concurrency=1, burst=False, stop=None):
+        """Runs jobs on ``concurrency`` threads until ``stop`` is set (or, with ``burst``, the queue is empty)."""
+        stop = stop or threading.Event()
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+        def loop(n):
+            with self.app.app_context():
+                poll(f'{prefix}:{n}')
+
+        def poll(worker_id):
+            while not stop.is_set():
+                try:
+                    job = self.claim(worker_id)
+                except Exception:
+                    logger.exception('Claiming a job failed')
+                    job = None
+                if job is not None:
+                    self.run(job)
+                elif burst:
+                    return
+                else:
+                    stop.wait(self.poll_interval)
+
+        threads = [threading.Thread(target=loop, args=(n,), name=f'job-worker-{n}', daemon=True)
+                   for n in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        next_maintenance = 0
+        next_runs = dict.fromkeys(self.schedules, 0)
+        while any(thread.is_alive() for thread in threads):
+            if time.monotonic() >= next_maintenance:
+                try:
+                    self.maintain()
+                except Exception:
+                    logger.exception('Job queue maintenance failed')
+                next_maintenance = time.monotonic() + MAINTENANCE_INTERVAL
+            for name, due in next_runs.items():
+                if time.monotonic() >= due and not stop.is_set():
+                    # Every worker process schedules; a run already waiting is not queued twice
+                    try:
+                        self.enqueue_once(name)
+                    except Exception:
+                        logger.exception('Scheduling %s failed', name)
+                    next_runs[name] = time.monotonic() + self.schedules[name]
+            for thread in threads:
+                thread.join(timeout=1)
+        return stop.is_set()
+
+    # --- Visibility ---
+    def stats(self):
+        """Job counts per status and task, and how long the oldest due job has waited."""
+        now = datetime.utcnow()
+        with self.db.engine.connect() as conn:
+            counts = conn.execute(select(jobs.c.status, jobs.c.task, func.count())
+                                  .group_by(jobs.c.status, jobs.c.task)).all()
+            oldest = conn.execute(select(func.min(jobs.c.run_at))
+                                  .where(jobs.c.status == 'queued', jobs.c.run_at <= now)).scalar()
+        by_status = {'queued': 0, 'running': 0, 'done': 0, 'failed': 0}
+        by_task = {}
+        for status, task, count in counts:
+            by_status[status] = by_status.get(status, 0) + count
+            by_task.setdefault(task, {})[status] = count
+        if isinstance(oldest, str):
+            oldest = datetime.fromisoformat(oldest)
+        return {
+            'mode': self.mode,
+            'counts': by_status,
+            'tasks': by_task,
+            'oldest_due_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+        }
@@ -0,0 +1,357 @@
+"""Request instrumentation and Prometheus metrics at ``/metrics``.
+
+Every request served by Flask is timed end to end (until its streamed body
+is finished) and split into phases: SQL execution (``before/after_cursor_execute``
+on every engine), waiting for a pooled connection, Jinja rendering (the
+``before_render_template``/``template_rendered`` signals) and ``other`` --
+the view's own Python, serialization included. Per endpoint this gives a
+latency histogram, a histogram of queries per request and the seconds spent
+in each phase.
+
+Two patterns are logged with their SQL and counted:
+
+* slow queries -- one statement taking ``METRICS_SLOW_QUERY_MS`` or more;
+* N+1 -- one statement run ``METRICS_N_PLUS_ONE`` or more times in a request.
+
+Each gunicorn worker keeps its numbers in memory and writes them as JSON to
+``METRICS_DIR/<pid>-<id>.json`` (atomically, at most every
+``METRICS_FLUSH_INTERVAL`` seconds). ``/metrics`` merges the files of every
+worker, so any worker answers for all of them; counters of exited workers
+are kept, their gauges dropped. start.sh empties the directory on boot.
+``METRICS_TOKEN``, when set, must be sent as a bearer token.
+"""
+import glob
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+from flask import Response, abort, before_render_template, g, request, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+PHASES = ('db', 'db_pool_wait', 'template', 'other')
+
+# name -> (type, help); histogram buckets are given where they are observed
+METRICS = {
+    'http_requests_total': ('counter', 'Requests served, by endpoint, method and status.'),
+    'http_request_duration_seconds': ('histogram', 'Request latency including the streamed body.'),
+    'http_request_db_queries': ('histogram', 'SQL statements executed per request.'),
+    'http_request_phase_seconds_total': ('counter', 'Seconds per request phase: db, db_pool_wait, template, other.'),
+    'db_slow_queries_total': ('counter', 'Statements slower than METRICS_SLOW_QUERY_MS.'),
+    'db_n_plus_one_total': ('counter', 'Requests that ran one statement METRICS_N_PLUS_ONE times or more.'),
+    'db_pool_checked_out': ('gauge', 'Connections checked out of the pool, summed over live workers.'),
+    'db_pool_timeouts_total': ('counter', 'Connection checkouts that timed out.'),
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class RequestStats:
+    """What one request has spent so far; lives on ``flask.g``."""
+
+    __slots__ = ('started', 'db_time', 'pool_wait', 'template_time', 'template_started', 'statements',
+                 'status', 'slow')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.pool_wait = 0.0
+        self.template_time = 0.0
+        self.template_started = []
+        self.statements = {}
+        self.status = 500
+        self.slow = 0
+
+
+class Registry:
+    """Counters, gauges and histograms of one process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, labels, value):
+        with self._lock:
+            self.gauges[(name, labels)] = value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets),
+                                                     'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram['counts'][i] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    def dump(self):
+        with self._lock:
+            return {
+                'counters': [[name, labels, value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, labels, value] for (name, labels), value in self.gauges.items()],
+                'histograms': [[name, labels, dict(h, counts=list(h['counts']))]
+                               for (name, labels), h in self.histograms.items()],
+            }
+
+
+def merge(dumps):
+    """Adds up per-process dumps into one registry (label lists become tuples again)."""
+    registry = Registry()
+    for data in dumps:
+        for name, labels, value in data['counters']:
+            registry.inc(name, tuple(map(tuple, labels)), value)
+        for name, labels, value in data.get('gauges', ()):
+            key = (name, tuple(map(tuple, labels)))
+            registry.gauges[key] = registry.gauges.get(key, 0) + value
+        for name, labels, h in data['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = registry.histograms.get(key)
+            if total is None:
+                registry.histograms[key] = dict(h, counts=list(h['counts']))
+            else:
+                total['counts'] = [a + b for a, b in zip(total['counts'], h['counts'])]
+                total['sum'] += h['sum']
+                total['count'] += h['count']
+    return registry
+
+
+def render(registry):
+    """Prometheus text exposition format (version 0.0.4)."""
+    series = {}
+    for (name, labels), value in sorted({**registry.counters, **registry.gauges}.items()):
+        series.setdefault(name, []).append(f'{name}{_labels(labels)} {_number(value)}')
+    for (name, labels), h in sorted(registry.histograms.items(), key=lambda item: item[0]):
+        lines = series.setdefault(name, [])
+        for bound, count in zip(h['buckets'], h['counts']):
+            lines.append(f'{name}_bucket{_labels(labels + (("le", _number(float(bound))),))} {count}')
+        lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {h["count"]}')
+        lines.append(f'{name}_sum{_labels(labels)} {_number(h["sum"])}')
+        lines.append(f'{name}_count{_labels(labels)} {h["count"]}')
+    out = []
+    for name in sorted(series):
+        kind, help_text = METRICS.get(name, ('untyped', ''))
+        out.append(f'# HELP {name} {help_text}')
+        out.append(f'# TYPE {name} {kind}')
+        out.extend(series[name])
+    return '\n'.join(out) + '\n'
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class RequestMetrics:
+    """Times requests, SQL, templates and pool waits; serves ``/metrics`` (Flask extension)."""
+
+    def __init__(self, app=None, pool_metrics=None):
+        self.registry = Registry()
+        self.directory = None
+        self.token = None
+        self.slow_query = 0.5
+        self.n_plus_one = 10
+        self.flush_interval = 5.0
+        self.pool_metrics = pool_metrics
+        self._pid = None
+        self._path = None
+        self._next_flush = 0.0
+        self._flush_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, pool_metrics)
+
+    def init_app(self, app, pool_metrics=None):
+        env = os.environ
+        self.directory = app.config.setdefault('METRICS_DIR', env.get(
+            'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'municipality-metrics')))
+        self.token = app.config.setdefault('METRICS_TOKEN', env.get('METRICS_TOKEN'))
+        self.slow_query = float(app.config.setdefault('METRICS_SLOW_QUERY_MS', env.get('METRICS_SLOW_QUERY_MS', 500))) / 1000
+        self.n_plus_one = int(app.config.setdefault('METRICS_N_PLUS_ONE', env.get('METRICS_N_PLUS_ONE', 10)))
+        self.flush_interval = float(app.config.setdefault('METRICS_FLUSH_INTERVAL', env.get('METRICS_FLUSH_INTERVAL', 5)))
+        os.makedirs(self.directory, exist_ok=True)
+        self.pool_metrics = pool_metrics
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        # Every engine: the primary, the read replicas and the change bus's own
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._rendered, app)
+        if pool_metrics is not None:
+            pool_metrics.on_wait = self._pool_wait
+        app.add_url_rule('/metrics', 'metrics', self.view)
+        app.extensions['request_metrics'] = self
+
+    # --- Request hooks ---
+    @staticmethod
+    def _current():
+        # Statements and waits outside a request (CLI, job worker threads) are not attributed
+        return g.get('request_stats') if g else None
+
+    def _before_request(self):
+        g.request_stats = RequestStats()
+
+    def _after_request(self, response):
+        stats = self._current()
+        if stats is not None:
+            stats.status = response.status_code
+        return response
+
+    def _teardown_request(self, exc):
+        stats = g.pop('request_stats', None)
+        if stats is None:
+            return
+        duration = time.perf_counter() - stats.started
+        endpoint = request.endpoint or 'unmatched'
+        if endpoint == 'metrics':
+            return
+        registry = self.registry
+        status = 500 if exc is not None else stats.status
+        registry.inc('http_requests_total', (('endpoint', endpoint), ('method', request.method), ('status', str(status))))
+        registry.observe('http_request_duration_seconds', (('endpoint', endpoint),), duration, LATENCY_BUCKETS)
+        queries = sum(stats.statements.values())
+        registry.observe('http_request_db_queries', (('endpoint', endpoint),), queries, QUERY_COUNT_BUCKETS)
+        other = max(0.0, duration - stats.db_time - stats.pool_wait - stats.template_time)
+        for phase, seconds in zip(PHASES, (stats.db_time, stats.pool_wait, stats.template_time, other)):
+            registry.inc('http_request_phase_seconds_total', (('endpoint', endpoint), ('phase', phase)), seconds)
+        if stats.slow:
+            registry.inc('db_slow_queries_total', (('endpoint', endpoint),), stats.slow)
+        repeated = [(count, sql) for sql, count in stats.statements.items() if count >= self.n_plus_one]
+        if repeated:
+            registry.inc('db_n_plus_one_total', (('endpoint', endpoint),))
+            count, sql = max(repeated)
+            logger.warning('Possible N+1 in %s: ran %d times in one request: %s', endpoint, count, sql)
+        self._maybe_flush()
+
+    # --- SQLAlchemy and template hooks ---
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('metrics_started')
+        if not started:
+            return
+        elapsed = time.perf_counter() - started.pop()
+        if elapsed >= self.slow_query:
+            logger.warning('Slow query (%.0f ms): %s', elapsed * 1000, statement)
+        stats = self._current()
+        if stats is None:
+            if elapsed >= self.slow_query:
+                self.registry.inc('db_slow_queries_total', (('endpoint', 'none'),))
+            return
+        stats.db_time += elapsed
+        stats.statements[statement] = stats.statements.get(statement, 0) + 1
+        if elapsed >= self.slow_query:
+            stats.slow += 1
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = self._current()
+        if stats is not None:
+            stats.template_started.append(time.perf_counter())
+
+    def _rendered(self, sender, template, context, **extra):
+        stats = self._current()
+        if stats is not None and stats.template_started:
+            stats.template_time += time.perf_counter() - stats.template_started.pop()
+
+    def _pool_wait(self, seconds):
+        stats = self._current()
+        if stats is not None:
+            stats.pool_wait += seconds
+
+    # --- Aggregation across workers ---
+    def _file(self):
+        pid = os.getpid()
+        if self._pid != pid:
+            # A forked worker starts from zero under its own file
+            if self._pid is not None:
+                self.registry = Registry()
+            self._pid = pid
+            self._path = os.path.join(self.directory, f'{pid}-{uuid.uuid4().hex[:8]}.json')
+        return self._path
+
+    def _maybe_flush(self):
+        if time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self):
+        """Writes this worker's numbers to its file in ``METRICS_DIR``."""
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            path = self._file()
+            pool = self.pool_metrics.snapshot() if self.pool_metrics is not None else {}
+            if 'checked_out' in pool:
+                self.registry.set('db_pool_checked_out', (), pool['checked_out'])
+            data = self.registry.dump()
+            data['pid'] = self._pid
+            data['counters'].append(['db_pool_timeouts_total', [], pool.get('timeouts', 0)])
+            temporary = f'{path}.tmp'
+            with open(temporary, 'w') as f:
+                json.dump(data, f)
+            os.replace(temporary, path)
+            self._next_flush = time.monotonic() + self.flush_interval
+        except OSError:
+            logger.exception('Could not write metrics to %s', self.directory)
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        """Returns the merged registry of every worker that has written metrics."""
+        self.flush()
+        dumps = []
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if not _alive(data.get('pid', 0)):
+                data['gauges'] = []
+            dumps.append(data)
+        return merge(dumps)
+
+    def view(self):
+        if self.token:
+            supplied = request.headers.get('Authorization', '')
+            if not hmac.compare_digest(supplied.encode('utf-8'), f'Bearer {self.token}'.encode('utf-8')):
+                abort(401)
+        return Response(render(self.collect()), content_type='text/plain; version=0.0.4; charset=utf-8',
+                        headers={'Cache-Control': 'no-store'})
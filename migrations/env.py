@@ -5,6 +5,12 @@ from flask import current_app
 
 from alembic import context
 
+import analytics
+import jobs
+import notifications
+import search
+import sync
+
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
@@ -45,10 +51,25 @@ target_db = current_app.extensions['migrate'].db
 # ... etc.
 
 
+# Tables the app's modules define on a MetaData of their own, so that they
+# do not import the app; their migrations are autogenerated like the models'
+module_metadata = [jobs.metadata, analytics.metadata, sync.metadata, notifications.metadata,
+                   search.metadata]
+
+
 def get_metadata():
     if hasattr(target_db, 'metadatas'):
-        return target_db.metadatas[None]
-    return target_db.metadata
+        return [target_db.metadatas[None], *module_metadata]
+    return [target_db.metadata, *module_metadata]
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # search_document holds a tsvector and exists on PostgreSQL only; other
+    # databases search an in-memory index
+    table = object if type_ == 'table' else getattr(object, 'table', None)
+    if table is not None and table.name == search.search_documents.name:
+        return get_engine().dialect.name == 'postgresql'
+    return True
 
 
 def run_migrations_offline():
@@ -65,7 +86,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,6 +115,8 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    if conf_args.get("include_object") is None:
+        conf_args["include_object"] = include_object
 
     connectable = get_engine()
 
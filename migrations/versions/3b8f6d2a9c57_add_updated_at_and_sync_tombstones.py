@@ -0,0 +1,61 @@
+"""Add updated_at columns and sync_tombstone table for the delta sync API
+
+Revision ID: 3b8f6d2a9c57
+Revises: 9a7c4e2f1b36
+Create Date: 2026-10-16 23:41:05.318264
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b8f6d2a9c57'
+down_revision = '9a7c4e2f1b36'
+branch_labels = None
+depends_on = None
+
+SYNCED_TABLES = ('announcement', 'project', 'deliberation', 'decision', 'service')
+
+
+def utc_now():
+    """Server-side default in UTC, like the models' datetime.utcnow, for writes that skip the ORM (COPY)."""
+    if op.get_bind().dialect.name == 'postgresql':
+        return sa.text("timezone('utc', now())")
+    return sa.text('CURRENT_TIMESTAMP')
+
+
+def upgrade():
+    now = datetime.utcnow()
+    for table in SYNCED_TABLES:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        # Existing rows count as changed now; clients start with a full download anyway
+        op.execute(sa.table(table, sa.column('updated_at', sa.DateTime)).update().values(updated_at=now))
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False,
+                                  server_default=utc_now())
+            batch_op.create_index(f'ix_{table}_updated_at_id', ['updated_at', 'id'], unique=False)
+
+    op.create_table('sync_tombstone',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('model', sa.String(length=50), nullable=False),
+    sa.Column('row_id', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_sync_tombstone_model_deleted_at_id', 'sync_tombstone', ['model', 'deleted_at', 'id'],
+                    unique=False)
+    op.create_index('ix_sync_tombstone_deleted_at', 'sync_tombstone', ['deleted_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_sync_tombstone_deleted_at', table_name='sync_tombstone')
+    op.drop_index('ix_sync_tombstone_model_deleted_at_id', table_name='sync_tombstone')
+    op.drop_table('sync_tombstone')
+    for table in reversed(SYNCED_TABLES):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(f'ix_{table}_updated_at_id')
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,26 @@
+"""Add composite index for announcement keyset pagination
+
+Revision ID: 4f1a9c2e7b10
+Revises: dc167a947504
+Create Date: 2026-10-16 09:12:03.114205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f1a9c2e7b10'
+down_revision = 'dc167a947504'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('announcement', schema=None) as batch_op:
+        batch_op.create_index('ix_announcement_date_published_id', ['date_published', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('announcement', schema=None) as batch_op:
+        batch_op.drop_index('ix_announcement_date_published_id')
@@ -0,0 +1,45 @@
+"""Add job table for the background job queue
+
+Revision ID: 5d9e3b7a1c42
+Revises: e2a47f8c31d6
+Create Date: 2026-10-16 16:48:12.204517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d9e3b7a1c42'
+down_revision = 'e2a47f8c31d6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('task', sa.String(length=100), nullable=False),
+    sa.Column('payload', sa.Text(), nullable=False),
+    sa.Column('priority', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_by', sa.String(length=100), nullable=True),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    # Partial: the claim query only ever looks at due, queued jobs
+    op.create_index('ix_job_queued', 'job', ['priority', 'run_at', 'id'], unique=False,
+                    postgresql_where=sa.text("status = 'queued'"), sqlite_where=sa.text("status = 'queued'"))
+    op.create_index('ix_job_status_locked_at', 'job', ['status', 'locked_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_job_status_locked_at', table_name='job')
+    op.drop_index('ix_job_queued', table_name='job')
+    op.drop_table('job')
@@ -0,0 +1,57 @@
+"""Add notification_subscription and notification_delivery tables
+
+Revision ID: 7e4c1b9d2f68
+Revises: 3b8f6d2a9c57
+Create Date: 2026-10-17 01:12:40.527913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e4c1b9d2f68'
+down_revision = '3b8f6d2a9c57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('notification_subscription',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('channel', sa.String(length=20), nullable=False),
+    sa.Column('target', sa.String(length=500), nullable=False),
+    sa.Column('credentials', sa.Text(), nullable=True),
+    sa.Column('announcement_type', sa.String(length=50), nullable=True),
+    sa.Column('token', sa.String(length=64), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('channel', 'target', name='uq_notification_subscription_target'),
+    sa.UniqueConstraint('token')
+    )
+    op.create_table('notification_delivery',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('subscription_id', sa.Integer(), nullable=False),
+    sa.Column('channel', sa.String(length=20), nullable=False),
+    sa.Column('announcement_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('status', sa.String(length=10), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('sent_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('subscription_id', 'announcement_id', 'kind', name='uq_notification_delivery_once')
+    )
+    # The sender claims due deliveries of one channel from the front of this index
+    op.create_index('ix_notification_delivery_due', 'notification_delivery',
+                    ['channel', 'status', 'next_attempt_at', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_notification_delivery_due', table_name='notification_delivery')
+    op.drop_table('notification_delivery')
+    op.drop_table('notification_subscription')
@@ -0,0 +1,38 @@
+"""Add search_document table with a GIN index for full-text search
+
+Revision ID: 8b3d5e61c0a4
+Revises: 4f1a9c2e7b10
+Create Date: 2026-10-16 11:40:27.508311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '8b3d5e61c0a4'
+down_revision = '4f1a9c2e7b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Only PostgreSQL has tsvector; other databases use the in-memory index
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.create_table('search_document',
+    sa.Column('doc_table', sa.String(length=50), nullable=False),
+    sa.Column('doc_id', sa.Integer(), nullable=False),
+    sa.Column('title', sa.String(length=255), nullable=False),
+    sa.Column('document', postgresql.TSVECTOR(), nullable=False),
+    sa.PrimaryKeyConstraint('doc_table', 'doc_id')
+    )
+    op.create_index('ix_search_document_document', 'search_document', ['document'], unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_search_document_document', table_name='search_document', postgresql_using='gin')
+    op.drop_table('search_document')
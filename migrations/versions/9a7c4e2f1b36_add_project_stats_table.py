@@ -0,0 +1,53 @@
+"""Add project_stats table for materialized project analytics
+
+Revision ID: 9a7c4e2f1b36
+Revises: 5d9e3b7a1c42
+Create Date: 2026-10-16 18:02:41.730952
+
+"""
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a7c4e2f1b36'
+down_revision = '5d9e3b7a1c42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    project_stats = op.create_table('project_stats',
+    sa.Column('category', sa.String(length=100), nullable=False),
+    sa.Column('status', sa.String(length=50), nullable=False),
+    sa.Column('deadline', sa.Date(), nullable=False),
+    sa.Column('projects', sa.Integer(), nullable=False),
+    sa.Column('budgeted', sa.Integer(), nullable=False),
+    sa.Column('budget', sa.Float(), nullable=False),
+    sa.Column('progress', sa.Float(), nullable=False),
+    sa.Column('weighted_progress', sa.Float(), nullable=False),
+    sa.Column('open', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('category', 'status', 'deadline')
+    )
+    # Same buckets as ProjectAnalytics.rebuild(); later writes keep them current
+    project = sa.table('project', sa.column('category', sa.String), sa.column('status', sa.String),
+                       sa.column('end_date', sa.Date), sa.column('budget', sa.Float),
+                       sa.column('progress_percentage', sa.Integer))
+    progress = sa.func.coalesce(project.c.progress_percentage, 0)
+    is_open = progress < 100
+    deadline = sa.case((sa.and_(is_open, project.c.end_date.isnot(None)), project.c.end_date),
+                       else_=sa.literal(date(9999, 12, 31), sa.Date))
+    category, status = sa.func.coalesce(project.c.category, ''), sa.func.coalesce(project.c.status, '')
+    op.execute(project_stats.insert().from_select(
+        ['category', 'status', 'deadline', 'projects', 'budgeted', 'budget', 'progress', 'weighted_progress', 'open'],
+        sa.select(category, status, deadline, sa.func.count(), sa.func.count(project.c.budget),
+                  sa.func.coalesce(sa.func.sum(project.c.budget), 0.0), sa.func.coalesce(sa.func.sum(progress), 0),
+                  sa.func.coalesce(sa.func.sum(project.c.budget * progress), 0.0),
+                  sa.func.sum(sa.case((is_open, 1), else_=0)))
+        .group_by(category, status, deadline)))
+
+
+def downgrade():
+    op.drop_table('project_stats')
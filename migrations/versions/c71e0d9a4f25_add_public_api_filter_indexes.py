@@ -0,0 +1,44 @@
+"""Add composite indexes for the public API filters
+
+Revision ID: c71e0d9a4f25
+Revises: 8b3d5e61c0a4
+Create Date: 2026-10-16 13:05:51.902117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c71e0d9a4f25'
+down_revision = '8b3d5e61c0a4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('project', schema=None) as batch_op:
+        batch_op.create_index('ix_project_status_id', ['status', 'id'], unique=False)
+        batch_op.create_index('ix_project_category_id', ['category', 'id'], unique=False)
+
+    with op.batch_alter_table('deliberation', schema=None) as batch_op:
+        batch_op.create_index('ix_deliberation_category_id', ['category', 'id'], unique=False)
+        batch_op.create_index('ix_deliberation_date_id', ['date', 'id'], unique=False)
+
+    with op.batch_alter_table('decision', schema=None) as batch_op:
+        batch_op.create_index('ix_decision_type_id', ['type', 'id'], unique=False)
+        batch_op.create_index('ix_decision_date_id', ['date', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('decision', schema=None) as batch_op:
+        batch_op.drop_index('ix_decision_date_id')
+        batch_op.drop_index('ix_decision_type_id')
+
+    with op.batch_alter_table('deliberation', schema=None) as batch_op:
+        batch_op.drop_index('ix_deliberation_date_id')
+        batch_op.drop_index('ix_deliberation_category_id')
+
+    with op.batch_alter_table('project', schema=None) as batch_op:
+        batch_op.drop_index('ix_project_category_id')
+        batch_op.drop_index('ix_project_status_id')
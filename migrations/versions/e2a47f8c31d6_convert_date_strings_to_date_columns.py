@@ -0,0 +1,100 @@
+"""Convert project/deliberation/decision date strings to DATE columns
+
+Revision ID: e2a47f8c31d6
+Revises: c71e0d9a4f25
+Create Date: 2026-10-16 14:22:09.617342
+
+"""
+from datetime import date, datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a47f8c31d6'
+down_revision = 'c71e0d9a4f25'
+branch_labels = None
+depends_on = None
+
+# (table, column) pairs stored as 'YYYY-MM-DD' strings until now
+DATE_COLUMNS = (
+    ('project', 'start_date'),
+    ('project', 'end_date'),
+    ('deliberation', 'date'),
+    ('decision', 'date'),
+)
+# Formats accepted when backfilling; anything else becomes NULL and is reported
+INPUT_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%d/%m/%Y', '%d-%m-%Y', '%Y-%m', '%Y')
+
+
+def parse_date(value):
+    value = (value or '').strip()
+    if not value:
+        return None
+    for fmt in INPUT_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def copy_column(table, source, target, convert):
+    """Copies ``source`` into ``target`` row by row through ``convert``."""
+    bind = op.get_bind()
+    t = sa.table(table, sa.column('id', sa.Integer), sa.column(source), sa.column(target))
+    rows = bind.execute(sa.select(t.c.id, t.c[source]).where(t.c[source].isnot(None))).all()
+    for row_id, value in rows:
+        converted = convert(value)
+        if converted is None:
+            print(f"  {table}.{source} id={row_id}: could not convert {value!r}, leaving it empty")
+            continue
+        bind.execute(t.update().where(t.c.id == row_id).values({target: converted}))
+
+
+def upgrade():
+    with op.batch_alter_table('deliberation', schema=None) as batch_op:
+        batch_op.drop_index('ix_deliberation_date_id')
+    with op.batch_alter_table('decision', schema=None) as batch_op:
+        batch_op.drop_index('ix_decision_date_id')
+
+    for table, column in DATE_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column(f'{column}_new', sa.Date(), nullable=True))
+        copy_column(table, column, f'{column}_new', parse_date)
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column(column)
+            batch_op.alter_column(f'{column}_new', new_column_name=column, existing_type=sa.Date())
+
+    with op.batch_alter_table('project', schema=None) as batch_op:
+        batch_op.create_index('ix_project_start_date', ['start_date'], unique=False)
+        batch_op.create_index('ix_project_end_date', ['end_date'], unique=False)
+    with op.batch_alter_table('deliberation', schema=None) as batch_op:
+        batch_op.create_index('ix_deliberation_date_id', ['date', 'id'], unique=False)
+    with op.batch_alter_table('decision', schema=None) as batch_op:
+        batch_op.create_index('ix_decision_date_id', ['date', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('decision', schema=None) as batch_op:
+        batch_op.drop_index('ix_decision_date_id')
+    with op.batch_alter_table('deliberation', schema=None) as batch_op:
+        batch_op.drop_index('ix_deliberation_date_id')
+    with op.batch_alter_table('project', schema=None) as batch_op:
+        batch_op.drop_index('ix_project_end_date')
+        batch_op.drop_index('ix_project_start_date')
+
+    for table, column in DATE_COLUMNS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column(f'{column}_old', sa.String(length=10), nullable=True))
+        copy_column(table, column, f'{column}_old',
+                    lambda value: value.isoformat() if isinstance(value, date) else str(value)[:10])
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column(column)
+            batch_op.alter_column(f'{column}_old', new_column_name=column, existing_type=sa.String(length=10))
+
+    with op.batch_alter_table('deliberation', schema=None) as batch_op:
+        batch_op.create_index('ix_deliberation_date_id', ['date', 'id'], unique=False)
+    with op.batch_alter_table('decision', schema=None) as batch_op:
+        batch_op.create_index('ix_decision_date_id', ['date', 'id'], unique=False)
@@ -0,0 +1,561 @@
+"""Notifications to subscribers when announcements are published or their deadline nears.
+
+A subscription names a channel and a target:
+
+* ``email``   -- an address, active once its owner follows the confirmation
+  link. Sent over SMTP (``SMTP_HOST``/``SMTP_PORT``, by default a local
+  stand-in on ``localhost:1025``), one connection per batch.
+* ``webhook`` -- an URL (added by an admin) receiving a JSON POST signed
+  with HMAC-SHA256 of the subscription's secret in ``X-Signature-256``.
+* ``webpush`` -- a browser push subscription, sent with VAPID through
+  ``pywebpush``; the channel is off unless the package and
+  ``VAPID_PRIVATE_KEY`` are present.
+
+Nothing is sent while the write that triggers it is being handled. A new
+announcement (an insert on the change bus, by the worker that wrote it;
+bulk imports do not notify) only enqueues a ``fanout`` job, and an hourly
+scan enqueues the same for announcements whose deadline is less than
+``NOTIFY_DEADLINE_DAYS`` away. The fan-out copies the matching
+subscriptions into ``notification_delivery`` with one ``INSERT ... SELECT``
+-- at most one row per subscription, announcement and kind, so repeated
+scans send nothing twice -- and enqueues a ``send`` job per channel.
+
+A ``send`` job claims up to ``NOTIFY_BATCH_SIZE`` due deliveries of its
+channel (``FOR UPDATE SKIP LOCKED``, as the job queue does), sends them at
+no more than ``NOTIFY_RATE_<CHANNEL>`` per second -- a token bucket shared
+by all workers through ``RATE_LIMIT_BACKEND`` -- and records each outcome.
+A failed send is retried with exponential backoff up to
+``NOTIFY_MAX_ATTEMPTS`` times; a target that no longer exists (SMTP
+recipient refused, HTTP 404/410) deactivates its subscription.
+
+All of this needs a job worker. With ``JOB_QUEUE=inline`` a new
+announcement is fanned out and sent as it is committed, but work that
+must wait -- an announcement published in the future, a rate-limited or
+failed batch, the deadline scan -- is dropped with a warning.
+"""
+import abc
+import hashlib
+import hmac
+import json
+import logging
+import os
+import smtplib
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import NamedTuple, Optional
+
+from sqlalchemy import (Column, DateTime, Index, Integer, MetaData, String, Table, Text, UniqueConstraint, delete,
+                        exists, func, insert, literal, or_, select, update)
+
+from throttle import bucket_store
+
+try:
+    from pywebpush import WebPushException, webpush
+except ImportError:
+    webpush = None
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+deliveries = Table(
+    'notification_delivery', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('subscription_id', Integer, nullable=False),
+    Column('channel', String(20), nullable=False),
+    Column('announcement_id', Integer, nullable=False),
+    Column('kind', String(20), nullable=False),  # 'published' or 'deadline'
+    Column('status', String(10), nullable=False),  # queued, sending, sent, failed or cancelled
+    Column('attempts', Integer, nullable=False, default=0),
+    Column('next_attempt_at', DateTime, nullable=False),
+    Column('locked_at', DateTime, nullable=True),
+    Column('last_error', Text, nullable=True),
+    Column('created_at', DateTime, nullable=False),
+    Column('sent_at', DateTime, nullable=True),
+    UniqueConstraint('subscription_id', 'announcement_id', 'kind', name='uq_notification_delivery_once'),
+    # The send query reads due deliveries of one channel from the front of this index
+    Index('ix_notification_delivery_due', 'channel', 'status', 'next_attempt_at', 'id'),
+)
+
+CHANNELS = ('email', 'webhook', 'webpush')
+# Retry backoff: RETRY_DELAY * 2 ** (attempts - 1), capped
+RETRY_DELAY = 30
+MAX_RETRY_DELAY = 6 * 3600
+# A delivery left 'sending' this long belongs to a worker that died
+SENDING_LEASE = 600
+EXCERPT_LENGTH = 280
+# Public paths, joined to NOTIFY_SITE_URL; the worker has no request to build URLs from
+ANNOUNCEMENT_PATH = '/announcement/{id}'
+CONFIRM_PATH = '/notifications/confirm/{token}'
+UNSUBSCRIBE_PATH = '/notifications/unsubscribe/{token}'
+
+
+class PermanentFailure(Exception):
+    """The target is gone; the subscription is deactivated instead of retried."""
+
+
+class Message(NamedTuple):
+    """One notification as handed to a channel."""
+    delivery_id: int
+    kind: str
+    announcement_id: int
+    title: str
+    excerpt: str
+    announcement_type: Optional[str]
+    deadline: Optional[datetime]
+    url: str
+    unsubscribe_url: str
+
+    def subject(self):
+        if self.kind == 'deadline':
+            return f'اقترب الموعد النهائي: {self.title}'
+        return f'إعلان جديد: {self.title}'
+
+    def to_json(self):
+        return {'id': self.delivery_id, 'event': f'announcement.{self.kind}', 'announcement': {
+            'id': self.announcement_id, 'title': self.title, 'excerpt': self.excerpt,
+            'announcement_type': self.announcement_type,
+            'deadline': self.deadline.isoformat() if self.deadline else None, 'url': self.url}}
+
+
+def _excerpt(text):
+    text = ' '.join((text or '').split())
+    return text if len(text) <= EXCERPT_LENGTH else text[:EXCERPT_LENGTH - 1].rstrip() + '…'
+
+
+def sign(secret, body):
+    """The ``X-Signature-256`` value of a webhook ``body``: ``sha256=<hex HMAC>``."""
+    return 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+
+
+# --- Channels ---
+class Channel(abc.ABC):
+    name = None
+
+    @contextmanager
+    def open(self):
+        """Yields ``send(target, credentials, message)`` for one batch."""
+        yield self.send
+
+    @abc.abstractmethod
+    def send(self, target, credentials, message):
+        """Sends ``message`` to ``target``; raises :class:`PermanentFailure` when it is gone."""
+
+
+class EmailChannel(Channel):
+    name = 'email'
+
+    def __init__(self, host, port, sender, username=None, password=None, starttls=False, timeout=10):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def connect(self):
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            smtp.starttls()
+        if self.username:
+            smtp.login(self.username, self.password)
+        return smtp
+
+    @contextmanager
+    def open(self):
+        # An unreachable server fails the whole batch here, before any message is tried
+        connection = [self.connect()]
+
+        def send(target, credentials, message):
+            if connection[0] is None:
+                connection[0] = self.connect()
+            try:
+                self.deliver(connection[0], target, message)
+            except smtplib.SMTPServerDisconnected:
+                connection[0] = None
+                raise
+
+        try:
+            yield send
+        finally:
+            if connection[0] is not None:
+                try:
+                    connection[0].quit()
+                except smtplib.SMTPException:
+                    pass
+
+    def send(self, target, credentials, message):
+        with self.open() as send:
+            send(target, credentials, message)
+
+    def deliver(self, smtp, target, message):
+        email = EmailMessage()
+        email['From'] = self.sender
+        email['To'] = target
+        email['Subject'] = message.subject()
+        lines = [message.title, '']
+        if message.deadline:
+            lines += [f'الموعد النهائي: {message.deadline:%Y-%m-%d %H:%M}', '']
+        lines += [message.excerpt, '', message.url, '', f'لإلغاء الاشتراك: {message.unsubscribe_url}']
+        email.set_content('\n'.join(lines))
+        email['List-Unsubscribe'] = f'<{message.unsubscribe_url}>'
+        self.send_email(smtp, email)
+
+    def send_email(self, smtp, email):
+        try:
+            smtp.send_message(email)
+        except smtplib.SMTPRecipientsRefused as e:
+            raise PermanentFailure(f'recipient refused: {e.recipients}')
+
+
+class WebhookChannel(Channel):
+    name = 'webhook'
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+
+    def send(self, target, credentials, message):
+        body = json.dumps(message.to_json(), ensure_ascii=False).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'X-Notification-Id': str(message.delivery_id)}
+        if credentials:
+            headers['X-Signature-256'] = sign(credentials, body)
+        try:
+            with urllib.request.urlopen(urllib.request.Request(target, data=body, headers=headers, method='POST'),
+                                        timeout=self.timeout):
+                pass
+        except urllib.error.HTTPError as e:
+            if e.code in (404, 410):
+                raise PermanentFailure(f'HTTP {e.code}')
+            raise
+
+
+class WebPushChannel(Channel):
+    name = 'webpush'
+
+    def __init__(self, private_key, subject, ttl=24 * 3600, timeout=10):
+        self.private_key = private_key
+        self.subject = subject
+        self.ttl = ttl
+        self.timeout = timeout
+
+    def send(self, target, credentials, message):
+        data = json.dumps({'title': message.subject(), 'body': message.excerpt, 'url': message.url,
+                           'tag': f'announcement-{message.announcement_id}'}, ensure_ascii=False)
+        try:
+            webpush({'endpoint': target, 'keys': json.loads(credentials)}, data=data,
+                    vapid_private_key=self.private_key, vapid_claims={'sub': self.subject},
+                    ttl=self.ttl, timeout=self.timeout)
+        except WebPushException as e:
+            if e.response is not None and e.response.status_code in (404, 410):
+                raise PermanentFailure(f'HTTP {e.response.status_code}')
+            raise
+
+
+# --- Fan-out and sending ---
+class Notifications:
+    """Subscription fan-out and the batched, rate-limited sender (Flask extension).
+
+    ``defer_fanout(announcement_id, kind, delay)`` and ``defer_send(channel,
+    delay)`` hand the work to the job queue; without them it runs in place.
+    """
+
+    def __init__(self, app=None, db=None, change_bus=None, subscription_model=None, announcement_model=None):
+        self.app = None
+        self.db = None
+        self.change_bus = None
+        self.channels = {}
+        self.defer_fanout = None
+        self.defer_send = None
+        if app is not None:
+            self.init_app(app, db, change_bus, subscription_model, announcement_model)
+
+    def init_app(self, app, db, change_bus, subscription_model, announcement_model):
+        env = os.environ
+        config = app.config
+        self.app = app
+        self.db = db
+        self.change_bus = change_bus
+        self.subscriptions = subscription_model.__table__
+        self.announcements = announcement_model.__table__
+        self.site_url = config.setdefault('NOTIFY_SITE_URL', env.get('NOTIFY_SITE_URL', 'http://localhost:5000'))
+        self.deadline_window = timedelta(days=float(config.setdefault(
+            'NOTIFY_DEADLINE_DAYS', env.get('NOTIFY_DEADLINE_DAYS', 3))))
+        self.batch_size = int(config.setdefault('NOTIFY_BATCH_SIZE', env.get('NOTIFY_BATCH_SIZE', 100)))
+        self.max_attempts = int(config.setdefault('NOTIFY_MAX_ATTEMPTS', env.get('NOTIFY_MAX_ATTEMPTS', 5)))
+        self.keep = timedelta(days=float(config.setdefault('NOTIFY_KEEP_DAYS', env.get('NOTIFY_KEEP_DAYS', 90))))
+        # Sends per second and channel, across all workers
+        self.rates = {name: float(config.setdefault(f'NOTIFY_RATE_{name.upper()}',
+                                                    env.get(f'NOTIFY_RATE_{name.upper()}', default)))
+                      for name, default in (('email', 5), ('webhook', 20), ('webpush', 50))}
+        # Subscription requests per client IP and hour
+        self.subscribe_rate = float(config.setdefault(
+            'NOTIFY_SUBSCRIBE_PER_HOUR', env.get('NOTIFY_SUBSCRIBE_PER_HOUR', 10))) / 3600
+        self.store = bucket_store(app)
+
+        self.channels = {
+            'email': EmailChannel(
+                config.setdefault('SMTP_HOST', env.get('SMTP_HOST', 'localhost')),
+                int(config.setdefault('SMTP_PORT', env.get('SMTP_PORT', 1025))),
+                config.setdefault('NOTIFY_EMAIL_FROM', env.get('NOTIFY_EMAIL_FROM', 'no-reply@localhost')),
+                username=config.setdefault('SMTP_USERNAME', env.get('SMTP_USERNAME')),
+                password=config.setdefault('SMTP_PASSWORD', env.get('SMTP_PASSWORD')),
+                starttls=str(config.setdefault('SMTP_STARTTLS', env.get('SMTP_STARTTLS', ''))).lower()
+                in ('1', 'true', 'yes')),
+            'webhook': WebhookChannel(),
+        }
+        self.vapid_public_key = config.setdefault('VAPID_PUBLIC_KEY', env.get('VAPID_PUBLIC_KEY'))
+        vapid_private_key = config.setdefault('VAPID_PRIVATE_KEY', env.get('VAPID_PRIVATE_KEY'))
+        if webpush is not None and vapid_private_key:
+            self.channels['webpush'] = WebPushChannel(vapid_private_key, config.setdefault(
+                'VAPID_SUBJECT', env.get('VAPID_SUBJECT', 'mailto:' + self.channels['email'].sender)))
+        change_bus.subscribe(self._on_change, models=(self.announcements.name,))
+        app.extensions['notifications'] = self
+
+    def _on_change(self, change):
+        # Once per new announcement: by the worker that wrote it, never for bulk imports
+        if change.op != 'insert' or not self.change_bus.is_local(change):
+            return
+        self._fanout_later(change.pk, 'published')
+
+    def _fanout_later(self, announcement_id, kind, delay=0):
+        if self.defer_fanout is not None:
+            self.defer_fanout(announcement_id, kind, delay)
+        elif delay:
+            logger.warning('Dropped %s notifications for announcement %s: nothing runs them in %ds',
+                           kind, announcement_id, delay)
+        else:
+            with self.app.app_context():
+                self.fanout(announcement_id, kind)
+
+    def _send_later(self, channel, delay=0):
+        if self.defer_send is not None:
+            self.defer_send(channel, delay)
+        elif delay:
+            logger.warning('Left %s notifications queued: nothing sends them in %ds', channel, delay)
+        else:
+            self.send(channel)
+
+    def url(self, path, **values):
+        return self.site_url.rstrip('/') + path.format(**values)
+
+    def allow_subscribe(self, ip):
+        """Charges the client's subscription bucket; False once it is empty."""
+        return self.store.take(f'notify-subscribe:{ip}', 10, self.subscribe_rate, 1)
+
+    # --- Fan-out ---
+    def fanout(self, announcement_id, kind):
+        """Queues a delivery of announcement ``announcement_id`` for every matching active subscription."""
+        a, s = self.announcements, self.subscriptions
+        now = datetime.utcnow()
+        with self.db.engine.begin() as conn:
+            announcement = conn.execute(select(a.c.announcement_type, a.c.date_published, a.c.deadline)
+                                        .where(a.c.id == announcement_id)).first()
+            if announcement is None:
+                return 0
+            if kind == 'published' and announcement.date_published > now:
+                # Scheduled for later: announce it when it goes out
+                delay = (announcement.date_published - now).total_seconds()
+            elif kind == 'deadline' and (announcement.deadline is None or announcement.deadline < now):
+                return 0
+            else:
+                delay = None
+                matching = (
+                    select(s.c.id, s.c.channel, literal(announcement_id), literal(kind), literal('queued'),
+                           literal(0), literal(now, DateTime), literal(now, DateTime))
+                    .where(s.c.active.is_(True), s.c.channel.in_(list(self.channels)),
+                           or_(s.c.announcement_type.is_(None),
+                               s.c.announcement_type == announcement.announcement_type),
+                           ~exists().where(deliveries.c.subscription_id == s.c.id,
+                                           deliveries.c.announcement_id == announcement_id,
+                                           deliveries.c.kind == kind)))
+                queued = conn.execute(insert(deliveries).from_select(
+                    ['subscription_id', 'channel', 'announcement_id', 'kind', 'status', 'attempts',
+                     'next_attempt_at', 'created_at'], matching)).rowcount
+                channels = conn.execute(
+                    select(deliveries.c.channel).distinct()
+                    .where(deliveries.c.announcement_id == announcement_id, deliveries.c.kind == kind,
+                           deliveries.c.status == 'queued')).scalars().all()
+        if delay is not None:
+            self._fanout_later(announcement_id, kind, delay)
+            return 0
+        for channel in channels:
+            self._send_later(channel)
+        if queued:
+            logger.info('Queued %d %s notifications of announcement %s', queued, kind, announcement_id)
+        return queued
+
+    def scan_deadlines(self):
+        """Fans out reminders for announcements whose deadline is within the window."""
+        a = self.announcements
+        now = datetime.utcnow()
+        with self.db.engine.connect() as conn:
+            due = conn.execute(select(a.c.id).where(a.c.deadline >= now, a.c.deadline <= now + self.deadline_window)
+                               .order_by(a.c.deadline)).scalars().all()
+        return sum(self.fanout(announcement_id, 'deadline') for announcement_id in due)
+
+    # --- Sending ---
+    def send(self, channel_name):
+        """Sends one batch of due deliveries of a channel; returns the number sent."""
+        channel = self.channels.get(channel_name)
+        if channel is None:
+            return 0
+        d, s, a = deliveries, self.subscriptions, self.announcements
+        now = datetime.utcnow()
+        due = (select(d.c.id)
+               .where(d.c.channel == channel_name, d.c.status == 'queued', d.c.next_attempt_at <= now)
+               .order_by(d.c.next_attempt_at, d.c.id)
+               .limit(self.batch_size)
+               .with_for_update(skip_locked=True))
+        with self.db.engine.begin() as conn:
+            claimed = conn.execute(
+                update(d).where(d.c.id.in_(due), d.c.status == 'queued')
+                .values(status='sending', locked_at=now, attempts=d.c.attempts + 1)
+                .returning(d.c.id)).scalars().all()
+            if not claimed:
+                return 0
+            rows = conn.execute(
+                select(d.c.id, d.c.kind, d.c.attempts, d.c.subscription_id, s.c.target, s.c.credentials, s.c.token,
+                       s.c.active, a.c.id.label('announcement_id'), a.c.title, a.c.content, a.c.announcement_type,
+                       a.c.deadline)
+                .select_from(d.outerjoin(s, s.c.id == d.c.subscription_id)
+                             .outerjoin(a, a.c.id == d.c.announcement_id))
+                .where(d.c.id.in_(claimed))
+                .order_by(d.c.id)).all()
+
+        outcomes, gone, sent = {}, set(), 0
+        capacity = max(1, int(self.rates[channel_name]))
+        limited = False
+        try:
+            with channel.open() as deliver:
+                for row in rows:
+                    if row.target is None or not row.active or row.announcement_id is None:
+                        outcomes[row.id] = ('cancelled', 'subscription or announcement removed')
+                        continue
+                    if not self.store.take(f'notify:{channel_name}', capacity, self.rates[channel_name], 1):
+                        limited = True
+                        break
+                    message = Message(
+                        row.id, row.kind, row.announcement_id, row.title, _excerpt(row.content),
+                        row.announcement_type, row.deadline,
+                        self.url(ANNOUNCEMENT_PATH, id=row.announcement_id),
+                        self.url(UNSUBSCRIBE_PATH, token=row.token))
+                    try:
+                        deliver(row.target, row.credentials, message)
+                    except PermanentFailure as e:
+                        outcomes[row.id] = ('failed', str(e))
+                        gone.add(row.subscription_id)
+                    except Exception as e:
+                        logger.warning('Sending %s notification %s failed: %s', channel_name, row.id, e)
+                        outcomes[row.id] = ('retry', f'{type(e).__name__}: {e}')
+                    else:
+                        outcomes[row.id] = ('sent', None)
+                        sent += 1
+        except Exception as e:
+            # The channel itself failed (e.g. SMTP unreachable): what was not tried is retried
+            logger.exception('%s channel failed', channel_name)
+            for row in rows:
+                outcomes.setdefault(row.id, ('retry', f'{type(e).__name__}: {e}'))
+        self._record(rows, outcomes, gone)
+
+        if limited:
+            self._send_later(channel_name, delay=max(1.0, 1 / self.rates[channel_name]))
+        elif len(claimed) == self.batch_size:
+            self._send_later(channel_name)
+        return sent
+
+    def _record(self, rows, outcomes, gone):
+        d = deliveries
+        now = datetime.utcnow()
+        with self.db.engine.begin() as conn:
+            for row in rows:
+                status, error = outcomes.get(row.id, (None, None))
+                values = {'locked_at': None, 'last_error': error and error[:2000]}
+                if status is None:
+                    # Not tried (rate limit): back in line without spending an attempt
+                    values.update(status='queued', attempts=row.attempts - 1)
+                elif status == 'sent':
+                    values.update(status='sent', sent_at=now)
+                elif status == 'retry' and row.attempts < self.max_attempts:
+                    delay = min(MAX_RETRY_DELAY, RETRY_DELAY * 2 ** (row.attempts - 1))
+                    values.update(status='queued', next_attempt_at=now + timedelta(seconds=delay))
+                else:
+                    values.update(status='failed' if status == 'retry' else status)
+                conn.execute(update(d).where(d.c.id == row.id).values(**values))
+            if gone:
+                s = self.subscriptions
+                conn.execute(update(s).where(s.c.id.in_(gone)).values(active=False))
+                logger.info('Deactivated %d subscriptions whose target is gone', len(gone))
+
+    def send_confirmation(self, subscription_id):
+        """Emails the link that activates an email subscription."""
+        s = self.subscriptions
+        with self.db.engine.connect() as conn:
+            row = conn.execute(select(s.c.target, s.c.token, s.c.active)
+                               .where(s.c.id == subscription_id, s.c.channel == 'email')).first()
+        if row is None or row.active:
+            return
+        if not self.store.take('notify:email', max(1, int(self.rates['email'])), self.rates['email'], 1):
+            raise RuntimeError('email send rate reached; retrying later')
+        channel = self.channels['email']
+        email = EmailMessage()
+        email['From'] = channel.sender
+        email['To'] = row.target
+        email['Subject'] = 'تأكيد الاشتراك في إشعارات البلدية'
+        email.set_content('\n'.join([
+            'لتأكيد اشتراكك في إشعارات الإعلانات الجديدة والمواعيد النهائية، افتح الرابط التالي:', '',
+            self.url(CONFIRM_PATH, token=row.token), '',
+            'إذا لم تطلب هذا الاشتراك فتجاهل هذه الرسالة.']))
+        smtp = channel.connect()
+        try:
+            channel.send_email(smtp, email)
+        except PermanentFailure as e:
+            # Nobody to confirm: the subscription simply stays inactive
+            logger.info('Confirmation of subscription %s not delivered: %s', subscription_id, e)
+        finally:
+            smtp.quit()
+
+    # --- Upkeep ---
+    def maintain(self):
+        """Requeues deliveries of dead workers, deletes old finished ones and wakes channels with due work."""
+        d = deliveries
+        now = datetime.utcnow()
+        with self.db.engine.begin() as conn:
+            released = conn.execute(
+                update(d).where(d.c.status == 'sending', d.c.locked_at < now - timedelta(seconds=SENDING_LEASE))
+                .values(status='queued', locked_at=None, next_attempt_at=now, last_error='worker lease expired')
+            ).rowcount
+            conn.execute(delete(d).where(d.c.status.in_(('sent', 'failed', 'cancelled')),
+                                         d.c.created_at < now - self.keep))
+            channels = conn.execute(select(d.c.channel).distinct()
+                                    .where(d.c.status == 'queued', d.c.next_attempt_at <= now)).scalars().all()
+        if released:
+            logger.warning('Requeued %d notifications whose worker lease expired', released)
+        for channel in channels:
+            self._send_later(channel)
+
+    # --- Visibility ---
+    def stats(self):
+        """Active subscriptions and delivery counts per channel, and the oldest due delivery's wait."""
+        d, s = deliveries, self.subscriptions
+        now = datetime.utcnow()
+        with self.db.engine.connect() as conn:
+            subscribers = conn.execute(select(s.c.channel, func.count()).where(s.c.active.is_(True))
+                                       .group_by(s.c.channel)).all()
+            counts = conn.execute(select(d.c.channel, d.c.status, func.count())
+                                  .group_by(d.c.channel, d.c.status)).all()
+            oldest = conn.execute(select(func.min(d.c.next_attempt_at))
+                                  .where(d.c.status == 'queued', d.c.next_attempt_at <= now)).scalar()
+        channels = {name: {'enabled': name in self.channels, 'subscribers': 0, 'per_second': self.rates[name],
+                           'deliveries': {}} for name in CHANNELS}
+        for channel, count in subscribers:
+            channels.setdefault(channel, {'deliveries': {}})['subscribers'] = count
+        for channel, status, count in counts:
+            channels.setdefault(channel, {'deliveries': {}})['deliveries'][status] = count
+        if isinstance(oldest, str):
+            oldest = datetime.fromisoformat(oldest)
+        return {'channels': channels,
+                'oldest_due_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0.0}
@@ -0,0 +1,214 @@
+"""Keyset (cursor) pagination and streamed JSON helpers for the public APIs."""
+import base64
+import json
+import operator
+from datetime import date, datetime
+from typing import NamedTuple
+
+from sqlalchemy import and_, or_, select, tuple_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+STREAM_BATCH_SIZE = 100
+
+
+class PaginationError(ValueError):
+    """Raised when a client sends a malformed cursor, limit or field list."""
+
+
+def parse_limit(raw, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """Returns the requested page size, clamped to ``maximum``."""
+    if raw in (None, ''):
+        return default
+    try:
+        limit = int(raw)
+    except ValueError:
+        raise PaginationError('limit must be an integer')
+    if limit < 1:
+        raise PaginationError('limit must be positive')
+    return min(limit, maximum)
+
+
+def parse_fields(raw, model, default=None, required=()):
+    """Maps a comma separated ``fields`` argument onto the model's columns.
+
+    Columns listed in ``required`` (the keyset columns) are always selected so
+    the next cursor can be computed; they are returned first.
+    """
+    available = {c.key: getattr(model, c.key) for c in model.__mapper__.column_attrs}
+    if raw:
+        names = [name.strip() for name in raw.split(',') if name.strip()]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise PaginationError('unknown fields: ' + ', '.join(unknown))
+    else:
+        names = list(default or available)
+    ordered = list(required) + [name for name in names if name not in required]
+    return [available[name] for name in ordered]
+
+
+def _to_json_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _from_json_value(value, column):
+    python_type = column.type.python_type
+    if value is None:
+        return None
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def coerce_value(column, raw):
+    """Converts a query-string value to the Python type of ``column``."""
+    try:
+        return _from_json_value(raw, column)
+    except (ValueError, TypeError):
+        raise PaginationError(f'invalid value for {column.key}: {raw}')
+
+
+def encode_cursor(values):
+    """Encodes the keyset values of the last row of a page as an opaque token."""
+    payload = json.dumps([_to_json_value(v) for v in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, columns):
+    """Decodes a token produced by :func:`encode_cursor` for ``columns``."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(values, list) or len(values) != len(columns):
+            raise ValueError
+        return tuple(_from_json_value(v, c) for v, c in zip(values, columns))
+    except (ValueError, TypeError):
+        raise PaginationError('invalid cursor')
+
+
+def parse_sort(raw, allowed, default):
+    """Parses ``sort=name`` / ``sort=-name`` into ``(name, descending)``."""
+    value = raw or default
+    name = value.lstrip('-')
+    if name not in allowed:
+        raise PaginationError('sort must be one of: ' + ', '.join(sorted(allowed)))
+    return name, value.startswith('-')
+
+
+def _nullable(column):
+    return bool(getattr(getattr(column, 'expression', column), 'nullable', False))
+
+
+def keyset_ordering(order_columns, descending=True):
+    """ORDER BY clauses for the keyset; NULLs of a nullable lead column sort last."""
+    clauses = []
+    for column in order_columns:
+        clause = column.desc() if descending else column.asc()
+        if _nullable(column):
+            clause = clause.nulls_last()
+        clauses.append(clause)
+    return clauses
+
+
+def keyset_criteria(order_columns, after=None, filters=(), descending=True):
+    """Builds the WHERE criteria for the page that follows ``after``.
+
+    The row-value comparison lets the database walk the composite index
+    directly. Only the lead column may be nullable (the trailing column is
+    always the primary key); its NULLs form a final segment of the listing.
+    """
+    criteria = list(filters)
+    if after is None:
+        return criteria
+    compare = operator.lt if descending else operator.gt
+    head, rest = order_columns[0], order_columns[1:]
+    if not _nullable(head):
+        criteria.append(compare(tuple_(*order_columns), tuple_(*after)))
+    elif after[0] is None:
+        criteria.append(and_(head.is_(None), compare(tuple_(*rest), tuple_(*after[1:]))))
+    else:
+        criteria.append(or_(compare(tuple_(*order_columns), tuple_(*after)), head.is_(None)))
+    return criteria
+
+
+def keyset_select(columns, order_columns, criteria, limit, descending=True, stream=True):
+    """Returns the page query, selecting only ``columns`` (no ORM entities).
+
+    ``stream`` fetches the rows in batches as the response is written; the
+    async read path leaves it off and buffers the (bounded) page instead.
+    """
+    stmt = (
+        select(*columns)
+        .where(*criteria)
+        .order_by(*keyset_ordering(order_columns, descending))
+        .limit(limit)
+    )
+    if stream:
+        stmt = stmt.execution_options(yield_per=STREAM_BATCH_SIZE)
+    return stmt
+
+
+def next_cursor_select(order_columns, criteria, limit, descending=True):
+    """The probe for the page boundary: the keyset of the last row and the one after it.
+
+    Only the keyset columns are read, so this is an index-only probe rather
+    than a second fetch of the page itself.
+    """
+    return (
+        select(*order_columns)
+        .where(*criteria)
+        .order_by(*keyset_ordering(order_columns, descending))
+        .offset(limit - 1)
+        .limit(2)
+    )
+
+
+def cursor_from_probe(rows):
+    """Returns the next page cursor from the rows of :func:`next_cursor_select`, or ``None``."""
+    if len(rows) < 2:
+        return None
+    return encode_cursor(rows[0])
+
+
+def next_cursor(session, order_columns, criteria, limit, descending=True):
+    """Returns the cursor for the page after this one, or ``None``."""
+    return cursor_from_probe(session.execute(next_cursor_select(order_columns, criteria, limit, descending)).all())
+
+
+class KeysetPage(NamedTuple):
+    """One requested page of a model: the columns, keyset order and criteria."""
+    model: type
+    columns: list
+    order_columns: tuple
+    criteria: list
+    limit: int
+    descending: bool = True
+
+    def select(self, stream=True):
+        return keyset_select(self.columns, self.order_columns, self.criteria, self.limit, self.descending, stream)
+
+    def cursor_select(self):
+        return next_cursor_select(self.order_columns, self.criteria, self.limit, self.descending)
+
+
+def row_to_dict(row):
+    """Converts a column-only result row to a JSON-ready dict."""
+    return {key: _to_json_value(value) for key, value in row._mapping.items()}
+
+
+def stream_json_array(rows, dumps, serialize=row_to_dict):
+    """Yields ``rows`` as a JSON array, one element per chunk."""
+    yield '['
+    first = True
+    for row in rows:
+        if not first:
+            yield ','
+        first = False
+        yield dumps(serialize(row))
+    yield ']'
@@ -0,0 +1,128 @@
+"""Password hashing off the request threads.
+
+scrypt/pbkdf2 are deliberately slow; run inline they hold one of the few
+gunicorn request slots for the whole computation. :class:`PasswordHasher`
+runs them in a small process pool instead, caps the number of hashes in
+flight (``PASSWORD_HASH_MAX_PENDING``) and fails fast with
+:class:`HashingBusy` beyond that, so a burst of logins cannot queue up
+behind itself and starve page traffic.
+
+``PASSWORD_HASH_METHOD`` is the method new hashes use; stored hashes made
+with other parameters are upgraded on the next successful login.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# Werkzeug's default scrypt parameters, spelled out so they can be compared
+DEFAULT_METHOD = 'scrypt:32768:8:1'
+
+
+class HashingBusy(RuntimeError):
+    """Raised when too many hashes are already queued or one timed out."""
+
+
+def _generate(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _check(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+def method_prefix(method):
+    """The parameters Werkzeug records for ``method``, e.g. ``scrypt:32768:8:1`` for ``scrypt``.
+
+    Expands the shorthands as :func:`~werkzeug.security.generate_password_hash`
+    does, without computing a hash.
+    """
+    name, *args = method.split(':')
+    if name == 'scrypt':
+        if not args:
+            return DEFAULT_METHOD
+        if len(args) != 3:
+            raise ValueError("'scrypt' takes 3 arguments.")
+        return 'scrypt:%d:%d:%d' % tuple(map(int, args))
+    if name == 'pbkdf2':
+        if len(args) > 2:
+            raise ValueError("'pbkdf2' takes 2 arguments.")
+        hash_name = args[0] if args else 'sha256'
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{hash_name}:{iterations}'
+    raise ValueError(f"Invalid hash method '{name}'.")
+
+
+class PasswordHasher:
+    """Bounded, process-pool backed password hashing (Flask extension)."""
+
+    def __init__(self, app=None):
+        self.method = DEFAULT_METHOD
+        self.workers = 2
+        self.max_pending = 8
+        self.timeout = 10.0
+        self._prefix = method_prefix(self.method)
+        self._executor = None
+        self._executor_pid = None
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        env = os.environ
+        self.method = app.config.setdefault('PASSWORD_HASH_METHOD', env.get('PASSWORD_HASH_METHOD', DEFAULT_METHOD))
+        # 0 workers hashes inline (CLI commands, tests)
+        self.workers = int(app.config.setdefault('PASSWORD_HASH_WORKERS', env.get('PASSWORD_HASH_WORKERS', 2)))
+        self.max_pending = int(app.config.setdefault('PASSWORD_HASH_MAX_PENDING',
+                                                     env.get('PASSWORD_HASH_MAX_PENDING', 8)))
+        self.timeout = float(app.config.setdefault('PASSWORD_HASH_TIMEOUT', env.get('PASSWORD_HASH_TIMEOUT', 10)))
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._prefix = method_prefix(self.method)
+        app.extensions['password_hasher'] = self
+
+    def _pool(self):
+        # Created lazily and per process: a pool inherited across fork is unusable
+        if self._executor is None or self._executor_pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._executor_pid != os.getpid():
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+                    self._executor_pid = os.getpid()
+        return self._executor
+
+    def _run(self, fn, *args):
+        if self.workers <= 0:
+            return fn(*args)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HashingBusy('password hashing queue is full')
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # The slot is held until the hash finishes, not until we stop waiting for it,
+        # so work still running after a timeout counts against max_pending
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy('password hashing timed out')
+
+    def hash(self, password):
+        return self._run(_generate, password, self.method)
+
+    def check(self, password_hash, password):
+        return self._run(_check, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True when ``password_hash`` was made with parameters other than ``method``."""
+        return password_hash.split('$', 1)[0] != self._prefix
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,93 @@
+"""Cached login principals so authenticated page views skip the user query.
+
+Flask-Login stores ``"<id>:<stamp>"`` in the session, where the stamp is
+derived from the password hash: changing a password therefore logs out
+every existing session. ``load_user`` answers from a bounded per-worker TTL
+cache of :class:`Principal` objects and only reads the ``user`` table on a
+miss; committed writes to ``user`` (from any worker, via the change bus)
+evict the entry.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from flask_login import UserMixin
+
+
+def session_stamp(password_hash):
+    """Short fingerprint of the password hash, embedded in the session id."""
+    return hashlib.sha256(password_hash.encode('utf-8')).hexdigest()[:12]
+
+
+class Principal(UserMixin):
+    """The attributes of a user that requests read, detached from the ORM."""
+
+    __slots__ = ('id', 'username', 'email', 'is_admin', 'stamp')
+
+    def __init__(self, id, username, email, is_admin, stamp):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.is_admin = bool(is_admin)
+        self.stamp = stamp
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.email, user.is_admin, session_stamp(user.password_hash))
+
+    def get_id(self):
+        return f'{self.id}:{self.stamp}'
+
+    def __repr__(self):
+        return f"Principal('{self.username}', '{self.email}')"
+
+
+class PrincipalCache:
+    """A thread-safe LRU of principals whose entries expire after ``ttl`` seconds."""
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id, stamp):
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is None:
+                return None
+            principal, expires = entry
+            if expires < time.monotonic() or (stamp is not None and principal.stamp != stamp):
+                del self._data[user_id]
+                return None
+            self._data.move_to_end(user_id)
+            return principal
+
+    def put(self, principal):
+        with self._lock:
+            self._data[principal.id] = (principal, time.monotonic() + self.ttl)
+            self._data.move_to_end(principal.id)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def on_change(self, change):
+        """Change bus subscriber for the ``user`` table."""
+        if change.pk is None:
+            self.clear()
+        else:
+            self.discard(change.pk)
+
+
+def parse_session_id(value):
+    """Splits ``"<id>:<stamp>"``; ids from before stamps were added have no stamp."""
+    user_id, _, stamp = value.partition(':')
+    return int(user_id), stamp or None
@@ -0,0 +1,151 @@
+"""Read-replica routing for the public, read-only endpoints.
+
+Set ``DATABASE_REPLICA_URLS`` to a comma separated list of replica URLs.
+Views decorated with :func:`ReplicaRouter.replica_reads` (and code inside
+``with replica_router.reading():``) then send their SELECTs to a replica,
+chosen round-robin among the healthy ones. Everything else -- Flask-Admin,
+registration, login writes, any flush -- stays on the primary.
+
+Read-your-writes: every committed write (seen through the change bus, so in
+every worker) pins reads of that table to the primary for
+``DATABASE_REPLICA_RYW_SECONDS``. That covers the admin who just saved and
+keeps freshly invalidated cache entries from being refilled from a replica
+that has not caught up yet.
+
+A replica whose connections fail is skipped for
+``DATABASE_REPLICA_RETRY_SECONDS`` and its reads fall back to the primary.
+"""
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.sql.util import find_tables
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    def __init__(self, url, engine_options):
+        self.engine = create_engine(url, **engine_options)
+        self.name = self.engine.url.render_as_string(hide_password=True)
+        self.down_until = 0.0
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.down_until
+
+
+class ReplicaRouter:
+    """Flask extension holding the replica engines and the routing policy."""
+
+    def __init__(self):
+        self.replicas = []
+        self.ryw_seconds = 5.0
+        self.retry_seconds = 30.0
+        self._next = itertools.count()
+        self._primary_until = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app, change_bus):
+        urls = app.config.setdefault('DATABASE_REPLICA_URLS', os.environ.get('DATABASE_REPLICA_URLS', ''))
+        self.ryw_seconds = float(app.config.setdefault(
+            'DATABASE_REPLICA_RYW_SECONDS', os.environ.get('DATABASE_REPLICA_RYW_SECONDS', 5)))
+        self.retry_seconds = float(app.config.setdefault(
+            'DATABASE_REPLICA_RETRY_SECONDS', os.environ.get('DATABASE_REPLICA_RETRY_SECONDS', 30)))
+        engine_options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+        for url in filter(None, (u.strip() for u in urls.split(','))):
+            replica = Replica(url, engine_options)
+            self.watch(replica, replica.engine)
+            self.replicas.append(replica)
+        if self.replicas:
+            change_bus.subscribe(self._on_change)
+        app.extensions['replica_router'] = self
+
+    # --- Marking read-only work ---
+    def replica_reads(self, view):
+        """Marks a view whose queries may be answered by a replica."""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            g.replica_reads = True
+            return view(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def reading(self):
+        """Lets the enclosed queries go to a replica, restoring the previous mode after."""
+        if not has_request_context():
+            yield
+            return
+        previous = g.get('replica_reads', False)
+        g.replica_reads = True
+        try:
+            yield
+        finally:
+            g.replica_reads = previous
+
+    # --- Routing ---
+    def _on_change(self, change):
+        with self._lock:
+            self._primary_until[change.model] = time.monotonic() + self.ryw_seconds
+
+    def watch(self, replica, engine):
+        """Marks ``replica`` down when connections of ``engine`` (sync or async) fail."""
+        def on_error(context):
+            if context.is_disconnect or context.connection is None:
+                replica.down_until = time.monotonic() + self.retry_seconds
+                logger.warning('Replica %s failed (%s); using the primary for %.0fs',
+                               replica.name, context.original_exception, self.retry_seconds)
+        event.listen(getattr(engine, 'sync_engine', engine), 'handle_error', on_error)
+
+    def pick(self, tables):
+        """Returns the replica to read ``tables`` from, or ``None`` for the primary."""
+        if not self.replicas or not tables:
+            return None
+        now = time.monotonic()
+        if any(self._primary_until.get(table, 0.0) > now for table in tables):
+            return None
+        healthy = [r for r in self.replicas if r.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._next) % len(healthy)]
+
+    def choose(self, tables):
+        """Returns a replica engine for reading ``tables``, or ``None`` for the primary."""
+        replica = self.pick(tables)
+        return replica.engine if replica is not None else None
+
+    def route(self, session, mapper, clause):
+        if session._flushing or session.new or session.dirty or session.deleted:
+            return None
+        if not (has_request_context() and g.get('replica_reads', False)):
+            return None
+        if mapper is not None:
+            tables = {inspect(mapper).local_table.name}
+        elif clause is not None:
+            tables = {t.name for t in find_tables(clause, include_crud=True) if hasattr(t, 'name')}
+            # Only plain SELECTs: anything that writes goes to the primary
+            if getattr(clause, 'is_dml', False):
+                return None
+        else:
+            return None
+        return self.choose(tables)
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that lets the replica router pick the bind for reads."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            router = current_app.extensions.get('replica_router')
+            if router is not None and router.replicas:
+                engine = router.route(self, mapper, clause)
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
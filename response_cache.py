@@ -0,0 +1,370 @@
+"""Conditional responses and a shared rendered-body cache for public pages.
+
+Every cached view declares the *scopes* it depends on, e.g. ``announcement``
+for a listing or ``announcement:{announcement_id}`` for a detail page. Each
+scope has a version token kept in the shared backend; the ETag of a response
+is derived from those tokens, so bumping a scope both invalidates the stored
+bodies and turns client revalidations into fresh 200s. Nothing is ever
+deleted eagerly: stale bodies simply stop being addressed and age out of the
+bounded store.
+
+Backends (``RESPONSE_CACHE_BACKEND``):
+
+* ``memory``     -- per-process LRU only; fine for a single worker.
+* ``filesystem`` -- files under ``RESPONSE_CACHE_DIR``, shared by all workers
+  on the host.
+* ``redis``      -- any Redis-protocol server at ``RESPONSE_CACHE_REDIS_URL``.
+
+With a shared backend an in-process LRU still sits in front of it, so a hot
+page costs one version lookup and no rendering.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import Response, make_response, request, session
+
+VERSION_PREFIX = 'v:'
+BODY_PREFIX = 'b:'
+
+
+class LRUStore:
+    """A thread-safe, entry-bounded in-process store."""
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def add(self, key, value):
+        """Stores ``value`` unless ``key`` exists; returns the stored value."""
+        with self._lock:
+            if key not in self._data:
+                self._data[key] = value
+            return self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class FileSystemStore:
+    """Stores values as files so every worker on the host shares them.
+
+    Writes go through a temporary file and ``os.replace`` (``os.link`` for
+    :meth:`add`) so readers never see a partial entry. The directory is pruned back to ``max_entries`` (oldest
+    first) every ``prune_interval`` writes.
+    """
+
+    def __init__(self, directory, max_entries=2048, prune_interval=64):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.prune_interval = prune_interval
+        self._writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+        os.replace(tmp, self._path(key))
+        self._writes += 1
+        if self._writes % self.prune_interval == 0:
+            self.prune()
+
+    def add(self, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(value)
+        # link() creates the entry complete or not at all, and fails if another writer got there first
+        try:
+            os.link(tmp, self._path(key))
+        except FileExistsError:
+            existing = self.get(key)
+            return value if existing is None else existing
+        finally:
+            os.remove(tmp)
+        return value
+
+    def prune(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith('.tmp'):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+        excess = len(entries) - self.max_entries
+        if excess > 0:
+            for _, path in sorted(entries)[:excess]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.is_file():
+                os.remove(entry.path)
+
+
+class RedisStore:
+    """Stores values in a Redis-compatible server (eviction is left to its maxmemory policy)."""
+
+    def __init__(self, url, ttl=86400):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value):
+        self.client.set(key, value, ex=self.ttl)
+
+    def add(self, key, value):
+        if self.client.set(key, value, nx=True):
+            return value
+        return self.client.get(key) or value
+
+    def clear(self):
+        self.client.flushdb()
+
+
+# Headers that are recomputed per response and never replayed from the cache
+_UNCACHED_HEADERS = {'set-cookie', 'content-length', 'etag', 'last-modified', 'cache-control', 'vary', 'date'}
+
+
+def _pack(response, body):
+    headers = [(k, v) for k, v in response.headers.items() if k.lower() not in _UNCACHED_HEADERS]
+    return json.dumps(headers).encode('utf-8') + b'\n' + body
+
+
+def _unpack(value):
+    headers, _, body = value.partition(b'\n')
+    return Response(body, headers=json.loads(headers))
+
+
+def deploy_fingerprint(app):
+    """Hashes template and static file names, sizes and mtimes so a deploy never reuses old output.
+
+    Static files count because pages embed their versioned URLs.
+    """
+    digest = hashlib.sha1()
+    roots = [os.path.join(app.root_path, app.template_folder or 'templates')]
+    if app.static_folder:
+        roots.append(app.static_folder)
+    for root in roots:
+        for dirpath, _, filenames in sorted(os.walk(root)):
+            for name in sorted(filenames):
+                stat = os.stat(os.path.join(dirpath, name))
+                digest.update(f'{dirpath}/{name}:{stat.st_size}:{stat.st_mtime_ns}'.encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+class ResponseCache:
+    """Flask extension answering conditional requests and caching rendered bodies."""
+
+    def __init__(self, app=None):
+        self.local = None
+        self.shared = None
+        self.namespace = ''
+        # Scopes every cached view depends on, e.g. settings rendered by the layout
+        self.site_scopes = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.setdefault('RESPONSE_CACHE_BACKEND', os.environ.get('RESPONSE_CACHE_BACKEND', 'memory'))
+        max_entries = int(app.config.setdefault('RESPONSE_CACHE_MAX_ENTRIES',
+                                                os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 512)))
+        self.local = LRUStore(max_entries)
+        if backend == 'filesystem':
+            directory = app.config.setdefault('RESPONSE_CACHE_DIR', os.environ.get(
+                'RESPONSE_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'municipality-response-cache')))
+            self.shared = FileSystemStore(directory, max_entries=max_entries * 4)
+        elif backend == 'redis':
+            self.shared = RedisStore(app.config.setdefault('RESPONSE_CACHE_REDIS_URL', os.environ.get(
+                'RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0')))
+        elif backend != 'memory':
+            raise RuntimeError(f'Unknown RESPONSE_CACHE_BACKEND: {backend}')
+        self.namespace = app.config.get('RESPONSE_CACHE_NAMESPACE') or deploy_fingerprint(app)
+        app.extensions['response_cache'] = self
+
+    # --- Scope versions ---
+    @property
+    def _version_store(self):
+        return self.shared or self.local
+
+    def versions(self, scopes):
+        """Returns the current version token of every scope, creating missing ones."""
+        store = self._version_store
+        tokens = []
+        for scope in scopes:
+            key = VERSION_PREFIX + scope
+            token = store.get(key)
+            if token is None:
+                token = store.add(key, f'{time.time_ns():x}'.encode('ascii'))
+            tokens.append(token.decode('ascii') if isinstance(token, bytes) else token)
+        return tokens
+
+    def invalidate(self, *scopes):
+        """Bumps the version of each scope; dependent ETags and bodies go stale at once."""
+        store = self._version_store
+        for scope in scopes:
+            store.set(VERSION_PREFIX + scope, f'{time.time_ns():x}'.encode('ascii'))
+
+    # --- Bodies ---
+    def _get_body(self, key):
+        value = self.local.get(BODY_PREFIX + key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(BODY_PREFIX + key)
+            if value is not None:
+                self.local.set(BODY_PREFIX + key, value)
+        return value
+
+    def _set_body(self, key, value):
+        self.local.set(BODY_PREFIX + key, value)
+        if self.shared is not None:
+            self.shared.set(BODY_PREFIX + key, value)
+
+    def clear(self):
+        self.local.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    # --- View decorator ---
+    def cached(self, scopes=(), bypass=None, cache_control='public, no-cache'):
+        """Caches a GET view keyed on its URL and the versions of ``scopes``.
+
+        ``scopes`` are format strings filled from the view arguments, or a
+        callable taking the view arguments and returning the scopes. When
+        ``bypass()`` returns true the view runs untouched (e.g. for logged-in
+        users whose pages carry personal navigation).
+        """
+        def decorator(view):
+            @wraps(view)
+            def wrapper(**kwargs):
+                if request.method not in ('GET', 'HEAD') or (bypass is not None and bypass()):
+                    return view(**kwargs)
+
+                etag, last_modified = self._validators(scopes, kwargs)
+                if self._not_modified(etag, last_modified):
+                    response = Response(status=304)
+                    return self._decorate(response, etag, last_modified, cache_control)
+
+                cached = self._get_body(etag)
+                if cached is not None:
+                    return self._decorate(_unpack(cached), etag, last_modified, cache_control)
+
+                response = make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+                if response.is_streamed:
+                    response.response = self._tee(response.response, etag, response)
+                else:
+                    self._set_body(etag, _pack(response, response.get_data()))
+                return self._decorate(response, etag, last_modified, cache_control)
+            return wrapper
+        return decorator
+
+    def cached_async(self, scopes=(), cache_control='public, no-cache'):
+        """:meth:`cached` for coroutine views (the ASGI read path).
+
+        The view must return a complete, non-streamed response; store lookups
+        are cheap local reads and stay on the event loop.
+        """
+        def decorator(view):
+            @wraps(view)
+            async def wrapper(**kwargs):
+                etag, last_modified = self._validators(scopes, kwargs)
+                if self._not_modified(etag, last_modified):
+                    return self._decorate(Response(status=304), etag, last_modified, cache_control)
+
+                cached = self._get_body(etag)
+                if cached is not None:
+                    return self._decorate(_unpack(cached), etag, last_modified, cache_control)
+
+                response = make_response(await view(**kwargs))
+                if response.status_code != 200:
+                    return response
+                self._set_body(etag, _pack(response, response.get_data()))
+                return self._decorate(response, etag, last_modified, cache_control)
+            return wrapper
+        return decorator
+
+    def _validators(self, scopes, kwargs):
+        """Returns the ETag and Last-Modified of the current request."""
+        if callable(scopes):
+            tokens = self.versions([*scopes(**kwargs), *self.site_scopes])
+        else:
+            tokens = self.versions([*(scope.format(**kwargs) for scope in scopes), *self.site_scopes])
+        seed = json.dumps([self.namespace, request.full_path, tokens, datetime.now(timezone.utc).year])
+        etag = hashlib.sha1(seed.encode('utf-8')).hexdigest()
+        last_modified = None
+        if tokens:
+            last_modified = datetime.fromtimestamp(max(int(t, 16) for t in tokens) // 10**9, timezone.utc)
+        return etag, last_modified
+
+    def _tee(self, chunks, key, response):
+        """Passes a streamed body through while collecting it for the cache."""
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            yield chunk
+        self._set_body(key, _pack(response, b''.join(parts)))
+
+    @staticmethod
+    def _not_modified(etag, last_modified):
+        if request.if_none_match:
+            return request.if_none_match.contains(etag)
+        if last_modified is not None and request.if_modified_since is not None:
+            return last_modified <= request.if_modified_since
+        return False
+
+    @staticmethod
+    def _decorate(response, etag, last_modified, cache_control):
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.headers['Cache-Control'] = cache_control
+        response.vary.add('Cookie')
+        return response
+
+
+def has_pending_flashes():
+    """True when the session holds flash messages that a cached body would drop."""
+    return bool(session.get('_flashes'))
@@ -0,0 +1,369 @@
+"""Arabic-aware full-text search over the public content tables.
+
+Text is normalized in Python before it is indexed or queried (diacritics
+and tatweel removed, alef/hamza/ya/ta-marbuta variants folded, Arabic-Indic
+digits mapped to ASCII, the definite article and its clitic forms stripped),
+so both backends see the same terms:
+
+* ``postgres`` -- one ``search_document`` row per indexed record holding a
+  weighted ``tsvector`` under a GIN index; ranked with ``ts_rank_cd``.
+* ``memory``   -- a per-worker inverted index, built on the first search;
+  used for SQLite/dev.
+
+Both are kept current from the change bus: the PostgreSQL index is updated
+by the worker that made the write, the in-memory index by every worker.
+:meth:`SearchIndex.search_async` runs the PostgreSQL query on an async
+connection for the ASGI read path.
+"""
+import asyncio
+import math
+import re
+import threading
+from bisect import bisect_left
+from typing import NamedTuple
+
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, bindparam, select, text
+from sqlalchemy.dialects.postgresql import TSVECTOR
+
+metadata = MetaData()
+
+search_documents = Table(
+    'search_document', metadata,
+    Column('doc_table', String(50), primary_key=True),
+    Column('doc_id', Integer, primary_key=True),
+    Column('title', String(255), nullable=False),
+    Column('document', TSVECTOR, nullable=False),
+    Index('ix_search_document_document', 'document', postgresql_using='gin'),
+)
+
+# ts_rank weights for A/B/C, mirrored by the in-memory scorer
+WEIGHTS = {'A': 1.0, 'B': 0.4, 'C': 0.2}
+REINDEX_BATCH_SIZE = 500
+
+# --- Arabic normalization ---
+# Quranic marks, harakat, superscript alef and tatweel
+_DIACRITICS = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_FOLDING = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ؤ': 'و', 'ئ': 'ي', 'ى': 'ي', 'ة': 'ه',
+    **{chr(0x0660 + d): str(d) for d in range(10)},
+    **{chr(0x06f0 + d): str(d) for d in range(10)},
+})
+_TOKEN = re.compile(r'\w+')
+# Longest first so "وال" is stripped before "ال"
+_ARTICLE_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+
+
+def normalize(value):
+    """Folds Arabic orthographic variants and case so spellings compare equal."""
+    return _DIACRITICS.sub('', value).translate(_FOLDING).casefold()
+
+
+def _strip_article(token):
+    for prefix in _ARTICLE_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            return token[len(prefix):]
+    return token
+
+
+def tokenize(value):
+    """Splits text into normalized index terms."""
+    if not value:
+        return []
+    return [_strip_article(t) for t in _TOKEN.findall(normalize(str(value)))]
+
+
+class SearchSource(NamedTuple):
+    """A model exposed to search: its title column and per-column weights."""
+    table: str
+    model: type
+    title: str
+    weights: dict
+
+    def columns(self):
+        names = dict.fromkeys(['id', self.title, *self.weights])
+        return [getattr(self.model, name) for name in names]
+
+    def weighted_terms(self, row):
+        """Returns ``{'A': [...], 'B': [...], 'C': [...]}`` for a result row."""
+        mapping = row._mapping
+        terms = {weight: [] for weight in WEIGHTS}
+        for name, weight in self.weights.items():
+            terms[weight].extend(tokenize(mapping[name]))
+        return terms
+
+
+class SearchHit(NamedTuple):
+    type: str
+    id: int
+    title: str
+    rank: float
+
+
+def build_tsquery(tokens):
+    """ANDs the query terms; the last one also matches as a prefix (search-as-you-type)."""
+    return ' & '.join(tokens[:-1] + [tokens[-1] + ':*'])
+
+
+# --- Backends ---
+class PostgresBackend:
+    """Keeps ``search_document`` in sync and queries it through the GIN index."""
+
+    _upsert = text(
+        "INSERT INTO search_document (doc_table, doc_id, title, document) VALUES "
+        "(:doc_table, :doc_id, :title, "
+        "setweight(to_tsvector('simple', :a), 'A') || "
+        "setweight(to_tsvector('simple', :b), 'B') || "
+        "setweight(to_tsvector('simple', :c), 'C')) "
+        "ON CONFLICT (doc_table, doc_id) DO UPDATE "
+        "SET title = EXCLUDED.title, document = EXCLUDED.document"
+    )
+
+    def __init__(self, engine_getter):
+        self.engine = engine_getter
+
+    def is_empty(self):
+        with self.engine().connect() as conn:
+            return conn.execute(text('SELECT 1 FROM search_document LIMIT 1')).first() is None
+
+    def index_rows(self, source, rows, conn):
+        params = []
+        for row in rows:
+            terms = source.weighted_terms(row)
+            params.append({'doc_table': source.table, 'doc_id': row.id,
+                           'title': row._mapping[source.title] or '',
+                           'a': ' '.join(terms['A']), 'b': ' '.join(terms['B']), 'c': ' '.join(terms['C'])})
+        if params:
+            conn.execute(self._upsert, params)
+
+    def remove(self, table, doc_id, conn):
+        conn.execute(search_documents.delete().where(search_documents.c.doc_table == table,
+                                                     search_documents.c.doc_id == doc_id))
+
+    def reindex(self, source):
+        with self.engine().begin() as conn:
+            conn.execute(search_documents.delete().where(search_documents.c.doc_table == source.table))
+            result = conn.execution_options(yield_per=REINDEX_BATCH_SIZE).execute(select(*source.columns()))
+            for batch in result.partitions():
+                self.index_rows(source, batch, conn)
+
+    def apply(self, source, change):
+        with self.engine().begin() as conn:
+            if change.op == 'delete':
+                self.remove(source.table, change.pk, conn)
+                return
+            row = conn.execute(select(*source.columns()).where(source.model.id == change.pk)).first()
+            if row is None:
+                self.remove(source.table, change.pk, conn)
+            else:
+                self.index_rows(source, [row], conn)
+
+    _query = text(
+        "SELECT doc_table, doc_id, title, ts_rank_cd(document, q) AS rank, count(*) OVER () AS total "
+        "FROM search_document, to_tsquery('simple', :q) AS q "
+        "WHERE document @@ q AND doc_table IN :types "
+        "ORDER BY rank DESC, doc_table, doc_id LIMIT :limit OFFSET :offset"
+    ).bindparams(bindparam('types', expanding=True))
+
+    @staticmethod
+    def _params(tokens, types, limit, offset):
+        return {'q': build_tsquery(tokens), 'types': list(types), 'limit': limit, 'offset': offset}
+
+    @staticmethod
+    def _hits(rows):
+        total = rows[0].total if rows else 0
+        return total, [SearchHit(r.doc_table, r.doc_id, r.title, float(r.rank)) for r in rows]
+
+    def search(self, tokens, types, limit, offset):
+        with self.engine().connect() as conn:
+            rows = conn.execute(self._query, self._params(tokens, types, limit, offset)).all()
+        return self._hits(rows)
+
+    async def search_async(self, conn, tokens, types, limit, offset):
+        result = await conn.execute(self._query, self._params(tokens, types, limit, offset))
+        return self._hits(result.all())
+
+
+class MemoryBackend:
+    """A per-worker inverted index: term -> {(table, id): weighted term frequency}."""
+
+    def __init__(self, engine_getter):
+        self.engine = engine_getter
+        self.built = False
+        self._postings = {}
+        self._doc_terms = {}
+        self._titles = {}
+        self._sorted_terms = None
+        self._lock = threading.RLock()
+
+    def is_empty(self):
+        return not self.built
+
+    def _remove(self, key):
+        for term in self._doc_terms.pop(key, ()):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(key, None)
+                if not postings:
+                    del self._postings[term]
+                    self._sorted_terms = None
+        self._titles.pop(key, None)
+
+    def _add(self, source, row):
+        key = (source.table, row.id)
+        self._remove(key)
+        scores = {}
+        for weight, tokens in source.weighted_terms(row).items():
+            for token in tokens:
+                scores[token] = scores.get(token, 0.0) + WEIGHTS[weight]
+        for term, score in scores.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                self._sorted_terms = None
+            self._postings[term][key] = score
+        self._doc_terms[key] = tuple(scores)
+        self._titles[key] = row._mapping[source.title] or ''
+
+    def reindex(self, source):
+        with self._lock, self.engine().connect() as conn:
+            for key in [k for k in self._doc_terms if k[0] == source.table]:
+                self._remove(key)
+            for row in conn.execution_options(yield_per=REINDEX_BATCH_SIZE).execute(select(*source.columns())):
+                self._add(source, row)
+
+    def apply(self, source, change):
+        with self._lock:
+            if not self.built:
+                return  # the first search will load the current state anyway
+            if change.op == 'delete':
+                self._remove((source.table, change.pk))
+                return
+            with self.engine().connect() as conn:
+                row = conn.execute(select(*source.columns()).where(source.model.id == change.pk)).first()
+            if row is None:
+                self._remove((source.table, change.pk))
+            else:
+                self._add(source, row)
+
+    def _expand(self, term):
+        """Returns the postings of every indexed term starting with ``term``."""
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self._postings)
+        matches = []
+        i = bisect_left(self._sorted_terms, term)
+        while i < len(self._sorted_terms) and self._sorted_terms[i].startswith(term):
+            matches.append(self._postings[self._sorted_terms[i]])
+            i += 1
+        return matches
+
+    def search(self, tokens, types, limit, offset):
+        with self._lock:
+            total_docs = max(len(self._doc_terms), 1)
+            scores = None
+            for position, token in enumerate(tokens):
+                if position == len(tokens) - 1:
+                    posting_lists = self._expand(token)
+                else:
+                    posting_lists = [self._postings[token]] if token in self._postings else []
+                term_scores = {}
+                for postings in posting_lists:
+                    idf = math.log(1 + total_docs / len(postings))
+                    for key, tf in postings.items():
+                        if key[0] in types:
+                            term_scores[key] = term_scores.get(key, 0.0) + tf * idf
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {k: v + term_scores[k] for k, v in scores.items() if k in term_scores}
+                if not scores:
+                    return 0, []
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+            page = ranked[offset:offset + limit]
+            return len(ranked), [SearchHit(k[0], k[1], self._titles[k], round(v, 4)) for k, v in page]
+
+
+class SearchIndex:
+    """Flask extension: source registry, backend selection and change-bus wiring."""
+
+    def __init__(self, app=None, db=None, change_bus=None):
+        self.sources = {}
+        self.backend = None
+        # Called with a list of tables instead of rebuilding the shared index in the request
+        self.defer_reindex = None
+        self._build_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db, change_bus)
+
+    def init_app(self, app, db, change_bus):
+        self.app = app
+        mode = app.config.setdefault('SEARCH_BACKEND', 'auto')
+        if mode == 'auto':
+            mode = 'postgres' if (app.config.get('SQLALCHEMY_DATABASE_URI') or '').startswith('postgres') else 'memory'
+        engine_getter = lambda: db.engine
+        if mode == 'postgres':
+            self.backend = PostgresBackend(engine_getter)
+        elif mode == 'memory':
+            self.backend = MemoryBackend(engine_getter)
+        else:
+            raise RuntimeError(f'Unknown SEARCH_BACKEND: {mode}')
+        change_bus.subscribe(self._on_change)
+        app.extensions['search_index'] = self
+
+    def register(self, model, title, weights):
+        """Indexes ``model``; ``weights`` maps column names to 'A', 'B' or 'C'."""
+        source = SearchSource(model.__tablename__, model, title, weights)
+        self.sources[source.table] = source
+        return source
+
+    def reindex(self, tables=None):
+        for table in tables or self.sources:
+            self.backend.reindex(self.sources[table])
+
+    def _ensure_built(self):
+        if isinstance(self.backend, MemoryBackend) and not self.backend.built:
+            with self._build_lock:
+                if not self.backend.built:
+                    self.reindex()
+                    self.backend.built = True
+
+    def search(self, query, types=None, page=1, limit=20):
+        """Returns ``(total, hits)`` for one page of ranked results."""
+        tokens = tokenize(query)
+        if not tokens:
+            return 0, []
+        self._ensure_built()
+        types = [t for t in (types or self.sources) if t in self.sources]
+        if not types:
+            return 0, []
+        return self.backend.search(tokens, types, limit, (page - 1) * limit)
+
+    async def search_async(self, query, connect, types=None, page=1, limit=20):
+        """:meth:`search` for coroutines; ``connect()`` opens an async connection.
+
+        The in-memory backend has no I/O once built, so it (and its first
+        build) runs in a thread instead.
+        """
+        if not isinstance(self.backend, PostgresBackend):
+            return await asyncio.to_thread(self.search, query, types, page, limit)
+        tokens = tokenize(query)
+        types = [t for t in (types or self.sources) if t in self.sources]
+        if not tokens or not types:
+            return 0, []
+        async with connect() as conn:
+            return await self.backend.search_async(conn, tokens, types, limit, (page - 1) * limit)
+
+    def _on_change(self, change):
+        source = self.sources.get(change.model)
+        if source is None:
+            return
+        # The shared PostgreSQL index is maintained by the writing worker only
+        if isinstance(self.backend, PostgresBackend) and not self.app.extensions['change_bus'].is_local(change):
+            return
+        with self.app.app_context():
+            if change.pk is None:
+                if isinstance(self.backend, PostgresBackend) and self.defer_reindex is not None:
+                    self.defer_reindex([source.table])
+                elif isinstance(self.backend, PostgresBackend) or self.backend.built:
+                    self.backend.reindex(source)
+            else:
+                self.backend.apply(source, change)
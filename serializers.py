@@ -0,0 +1,110 @@
+"""Column-aware JSON serialization compiled once per model from its mapper.
+
+The column list and per-column converters are worked out the first time a
+model is serialized, so turning a row into a dict is a single pass over a
+precomputed tuple. Column-only ``select()`` rows take the cheapest path:
+no ORM instances, no identity map, just the row tuple.
+"""
+from datetime import date, datetime, time
+
+from sqlalchemy import Date, DateTime, Float, Numeric, Time
+
+
+def _isoformat(value):
+    return None if value is None else value.isoformat()
+
+
+def _to_float(value):
+    return None if value is None else float(value)
+
+
+def _converter(column_type):
+    """Returns the JSON converter for a column type, or ``None`` for pass-through."""
+    if isinstance(column_type, (DateTime, Date, Time)):
+        return _isoformat
+    if isinstance(column_type, Numeric) and not isinstance(column_type, Float):
+        return _to_float
+    return None
+
+
+def _convert_value(value):
+    """Converter for expressions without a known column type."""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    return value
+
+
+class ModelSerializer:
+    """Serializes instances or result rows of one mapped model."""
+
+    def __init__(self, model):
+        self.model = model
+        attrs = model.__mapper__.column_attrs
+        self.keys = tuple(attr.key for attr in attrs)
+        self.converters = {attr.key: _converter(attr.columns[0].type) for attr in attrs}
+        self._plan = tuple((key, self.converters[key]) for key in self.keys)
+        self.derived = ()
+        self._row_plans = {}
+
+    def derive(self, key, source, compute):
+        """Adds ``key`` = ``compute(value of source)`` wherever column ``source`` is serialized."""
+        self.derived += ((key, source, compute),)
+        self._row_plans.clear()
+
+    def from_instance(self, obj):
+        """Serializes every mapped column of ``obj``."""
+        data = {}
+        for key, convert in self._plan:
+            value = getattr(obj, key)
+            data[key] = convert(value) if convert is not None else value
+        for key, source, compute in self.derived:
+            data[key] = compute(data[source])
+        return data
+
+    def for_keys(self, keys):
+        """Returns a function serializing rows whose columns are ``keys``."""
+        keys = tuple(keys)
+        serialize = self._row_plans.get(keys)
+        if serialize is None:
+            converters = tuple(self.converters.get(key, _convert_value) for key in keys)
+            if not any(converters):
+                def serialize(row):
+                    return dict(zip(keys, row))
+            else:
+                plan = tuple(zip(range(len(keys)), keys, converters))
+
+                def serialize(row):
+                    return {key: (convert(row[i]) if convert is not None else row[i])
+                            for i, key, convert in plan}
+            derived = tuple(entry for entry in self.derived if entry[1] in keys)
+            if derived:
+                serialize = _with_derived(serialize, derived)
+            self._row_plans[keys] = serialize
+        return serialize
+
+
+def _with_derived(serialize, derived):
+    def serialize_with_derived(row):
+        data = serialize(row)
+        for key, source, compute in derived:
+            data[key] = compute(data[source])
+        return data
+    return serialize_with_derived
+
+
+_serializers = {}
+
+
+def serializer_for(model):
+    """Returns the (cached) serializer for ``model``."""
+    serializer = _serializers.get(model)
+    if serializer is None:
+        serializer = _serializers[model] = ModelSerializer(model)
+    return serializer
+
+
+class SerializerMixin:
+    """Gives a model a ``to_dict()`` backed by its compiled serializer."""
+
+    def to_dict(self):
+        return serializer_for(type(self)).from_instance(self)
@@ -0,0 +1,135 @@
+"""Site settings served from an immutable in-memory snapshot.
+
+The whole ``site_setting`` table is read once per worker into a
+:class:`SettingsSnapshot`; lookups never touch the database. A committed
+write to the table (an admin save, a CLI import) reaches every worker
+through the change bus and marks the snapshot stale; the next lookup loads
+a new one and swaps it in with a single assignment, so a request never sees
+half of an update. Cached pages and layout fragments depend on the settings
+as well: the ``site_setting`` scope is added to every cached view and
+:attr:`SettingsSnapshot.version` to the fragment keys that render them.
+"""
+import hashlib
+import itertools
+import json
+import logging
+import threading
+from types import MappingProxyType
+
+from sqlalchemy import select
+
+logger = logging.getLogger(__name__)
+
+_TRUE = {'1', 'true', 'yes', 'on', 'نعم'}
+_FALSE = {'0', 'false', 'no', 'off', 'لا', ''}
+
+
+def _parse_bool(value):
+    folded = value.strip().lower()
+    if folded in _TRUE:
+        return True
+    if folded in _FALSE:
+        return False
+    raise ValueError(f'not a boolean: {value!r}')
+
+
+# Conversions by ``type`` name for :meth:`SettingsSnapshot.get`
+PARSERS = {'str': str, 'int': int, 'float': float, 'bool': _parse_bool, 'json': json.loads}
+
+
+class SettingsSnapshot:
+    """One consistent, read-only view of every setting."""
+
+    __slots__ = ('values', 'version', 'generation', '_typed')
+
+    def __init__(self, values, generation=0):
+        self.values = MappingProxyType(dict(values))
+        self.version = hashlib.sha1(json.dumps(sorted(self.values.items())).encode('utf-8')).hexdigest()[:12]
+        self.generation = generation
+        self._typed = {}
+
+    def get(self, name, default=None, type='str'):
+        """Returns setting ``name`` converted by ``type`` (str, int, float, bool, json or a callable).
+
+        Missing, empty or unconvertible values give ``default``.
+        """
+        key = (name, type)
+        try:
+            return self._typed[key]
+        except KeyError:
+            pass
+        raw = self.values.get(name)
+        if raw is None or (raw == '' and type != 'str'):
+            return default
+        parse = PARSERS[type] if isinstance(type, str) else type
+        try:
+            value = parse(raw)
+        except ValueError:
+            logger.warning('Site setting %s=%r is not a valid %s', name, raw, type)
+            return default
+        # Parsed values are shared by every request using this snapshot
+        self._typed[key] = value
+        return value
+
+    def __getitem__(self, name):
+        return self.values[name]
+
+    def __contains__(self, name):
+        return name in self.values
+
+
+class SiteSettings:
+    """Per-worker settings registry kept current by the change bus (Flask extension)."""
+
+    def __init__(self, app=None, db=None, change_bus=None, model=None):
+        self.db = None
+        self.model = None
+        self._current = None
+        self._generations = itertools.count(1)
+        self._generation = 0
+        self._load_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db, change_bus, model)
+
+    def init_app(self, app, db, change_bus, model):
+        self.db = db
+        self.model = model
+        change_bus.subscribe(self._on_change, models=(model.__tablename__,))
+        response_cache = app.extensions.get('response_cache')
+        if response_cache is not None:
+            response_cache.site_scopes.append(model.__tablename__)
+        app.jinja_env.globals['site_settings'] = self
+        app.extensions['site_settings'] = self
+
+    def _on_change(self, change):
+        # next() on a counter is atomic; any new number makes the snapshot stale
+        self._generation = next(self._generations)
+
+    def snapshot(self):
+        """Returns the current snapshot, loading the table if it changed since the last one."""
+        current = self._current
+        if current is not None and current.generation == self._generation:
+            return current
+        with self._load_lock:
+            current = self._current
+            generation = self._generation
+            if current is None or current.generation != generation:
+                model = self.model
+                with self.db.engine.connect() as conn:
+                    rows = conn.execute(select(model.setting_name, model.setting_value)).all()
+                current = SettingsSnapshot(rows, generation)
+                self._current = current
+        return current
+
+    def get(self, name, default=None, type='str'):
+        return self.snapshot().get(name, default, type)
+
+    @property
+    def version(self):
+        return self.snapshot().version
+
+    def __getitem__(self, name):
+        return self.snapshot()[name]
+
+    def __contains__(self, name):
+        return name in self.snapshot()
@@ -1,12 +1,74 @@
 #!/bin/bash
-# Apply database migrations
-echo "Applying database migrations..."
-python -m flask db upgrade
+# PROCESS_TYPE=worker runs only the job worker, as a service of its own (a
+# Render background worker, a second container); the web service migrates
+if [ "$PROCESS_TYPE" = "worker" ]; then
+    exec python -m flask worker --concurrency ${JOB_WORKER_THREADS:-2}
+fi
 
-# Create default admin user if it doesn't exist
-echo "Creating default admin user if it doesn't exist..."
-python -m flask create-admin
+# Migrations, the search index on first deploy, fingerprinted and
+# precompressed static files and the default admin user, in one app boot
+echo "Preparing the application (migrations, search index, static assets, admin user)..."
+python -m flask deploy
 
-# Start the Flask application with Gunicorn
-echo "Starting Flask application with Gunicorn..."
-exec gunicorn -b 0.0.0.0:$PORT app:app --timeout 120 --workers 4 --threads 2
+# Each gunicorn worker writes its request metrics here; /metrics adds them up
+export METRICS_DIR=${METRICS_DIR:-/tmp/municipality-metrics}
+rm -rf "$METRICS_DIR"
+
+# Share the response cache (and its invalidations) between the gunicorn workers
+export RESPONSE_CACHE_BACKEND=${RESPONSE_CACHE_BACKEND:-filesystem}
+
+# Keeps a job worker running next to the web server: restarted when it exits,
+# stopped with SIGTERM (finishing its running jobs) when the container stops
+supervise_worker() {
+    local child status stopping=0
+    trap 'stopping=1; kill -TERM $child 2>/dev/null' TERM INT
+    while [ "$stopping" = 0 ]; do
+        python -m flask worker --concurrency ${JOB_WORKER_THREADS:-2} &
+        child=$!
+        wait $child
+        status=$?
+        if [ "$stopping" = 1 ]; then
+            wait $child
+            break
+        fi
+        echo "Job worker exited with status $status; restarting in 5 seconds..."
+        sleep 5
+    done
+}
+
+# Image sizes, bulk search reindexing and subscriber notifications run in a job
+# worker; RUN_WORKER=0 leaves it to a separate PROCESS_TYPE=worker service
+if [ "$JOB_QUEUE" != "inline" ] && [ "${RUN_WORKER:-1}" != "0" ]; then
+    echo "Starting background job worker..."
+    supervise_worker &
+    worker_pid=$!
+fi
+
+if [ "$SERVER_MODE" = "asgi" ]; then
+    # SERVER_MODE=asgi serves the public read paths on asyncio (see app_asgi.py)
+    echo "Starting ASGI application with Uvicorn..."
+    server=(uvicorn app_asgi:app --host 0.0.0.0 --port $PORT --workers ${ASGI_WORKERS:-2} --timeout-keep-alive 30)
+else
+    # Gunicorn. --preload builds the app once in the master and forks the
+    # workers from it (`flask startup-profile` shows the cost)
+    echo "Starting Flask application with Gunicorn..."
+    server=(gunicorn -b 0.0.0.0:$PORT 'app:create_app()' --preload --timeout 120 --workers 4 --threads 2)
+fi
+
+if [ -z "$worker_pid" ]; then
+    exec "${server[@]}"
+fi
+# Both run as children of this shell, which passes SIGTERM on to each and waits for them
+"${server[@]}" &
+server_pid=$!
+trap 'kill -TERM $server_pid $worker_pid 2>/dev/null' TERM INT
+wait $server_pid
+status=$?
+# A signal interrupts the first wait: wait again while the server shuts down
+if kill -0 $server_pid 2>/dev/null; then
+    wait $server_pid
+    status=$?
+fi
+kill -TERM $worker_pid 2>/dev/null
+wait $worker_pid
+exit $status
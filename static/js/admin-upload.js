@@ -0,0 +1,83 @@
+// Sends the file picked in a [data-chunked-upload] input in chunks and fills in the URL field.
+// A failed chunk is retried from the offset the server reports, so flaky connections resume.
+(function() {
+    var CHUNK_SIZE = 4 * 1024 * 1024;
+    var RETRIES = 5;
+
+    function call(method, url, body, headers) {
+        headers = Object.assign({'X-Requested-With': 'XMLHttpRequest'}, headers || {});
+        return fetch(url, {method: method, body: body, headers: headers, credentials: 'same-origin'})
+            .then(function(response) {
+                return response.json().catch(function() { return {}; }).then(function(data) {
+                    data.status = response.status;
+                    return data;
+                });
+            });
+    }
+
+    function sleep(ms) {
+        return new Promise(function(resolve) { setTimeout(resolve, ms); });
+    }
+
+    async function upload(input, file) {
+        var base = input.getAttribute('data-chunked-upload');
+        var target = input.form.querySelector('[name="' + input.getAttribute('data-target') + '"]');
+        var status = input.nextElementSibling && input.nextElementSibling.classList.contains('upload-status')
+            ? input.nextElementSibling : input.insertAdjacentElement('afterend', document.createElement('p'));
+        status.className = 'upload-status help-block';
+
+        var started = await call('POST', base, JSON.stringify({filename: file.name, size: file.size}),
+                                 {'Content-Type': 'application/json'});
+        if (started.status !== 201) {
+            status.textContent = 'نوع الملف غير مقبول أو أن حجمه كبير جداً.';
+            return;
+        }
+        var url = base + started.upload_id;
+        var offset = 0;
+        var failures = 0;
+        while (offset < file.size) {
+            var chunk = file.slice(offset, offset + CHUNK_SIZE);
+            var result;
+            try {
+                result = await call('PUT', url, chunk, {'Upload-Offset': String(offset)});
+            } catch (e) {
+                result = {status: 0};
+            }
+            if (result.status === 200) {
+                offset = result.offset;
+                failures = 0;
+            } else if (result.status === 409 || result.status === 0) {
+                // Out of step or the connection dropped: ask where to resume
+                if (++failures > RETRIES) break;
+                await sleep(1000 * failures);
+                try {
+                    offset = (await call('GET', url)).offset || 0;
+                } catch (e) {}
+            } else {
+                break;
+            }
+            status.textContent = 'جارٍ الرفع: ' + Math.floor(100 * offset / file.size) + '%';
+        }
+        if (offset < file.size) {
+            status.textContent = 'تعذر رفع الملف. الرجاء المحاولة مرة أخرى.';
+            return;
+        }
+        var finished = await call('POST', url + '/finish', JSON.stringify({filename: file.name}),
+                                  {'Content-Type': 'application/json'});
+        if (finished.status !== 200) {
+            status.textContent = 'تعذر حفظ الملف.';
+            return;
+        }
+        target.value = finished.url;
+        // The file is stored already; do not send it again with the form
+        input.value = '';
+        status.textContent = 'تم رفع الملف: ' + file.name;
+    }
+
+    document.addEventListener('change', function(event) {
+        var input = event.target;
+        if (input.matches('input[type=file][data-chunked-upload]') && input.files.length) {
+            upload(input, input.files[0]);
+        }
+    });
+})();
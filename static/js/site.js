@@ -0,0 +1,6 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Apply admin-mode class if on admin page
+    if (window.location.pathname.startsWith('/admin')) {
+        document.body.classList.add('admin-mode');
+    }
+});
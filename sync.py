@@ -0,0 +1,214 @@
+"""Incremental (delta) sync of the public content for offline clients.
+
+Every synced table has an ``updated_at`` column, set on insert and on each
+update, and every deleted row leaves a ``sync_tombstone``. A client keeps
+the opaque token of its last sync and asks only for what changed after it:
+
+    GET /api/sync?token=...&resources=announcements,projects&limit=500
+
+The token holds, per resource, a keyset position in ``(updated_at, id)``
+order for the rows and in ``(deleted_at, id)`` order for the tombstones,
+so a poll is two index range scans per resource whose cost follows the
+number of changes, not the size of the tables. Without a token every row
+is sent (the initial download). ``more`` is true while a resource had
+more than ``limit`` changes; the client repeats the request with the new
+token until it is false, applying each response's ``deleted`` ids before
+its ``updated`` rows.
+
+A transaction stamps its rows when it flushes but they become visible when
+it commits, so a position never moves past ``SYNC_COMMIT_LAG`` seconds
+before the time of the poll: rows from that window are sent again on the
+next poll (clients upsert by id) rather than missed. For the same reason
+sync reads the primary, never a replica. Tombstones are kept for
+``SYNC_TOMBSTONE_DAYS``; an older token is answered with 410 and the
+client starts over without one.
+"""
+import base64
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, delete, event, insert, select
+
+from pagination import PaginationError, keyset_criteria, keyset_ordering, parse_limit
+from serializers import serializer_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+metadata = MetaData()
+
+tombstones = Table(
+    'sync_tombstone', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('model', String(50), nullable=False),
+    Column('row_id', Integer, nullable=False),
+    Column('deleted_at', DateTime, nullable=False),
+    Index('ix_sync_tombstone_model_deleted_at_id', 'model', 'deleted_at', 'id'),
+    Index('ix_sync_tombstone_deleted_at', 'deleted_at'),
+)
+
+TOKEN_VERSION = 1
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = 1024
+
+
+class SyncError(ValueError):
+    """Raised for a malformed token, an unknown resource or a bad limit."""
+
+
+class SyncExpired(SyncError):
+    """The token is older than the tombstones: the client must sync from scratch."""
+
+
+def _encode_token(positions):
+    payload = {'v': TOKEN_VERSION, 'p': {
+        name: [None if ts is None else ts.isoformat(), row_id, deleted_ts.isoformat(), deleted_id]
+        for name, (ts, row_id, deleted_ts, deleted_id) in positions.items()}}
+    data = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(data).decode('ascii').rstrip('=')
+
+
+def _decode_token(token, resources):
+    if not token:
+        return {}
+    try:
+        payload = json.loads(base64.urlsafe_b64decode((token + '=' * (-len(token) % 4)).encode('ascii')))
+        if payload['v'] != TOKEN_VERSION:
+            raise ValueError
+        positions = {}
+        for name, (ts, row_id, deleted_ts, deleted_id) in payload['p'].items():
+            if name in resources:
+                positions[name] = (None if ts is None else datetime.fromisoformat(ts), int(row_id),
+                                   datetime.fromisoformat(deleted_ts), int(deleted_id))
+        return positions
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise SyncError('invalid token')
+
+
+def _advance(position, keys, limit, horizon):
+    """Returns the position after a page and whether more remain.
+
+    ``keys`` are the ``(timestamp, id)`` keysets of the page read with
+    ``limit + 1``. A position never passes ``horizon``: rows stamped after
+    it may still have company in transactions that have not committed yet.
+    """
+    if len(keys) > limit:
+        last = keys[limit - 1]
+        if last < (horizon, 0):
+            return last, True
+        # Everything up to the horizon has been sent; the rest waits for the next poll
+        return (horizon, 0), False
+    if position is not None and position > (horizon, 0):
+        return position, False
+    return (horizon, 0), False
+
+
+def encode_body(data, accept_encodings):
+    """Compresses ``data`` with the best coding the client accepts; returns ``(data, coding or None)``."""
+    if len(data) < MIN_COMPRESS_SIZE:
+        return data, None
+    if brotli is not None and accept_encodings['br']:
+        return brotli.compress(data, quality=5), 'br'
+    if accept_encodings['gzip']:
+        return gzip.compress(data, compresslevel=6), 'gzip'
+    return data, None
+
+
+class DeltaSync:
+    """Records deletions and answers sync requests for a set of models (Flask extension)."""
+
+    def __init__(self, app=None, db=None, resources=None):
+        self.db = None
+        self.resources = {}
+        self.lag = timedelta(seconds=5)
+        self.retention = timedelta(days=90)
+        self.page_size = 500
+        self.max_page_size = 2000
+        self._tables = {}
+        if app is not None:
+            self.init_app(app, db, resources)
+
+    def init_app(self, app, db, resources):
+        """``resources`` maps API names to models with ``id`` and ``updated_at`` columns."""
+        env = os.environ
+        self.db = db
+        self.resources = dict(resources)
+        self._tables = {model: model.__tablename__ for model in self.resources.values()}
+        self.lag = timedelta(seconds=float(app.config.setdefault(
+            'SYNC_COMMIT_LAG', env.get('SYNC_COMMIT_LAG', 5))))
+        self.retention = timedelta(days=float(app.config.setdefault(
+            'SYNC_TOMBSTONE_DAYS', env.get('SYNC_TOMBSTONE_DAYS', 90))))
+        self.page_size = int(app.config.setdefault('SYNC_PAGE_SIZE', env.get('SYNC_PAGE_SIZE', 500)))
+        self.max_page_size = int(app.config.setdefault('SYNC_MAX_PAGE_SIZE', env.get('SYNC_MAX_PAGE_SIZE', 2000)))
+        event.listen(db.session, 'after_flush', self._record_deletions)
+        app.extensions['delta_sync'] = self
+
+    # --- Tombstones ---
+    def _record_deletions(self, session, flush_context):
+        now = datetime.utcnow()
+        rows = [{'model': self._tables[type(obj)], 'row_id': obj.id, 'deleted_at': now}
+                for obj in session.deleted if type(obj) in self._tables]
+        if not rows:
+            return
+        conn = session.connection()
+        conn.execute(insert(tombstones), rows)
+        # Deletions are rare; expiring old tombstones with them keeps the table bounded
+        conn.execute(delete(tombstones).where(tombstones.c.deleted_at < now - self.retention))
+
+    # --- Reading ---
+    def changes(self, token=None, resources=None, limit=None):
+        """Returns ``{'token', 'more', 'changes': {resource: {'updated': [...], 'deleted': [...]}}}``."""
+        if resources:
+            names = [name.strip() for name in resources.split(',') if name.strip()]
+            unknown = [name for name in names if name not in self.resources]
+            if unknown:
+                raise SyncError('unknown resources: ' + ', '.join(unknown))
+        else:
+            names = list(self.resources)
+        try:
+            limit = parse_limit(limit, self.page_size, self.max_page_size)
+        except PaginationError as e:
+            raise SyncError(str(e))
+        positions = _decode_token(token, self.resources)
+        now = datetime.utcnow()
+        horizon = now - self.lag
+        if any(position[2] < now - self.retention for position in positions.values()):
+            raise SyncExpired('token expired; sync again without one')
+
+        changes, more = {}, False
+        session = self.db.session
+        for name in names:
+            model = self.resources[name]
+            row_ts, row_id, deleted_ts, deleted_id = positions.get(name, (None, 0, horizon, 0))
+            row_position = None if row_ts is None else (row_ts, row_id)
+
+            order = (model.updated_at, model.id)
+            result = session.execute(
+                select(*model.__table__.c)
+                .where(*keyset_criteria(order, row_position, descending=False))
+                .order_by(*keyset_ordering(order, descending=False))
+                .limit(limit + 1))
+            rows = result.all()
+            serialize = serializer_for(model).for_keys(result.keys())
+            row_position, rows_more = _advance(
+                row_position, [(row.updated_at, row.id) for row in rows], limit, horizon)
+
+            order = (tombstones.c.deleted_at, tombstones.c.id)
+            deleted = session.execute(
+                select(tombstones.c.deleted_at, tombstones.c.id, tombstones.c.row_id)
+                .where(tombstones.c.model == model.__tablename__,
+                       *keyset_criteria(order, (deleted_ts, deleted_id), descending=False))
+                .order_by(*keyset_ordering(order, descending=False))
+                .limit(limit + 1)).all()
+            deleted_position, deleted_more = _advance(
+                (deleted_ts, deleted_id), [(row.deleted_at, row.id) for row in deleted], limit, horizon)
+
+            changes[name] = {'updated': [serialize(row) for row in rows[:limit]],
+                             'deleted': [row.row_id for row in deleted[:limit]]}
+            positions[name] = (*row_position, *deleted_position)
+            more = more or rows_more or deleted_more
+        return {'token': _encode_token(positions), 'more': more, 'changes': changes}
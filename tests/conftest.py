@@ -0,0 +1,7 @@
+import os
+import sys
+
+# app.py reads its configuration from the environment at import time
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('JOB_QUEUE', 'inline')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
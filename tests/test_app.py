@@ -0,0 +1,12 @@
+from app import app, create_app
+
+
+def test_create_app_is_idempotent():
+    first = create_app()
+    blueprints = dict(first.blueprints)
+    second = create_app()
+
+    assert second is first is app
+    # The admin views are registered once, not again on the second call
+    assert second.blueprints == blueprints
+    assert 'admin' in blueprints
@@ -0,0 +1,46 @@
+import io
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine, select
+
+from bulk import RowValidator, import_rows, read_records
+
+metadata = MetaData()
+
+items = Table(
+    'item', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('title', String(50), nullable=False),
+    Column('updated_at', DateTime, nullable=False, default=datetime.utcnow),
+    Column('progress', Integer, default=0),
+)
+
+
+def make_engine():
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    return engine
+
+
+def test_malformed_jsonl_line_is_reported_and_the_rest_imported():
+    engine = make_engine()
+    stream = io.StringIO('{"title": "valid", "updated_at": "2001-01-01T00:00:00"}\nnot json\n')
+    result = import_rows(engine, items, read_records(stream, 'jsonl'), ignore_fields=('updated_at',))
+
+    assert result.inserted == 1
+    assert [(error.line, error.message) for error in result.errors] == [(2, 'not valid JSON')]
+    with engine.connect() as conn:
+        title, updated_at = conn.execute(select(items.c.title, items.c.updated_at)).one()
+    assert title == 'valid'
+    # The ignored field gets the column default, not the value in the file
+    assert updated_at.year > 2001
+
+
+def test_columns_left_out_of_the_file_get_their_defaults():
+    # COPY does not apply model defaults, so the validator fills them in
+    validator = RowValidator(items, ['title'])
+    row = dict(zip(validator.names, validator({'title': 'x'})))
+
+    assert set(validator.names) == {'title', 'updated_at', 'progress'}
+    assert row['progress'] == 0
+    assert isinstance(row['updated_at'], datetime)
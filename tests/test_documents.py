@@ -0,0 +1,91 @@
+import io
+
+import pytest
+from flask import Flask
+
+from documents import ChunkedUploads, DocumentError, DocumentStore
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def store(tmp_path):
+    app = Flask(__name__)
+    app.config.update(DOCUMENT_STORE_DIR=str(tmp_path / 'documents'), DOCUMENT_MAX_BYTES=4096)
+    documents = DocumentStore(app)
+    source = tmp_path / 'minutes.pdf'
+    source.write_bytes(CONTENT)
+    url = documents.store_path(str(source), 'محضر الجلسة.pdf')
+    return app.test_client(), documents, url
+
+
+def test_same_content_is_stored_once_under_its_hash(store, tmp_path):
+    client, documents, url = store
+    copy = tmp_path / 'copy.pdf'
+    copy.write_bytes(CONTENT)
+
+    assert documents.store_path(str(copy), 'copy.pdf') == url
+    assert documents.meta(url.rsplit('/', 1)[1][:-4])['filename'] == 'محضر الجلسة.pdf'
+
+
+def test_download_is_immutable_and_advertises_ranges(store):
+    client, documents, url = store
+    response = client.get(url)
+
+    assert response.status_code == 200
+    assert response.data == CONTENT
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    assert response.headers['ETag'].strip('"') in url
+    assert 'immutable' in response.headers['Cache-Control']
+    assert client.get(url.replace('.pdf', '.zip')).status_code == 404
+
+
+def test_range_request_resumes_a_download(store):
+    client, documents, url = store
+    response = client.get(url, headers={'Range': 'bytes=1000-'})
+
+    assert response.status_code == 206
+    assert response.data == CONTENT[1000:]
+    assert response.headers['Content-Range'] == f'bytes 1000-{len(CONTENT) - 1}/{len(CONTENT)}'
+
+
+def test_if_range_sends_the_whole_file_when_it_changed(store):
+    client, documents, url = store
+    etag = client.get(url).headers['ETag']
+
+    same = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': etag})
+    assert same.status_code == 206
+    assert same.data == CONTENT[:10]
+
+    changed = client.get(url, headers={'Range': 'bytes=0-9', 'If-Range': '"another-version"'})
+    assert changed.status_code == 200
+    assert changed.data == CONTENT
+
+
+def test_chunks_must_arrive_in_order(tmp_path):
+    uploads = ChunkedUploads(str(tmp_path), max_bytes=100)
+    upload_id = uploads.start()
+
+    assert uploads.append(upload_id, 0, io.BytesIO(b'0123'), 4) == 4
+    # A chunk sent twice, or one that skips ahead, is refused with the offset to resume from
+    for offset in (0, 8):
+        with pytest.raises(DocumentError, match='expected offset 4'):
+            uploads.append(upload_id, offset, io.BytesIO(b'4567'), 4)
+    assert uploads.append(upload_id, 4, io.BytesIO(b'4567'), 4) == 8
+
+    # A chunk cut short is dropped, so the client can send it again
+    with pytest.raises(DocumentError, match='incomplete chunk'):
+        uploads.append(upload_id, 8, io.BytesIO(b'89'), 4)
+    assert uploads.size(upload_id) == 8
+
+    with pytest.raises(DocumentError, match='too large'):
+        uploads.append(upload_id, 8, io.BytesIO(b'x' * 93), 93)
+    with open(uploads.path(upload_id), 'rb') as f:
+        assert f.read() == b'01234567'
+
+
+def test_unknown_uploads_are_refused(tmp_path):
+    uploads = ChunkedUploads(str(tmp_path), max_bytes=100)
+    for upload_id in ('../etc/passwd', '0' * 32):
+        with pytest.raises(DocumentError, match='unknown upload'):
+            uploads.append(upload_id, 0, io.BytesIO(b'x'), 1)
@@ -0,0 +1,111 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import select, update
+from sqlalchemy.dialects import postgresql
+
+import jobs as jobs_module
+from jobs import JobQueue, claim_statement, jobs
+
+
+@pytest.fixture
+def queue(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/jobs.db', JOB_QUEUE='database')
+    db = SQLAlchemy(app)
+    queue = JobQueue(app, db)
+    with app.app_context():
+        jobs_module.metadata.create_all(db.engine)
+        yield queue
+
+
+def job_row(queue, job_id):
+    with queue.db.engine.connect() as conn:
+        return conn.execute(select(jobs).where(jobs.c.id == job_id)).one()
+
+
+def make_due(queue, job_id):
+    with queue.db.engine.begin() as conn:
+        conn.execute(update(jobs).where(jobs.c.id == job_id).values(run_at=datetime.utcnow()))
+
+
+def test_claim_skips_rows_locked_by_other_workers():
+    sql = str(claim_statement('worker', datetime(2026, 1, 1)).compile(dialect=postgresql.dialect()))
+    assert 'FOR UPDATE SKIP LOCKED' in sql
+    assert 'ORDER BY job.priority, job.run_at, job.id' in sql
+
+
+def test_claim_takes_due_jobs_in_priority_order(queue):
+    queue.task('noop')(lambda **payload: None)
+    later = queue.enqueue('noop', priority=200, n=1)
+    first = queue.enqueue('noop', priority=10, n=2)
+    queue.enqueue('noop', delay=60, n=3)
+
+    assert [queue.claim('w').id for _ in range(2)] == [first, later]
+    assert queue.claim('w') is None
+    row = job_row(queue, first)
+    assert (row.status, row.locked_by, row.attempts) == ('running', 'w', 1)
+
+
+def test_concurrent_workers_never_claim_the_same_job(queue):
+    queue.task('noop')(lambda **payload: None)
+    ids = {queue.enqueue('noop', n=n) for n in range(40)}
+    claimed, lock = [], threading.Lock()
+
+    def worker(n):
+        with queue.app.app_context():
+            while (job := queue.claim(f'w{n}')) is not None:
+                with lock:
+                    claimed.append(job.id)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claimed) == sorted(ids)
+
+
+def test_failed_job_is_retried_with_backoff_then_kept_as_failed(queue):
+    calls = []
+
+    @queue.task('flaky', max_attempts=3)
+    def flaky(n):
+        calls.append(n)
+        raise RuntimeError('upstream unavailable')
+
+    job_id = queue.enqueue('flaky', n=1)
+    for attempt, delay in [(1, jobs_module.RETRY_DELAY), (2, jobs_module.RETRY_DELAY * 2)]:
+        before = datetime.utcnow()
+        queue.run(queue.claim('w'))
+        row = job_row(queue, job_id)
+        assert (row.status, row.attempts, row.locked_by) == ('queued', attempt, None)
+        assert row.last_error == 'RuntimeError: upstream unavailable'
+        assert before + timedelta(seconds=delay) <= row.run_at <= datetime.utcnow() + timedelta(seconds=delay)
+        # Not due again until the backoff has passed
+        assert queue.claim('w') is None
+        make_due(queue, job_id)
+
+    queue.run(queue.claim('w'))
+    row = job_row(queue, job_id)
+    assert (row.status, row.attempts) == ('failed', 3)
+    assert row.finished_at is not None
+    assert calls == [1, 1, 1]
+
+
+def test_jobs_of_a_dead_worker_are_released_after_the_lease(queue):
+    queue.task('noop')(lambda **payload: None)
+    job_id = queue.enqueue('noop')
+    queue.claim('dead-worker')
+    queue.maintain()
+    assert job_row(queue, job_id).status == 'running'
+
+    with queue.db.engine.begin() as conn:
+        conn.execute(update(jobs).values(locked_at=datetime.utcnow() - timedelta(seconds=queue.lease + 1)))
+    queue.maintain()
+    row = job_row(queue, job_id)
+    assert (row.status, row.locked_by, row.last_error) == ('queued', None, 'worker lease expired')
+    assert queue.claim('w').id == job_id
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine, insert
+from sqlalchemy.orm import Session
+
+from pagination import KeysetPage, PaginationError, cursor_from_probe, decode_cursor, encode_cursor, keyset_criteria
+
+metadata = MetaData()
+
+posts = Table(
+    'post', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('title', String(50), nullable=False),
+    Column('published', DateTime, nullable=True),
+)
+
+START = datetime(2026, 1, 1, 12, 30)
+
+
+def make_engine():
+    engine = create_engine('sqlite://')
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        # Ties on the lead column and a segment of NULLs, walked newest first
+        conn.execute(insert(posts), [
+            {'id': i, 'title': f'post {i}', 'published': None if i % 5 == 0 else START + timedelta(days=i // 3)}
+            for i in range(1, 24)
+        ])
+    return engine
+
+
+def walk(engine, limit):
+    order = (posts.c.published, posts.c.id)
+    seen, token = [], None
+    with Session(engine) as session:
+        while True:
+            after = decode_cursor(token, order)
+            page = KeysetPage(posts, [posts.c.id], order, keyset_criteria(order, after), limit)
+            seen.extend(session.execute(page.select()).scalars())
+            token = cursor_from_probe(session.execute(page.cursor_select()).all())
+            if token is None:
+                return seen
+
+
+def test_cursor_round_trips_datetimes_integers_and_null():
+    order = (posts.c.published, posts.c.id)
+    for values in [(START, 7), (None, 5)]:
+        token = encode_cursor(values)
+        assert '=' not in token
+        assert decode_cursor(token, order) == values
+
+
+@pytest.mark.parametrize('token', ['not base64!', encode_cursor([1]), encode_cursor(['yesterday', 1])])
+def test_malformed_cursor_is_rejected(token):
+    with pytest.raises(PaginationError):
+        decode_cursor(token, (posts.c.published, posts.c.id))
+
+
+@pytest.mark.parametrize('limit', [1, 4, 23, 50])
+def test_pages_cover_every_row_once_in_order(limit):
+    engine = make_engine()
+    dated = sorted((i for i in range(1, 24) if i % 5), key=lambda i: (i // 3, i), reverse=True)
+    undated = sorted((i for i in range(1, 24) if i % 5 == 0), reverse=True)
+
+    assert walk(engine, limit) == dated + undated
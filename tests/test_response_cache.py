@@ -0,0 +1,84 @@
+import pytest
+from flask import Flask
+
+from response_cache import ResponseCache
+
+
+@pytest.fixture(params=['memory', 'filesystem'])
+def cached_app(request, tmp_path):
+    app = Flask(__name__)
+    app.config.update(RESPONSE_CACHE_BACKEND=request.param, RESPONSE_CACHE_DIR=str(tmp_path),
+                      RESPONSE_CACHE_NAMESPACE='test')
+    cache = ResponseCache(app)
+    renders = []
+
+    @app.route('/item/<int:item_id>')
+    @cache.cached(scopes=('item', 'item:{item_id}'))
+    def item(item_id):
+        renders.append(item_id)
+        return f'item {item_id} render {len(renders)}'
+
+    return app, cache, renders
+
+
+def test_matching_etag_gets_304_without_rendering(cached_app):
+    app, cache, renders = cached_app
+    client = app.test_client()
+    first = client.get('/item/1')
+    assert first.status_code == 200
+    assert first.headers['Cache-Control'] == 'public, no-cache'
+
+    revalidated = client.get('/item/1', headers={'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['ETag'] == first.headers['ETag']
+    assert revalidated.data == b''
+    assert renders == [1]
+
+
+def test_stored_body_is_served_without_rendering(cached_app):
+    app, cache, renders = cached_app
+    client = app.test_client()
+    first = client.get('/item/1')
+    second = client.get('/item/1')
+
+    assert second.data == first.data == b'item 1 render 1'
+    assert second.headers['ETag'] == first.headers['ETag']
+    assert renders == [1]
+
+
+def test_invalidating_a_scope_expires_only_the_pages_that_depend_on_it(cached_app):
+    app, cache, renders = cached_app
+    client = app.test_client()
+    one, two = client.get('/item/1'), client.get('/item/2')
+
+    cache.invalidate('item:1')
+    changed = client.get('/item/1', headers={'If-None-Match': one.headers['ETag']})
+    unchanged = client.get('/item/2', headers={'If-None-Match': two.headers['ETag']})
+
+    assert changed.status_code == 200
+    assert changed.data == b'item 1 render 3'
+    assert changed.headers['ETag'] != one.headers['ETag']
+    assert unchanged.status_code == 304
+
+    # The listing scope every item page depends on expires them all
+    cache.invalidate('item')
+    assert client.get('/item/2', headers={'If-None-Match': two.headers['ETag']}).status_code == 200
+    assert renders == [1, 2, 1, 2]
+
+
+def test_uncached_methods_and_bypass_run_the_view():
+    app = Flask(__name__)
+    app.config.update(RESPONSE_CACHE_NAMESPACE='test')
+    cache = ResponseCache(app)
+    bypass = [False]
+
+    @app.route('/page', methods=['GET', 'POST'])
+    @cache.cached(scopes=('page',), bypass=lambda: bypass[0])
+    def page():
+        return 'page'
+
+    client = app.test_client()
+    etag = client.get('/page').headers['ETag']
+    assert 'ETag' not in client.post('/page').headers
+    bypass[0] = True
+    assert client.get('/page', headers={'If-None-Match': etag}).status_code == 200
@@ -0,0 +1,61 @@
+import pytest
+from sqlalchemy import Column, Integer, String, Text, create_engine, insert
+from sqlalchemy.orm import declarative_base
+
+from search import MemoryBackend, SearchSource, build_tsquery, normalize, tokenize
+
+Base = declarative_base()
+
+
+class Notice(Base):
+    __tablename__ = 'notice'
+    id = Column(Integer, primary_key=True)
+    title = Column(String(100), nullable=False)
+    body = Column(Text)
+
+
+@pytest.mark.parametrize('variant, folded', [
+    ('أحمد', 'احمد'), ('إسلام', 'اسلام'), ('آمال', 'امال'), ('ٱلله', 'الله'),
+    ('مدرسة', 'مدرسه'), ('مستشفى', 'مستشفي'), ('مسؤول', 'مسوول'), ('مسئول', 'مسيول'),
+    # Harakat, tanween, shadda and tatweel are dropped
+    ('مُدَرِّسَةٌ', 'مدرسه'), ('كتــاب', 'كتاب'),
+    # Arabic-Indic and Eastern Arabic-Indic digits
+    ('٢٠٢٦', '2026'), ('۱۲', '12'),
+    ('Budget', 'budget'),
+])
+def test_normalize_folds_spelling_variants(variant, folded):
+    assert normalize(variant) == folded
+
+
+def test_tokenize_strips_the_article_and_its_clitics():
+    assert tokenize('الطريق والمدرسة بالبلدية كالعادة فالأمر للمشروع') == [
+        'طريق', 'مدرسه', 'بلديه', 'عاده', 'امر', 'مشروع']
+    # Too short to be an article followed by a word
+    assert tokenize('ال الم') == ['ال', 'الم']
+    assert tokenize(None) == []
+    assert tokenize(2026) == ['2026']
+
+
+def test_tsquery_matches_the_last_term_as_a_prefix():
+    assert build_tsquery(['صيانه', 'طر']) == 'صيانه & طر:*'
+
+
+def test_memory_index_matches_across_spellings_and_ranks_titles_first():
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(Notice.__table__), [
+            {'id': 1, 'title': 'صيانة الطريق', 'body': 'أعمال في المدرسة'},
+            {'id': 2, 'title': 'افتتاح المدرسة', 'body': 'حفل'},
+            {'id': 3, 'title': 'الميزانية', 'body': 'تقرير'},
+        ])
+    backend = MemoryBackend(lambda: engine)
+    backend.reindex(SearchSource('notice', Notice, 'title', {'title': 'A', 'body': 'B'}))
+
+    total, hits = backend.search(tokenize('مَدرسة'), {'notice'}, 10, 0)
+    assert total == 2
+    assert [hit.id for hit in hits] == [2, 1]
+    assert hits[0].title == 'افتتاح المدرسة'
+    # Search-as-you-type: the last term is a prefix
+    assert [hit.id for hit in backend.search(tokenize('ميز'), {'notice'}, 10, 0)[1]] == [3]
+    assert backend.search(tokenize('مدرسه'), {'project'}, 10, 0) == (0, [])
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+import sync
+from sync import DeltaSync, SyncError, SyncExpired, _advance, _encode_token
+
+T = datetime(2026, 3, 1, 12, 0, 0)
+HORIZON = T + timedelta(seconds=30)
+
+
+def test_advance_walks_pages_up_to_the_horizon():
+    keys = [(T + timedelta(seconds=s), s) for s in range(4)]
+    # A full page ending before the horizon: carry on from its last row
+    assert _advance(None, keys[:3], 2, HORIZON) == (keys[1], True)
+    # The last page: the position moves to the horizon, not to the last row
+    assert _advance(keys[1], keys[2:], 2, HORIZON) == ((HORIZON, 0), False)
+    assert _advance(keys[3], [], 2, HORIZON) == ((HORIZON, 0), False)
+
+
+def test_advance_never_passes_the_horizon():
+    recent = [(HORIZON + timedelta(seconds=s), s) for s in range(-1, 3)]
+    # The page reaches past the horizon: rows after it are sent again next time
+    assert _advance(None, recent, 2, HORIZON) == ((HORIZON, 0), False)
+    # A position already past it (a clock step back) is kept rather than moved back
+    ahead = (HORIZON + timedelta(seconds=9), 4)
+    assert _advance(ahead, [], 2, HORIZON) == (ahead, False)
+
+
+@pytest.fixture
+def synced(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f'sqlite:///{tmp_path}/sync.db', SYNC_COMMIT_LAG=5)
+    db = SQLAlchemy(app)
+
+    class Notice(db.Model):
+        id = db.Column(db.Integer, primary_key=True)
+        title = db.Column(db.String(50), nullable=False)
+        updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    delta = DeltaSync(app, db, {'notices': Notice})
+    with app.app_context():
+        db.create_all()
+        sync.metadata.create_all(db.engine)
+        yield db, Notice, delta
+
+
+def add(db, model, title, age):
+    row = model(title=title, updated_at=datetime.utcnow() - timedelta(seconds=age))
+    db.session.add(row)
+    db.session.commit()
+    return row.id
+
+
+def titles(result):
+    return [row['title'] for row in result['changes']['notices']['updated']]
+
+
+def test_rows_committed_late_inside_the_lag_are_not_missed(synced):
+    db, Notice, delta = synced
+    add(db, Notice, 'old', age=60)
+    add(db, Notice, 'recent', age=2)
+    first = delta.changes()
+    assert titles(first) == ['old', 'recent']
+
+    # Stamped before "recent" but committed after the first poll, as a slow transaction would be
+    add(db, Notice, 'late', age=3)
+    second = delta.changes(first['token'])
+    assert titles(second) == ['late', 'recent']
+    assert second['more'] is False
+
+
+def test_a_backlog_is_sent_in_pages_then_deletions_follow(synced):
+    db, Notice, delta = synced
+    ids = [add(db, Notice, f'n{n}', age=100 - n) for n in range(5)]
+    pages, token = [], None
+    while True:
+        result = delta.changes(token, limit=2)
+        pages.append(titles(result))
+        token = result['token']
+        if not result['more']:
+            break
+    assert pages == [['n0', 'n1'], ['n2', 'n3'], ['n4']]
+
+    db.session.delete(db.session.get(Notice, ids[0]))
+    db.session.commit()
+    # The tombstone is inside the lag, so it is sent on this poll and the next
+    for _ in range(2):
+        result = delta.changes(token)
+        assert result['changes']['notices']['deleted'] == [ids[0]]
+        token = result['token']
+
+
+def test_bad_and_expired_tokens_are_refused(synced):
+    db, Notice, delta = synced
+    with pytest.raises(SyncError):
+        delta.changes('garbage')
+    with pytest.raises(SyncError):
+        delta.changes(resources='notices,unknown')
+    expired = _encode_token({'notices': (None, 0, datetime.utcnow() - timedelta(days=91), 0)})
+    with pytest.raises(SyncExpired):
+        delta.changes(expired)
@@ -0,0 +1,67 @@
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import throttle
+from throttle import FileBucketStore, MemoryBucketStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [time.time()]
+    monkeypatch.setattr(throttle, 'time', SimpleNamespace(time=lambda: now[0]))
+
+    def advance(seconds):
+        now[0] += seconds
+    return advance
+
+
+@pytest.fixture(params=['memory', 'filesystem'])
+def make_store(request, tmp_path):
+    def make(prune_interval=throttle.PRUNE_INTERVAL):
+        if request.param == 'memory':
+            return MemoryBucketStore(prune_interval)
+        return FileBucketStore(str(tmp_path), prune_interval)
+    return make
+
+
+def takes(store, key, n, capacity=3, rate=0.5):
+    return [store.take(key, capacity, rate, 1) for _ in range(n)]
+
+
+def test_bucket_allows_a_burst_then_refills_at_its_rate(clock, make_store):
+    store = make_store()
+    assert takes(store, 'ip:1', 4) == [True, True, True, False]
+    clock(1.0)
+    assert takes(store, 'ip:1', 1) == [False]
+    clock(1.0)  # two seconds at 0.5/s: one token
+    assert takes(store, 'ip:1', 2) == [True, False]
+    # Refilling stops at capacity however long the bucket is left
+    clock(3600)
+    assert takes(store, 'ip:1', 4) == [True, True, True, False]
+    # Other keys have buckets of their own
+    assert takes(store, 'ip:2', 1) == [True]
+
+
+def test_zero_cost_checks_without_charging(clock, make_store):
+    store = make_store()
+    assert [store.take('account:a', 2, 0.1, 0) for _ in range(5)] == [True] * 5
+    assert takes(store, 'account:a', 3, capacity=2, rate=0.1) == [True, True, False]
+    assert store.take('account:a', 2, 0.1, 0) is False
+
+
+def test_refilled_buckets_are_pruned(clock, make_store, tmp_path):
+    store = make_store(prune_interval=4)
+    takes(store, 'ip:idle', 1)
+    takes(store, 'ip:busy', 1)
+    clock(2.5)  # ip:idle is full again; ip:busy is charged below
+    takes(store, 'ip:busy', 2)
+
+    if isinstance(store, MemoryBucketStore):
+        assert set(store._buckets) == {'ip:busy'}
+    else:
+        assert len(os.listdir(tmp_path)) == 1
+    # A pruned bucket reads as full
+    assert takes(store, 'ip:idle', 4) == [True, True, True, False]
@@ -0,0 +1,200 @@
+"""Token-bucket throttling of login attempts, shared by all workers.
+
+Two buckets guard every login: one per client IP (limits credential
+stuffing from one source, charged on every attempt) and one per account
+(limits guessing against one user from many sources, charged on failures
+only). Bucket state lives in ``RATE_LIMIT_BACKEND``:
+
+* ``memory``     -- per worker; only exact with a single worker.
+* ``filesystem`` -- one small file per bucket under ``RATE_LIMIT_DIR``,
+  updated under ``flock`` so all workers on the host agree.
+* ``redis``      -- a Redis-compatible server, updated atomically in Lua.
+
+It defaults to whatever ``RESPONSE_CACHE_BACKEND`` uses. Keys come from
+clients (IPs, submitted emails), so buckets that have refilled to capacity
+are deleted again: by the memory and filesystem stores every
+``PRUNE_INTERVAL`` takes, by Redis through key expiry.
+"""
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+
+# Buckets back at capacity are deleted every this many takes; a missing bucket reads as full
+PRUNE_INTERVAL = 256
+
+
+def _refill(tokens, updated, capacity, rate, now):
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+def _full_at(tokens, capacity, rate, now):
+    return now + (capacity - tokens) / rate if rate > 0 else float('inf')
+
+
+class MemoryBucketStore:
+    def __init__(self, prune_interval=PRUNE_INTERVAL):
+        self.prune_interval = prune_interval
+        self._buckets = {}
+        self._takes = 0
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost):
+        now = time.time()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (capacity, now, now))
+            tokens = _refill(tokens, updated, capacity, rate, now)
+            allowed = tokens >= max(cost, 1)
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now, _full_at(tokens, capacity, rate, now))
+            self._takes += 1
+            if self._takes % self.prune_interval == 0:
+                self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+            return allowed
+
+
+class FileBucketStore:
+    """One file per bucket; its mtime is set to when the bucket will be full again, for :meth:`prune`."""
+
+    def __init__(self, directory, prune_interval=PRUNE_INTERVAL):
+        self.directory = directory
+        self.prune_interval = prune_interval
+        self._takes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _open_locked(self, path):
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            # Pruned while we waited for the lock: start over with the file now at that path
+            if os.fstat(fd).st_nlink:
+                return fd
+            os.close(fd)
+
+    def take(self, key, capacity, rate, cost):
+        path = os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+        fd = self._open_locked(path)
+        try:
+            now = time.time()
+            raw = os.read(fd, 64).decode('ascii').split()
+            tokens, updated = (float(raw[0]), float(raw[1])) if len(raw) == 2 else (capacity, now)
+            tokens = _refill(tokens, updated, capacity, rate, now)
+            allowed = tokens >= max(cost, 1)
+            if allowed:
+                tokens -= cost
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.ftruncate(fd, 0)
+            # repr() round-trips: a rounded-up timestamp would cost part of a token on the next take
+            os.write(fd, f'{tokens!r} {now!r}'.encode('ascii'))
+            full_at = min(_full_at(tokens, capacity, rate, now), now + 365 * 24 * 3600)
+            os.utime(fd, (full_at, full_at))
+        finally:
+            os.close(fd)
+        self._takes += 1
+        if self._takes % self.prune_interval == 0:
+            self.prune()
+        return allowed
+
+    def prune(self):
+        """Deletes the files of buckets that have refilled to capacity."""
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                if not entry.is_file() or entry.stat().st_mtime > now:
+                    continue
+                fd = os.open(entry.path, os.O_RDWR)
+            except FileNotFoundError:
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue  # in use right now, so not idle
+                if os.fstat(fd).st_mtime <= now:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass
+            finally:
+                os.close(fd)
+
+
+class RedisBucketStore:
+    _script = """
+local capacity, rate, cost, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * rate)
+local allowed = tokens >= math.max(cost, 1)
+if allowed then tokens = tokens - cost end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return allowed and 1 or 0
+"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self._take = self.client.register_script(self._script)
+
+    def take(self, key, capacity, rate, cost):
+        return bool(self._take(keys=['rl:' + key], args=[capacity, rate, cost, time.time()]))
+
+
+def bucket_store(app):
+    """Returns the bucket store chosen by ``RATE_LIMIT_BACKEND``, shared by every limiter of ``app``."""
+    store = app.extensions.get('bucket_store')
+    if store is not None:
+        return store
+    env = os.environ
+    backend = app.config.setdefault('RATE_LIMIT_BACKEND', env.get(
+        'RATE_LIMIT_BACKEND', env.get('RESPONSE_CACHE_BACKEND', 'memory')))
+    if backend == 'filesystem':
+        store = FileBucketStore(app.config.setdefault('RATE_LIMIT_DIR', env.get(
+            'RATE_LIMIT_DIR', os.path.join(tempfile.gettempdir(), 'municipality-rate-limit'))))
+    elif backend == 'redis':
+        store = RedisBucketStore(app.config.setdefault('RATE_LIMIT_REDIS_URL', env.get(
+            'RATE_LIMIT_REDIS_URL', env.get('RESPONSE_CACHE_REDIS_URL', 'redis://localhost:6379/0'))))
+    elif backend == 'memory':
+        store = MemoryBucketStore()
+    else:
+        raise RuntimeError(f'Unknown RATE_LIMIT_BACKEND: {backend}')
+    app.extensions['bucket_store'] = store
+    return store
+
+
+class LoginThrottle:
+    """Flask extension deciding whether a login attempt may proceed."""
+
+    def __init__(self, app=None):
+        self.store = MemoryBucketStore()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        env = os.environ
+        # Per IP: a burst of 10 attempts, then one every 6 seconds
+        self.ip_capacity = int(app.config.setdefault('LOGIN_IP_BURST', env.get('LOGIN_IP_BURST', 10)))
+        self.ip_rate = float(app.config.setdefault('LOGIN_IP_PER_MINUTE', env.get('LOGIN_IP_PER_MINUTE', 10))) / 60
+        # Per account: 5 failures, then one more every minute
+        self.account_capacity = int(app.config.setdefault('LOGIN_ACCOUNT_BURST', env.get('LOGIN_ACCOUNT_BURST', 5)))
+        self.account_rate = float(app.config.setdefault(
+            'LOGIN_ACCOUNT_PER_MINUTE', env.get('LOGIN_ACCOUNT_PER_MINUTE', 1))) / 60
+        self.store = bucket_store(app)
+        app.extensions['login_throttle'] = self
+
+    def allow(self, ip, account):
+        """Charges the IP bucket and checks (without charging) the account bucket."""
+        if not self.store.take(f'ip:{ip}', self.ip_capacity, self.ip_rate, 1):
+            return False
+        return self.store.take(f'account:{account.lower()}', self.account_capacity, self.account_rate, 0)
+
+    def record_failure(self, account):
+        self.store.take(f'account:{account.lower()}', self.account_capacity, self.account_rate, 1)